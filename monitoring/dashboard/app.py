@@ -23,7 +23,8 @@ BASE_DIR = Path(__file__).resolve().parent
 REPO_ROOT = BASE_DIR.parents[1]
 TEMPLATES_DIR = BASE_DIR / "templates"
 STATIC_DIR = BASE_DIR / "static"
-ERROR_STATUSES = ("timeout", "compile_error", "internal_error", "rejected")
+# "rejected" is capacity shedding (queue full); "rate_limited" is per-user/guild admission control.
+ERROR_STATUSES = ("timeout", "compile_error", "internal_error", "rejected", "rate_limited")
 WINDOW_HOURS_BY_KEY = {
     "24h": 24,
     "7d": 7 * 24,
@@ -32,6 +33,8 @@ WINDOW_HOURS_BY_KEY = {
 }
 DEFAULT_WINDOW_KEY = "90d"
 RUNTIME_CACHE_TTL_SECONDS = 300
+HOUR_MS = 60 * 60 * 1000
+DAY_MS = 24 * HOUR_MS
 LOGGER = logging.getLogger(__name__)
 
 
@@ -407,6 +410,25 @@ def _window_start_iso(hours: int = 24) -> str:
     return (datetime.now(timezone.utc) - timedelta(hours=hours)).isoformat(timespec="seconds")
 
 
+def _epoch_ms(ts: datetime) -> int:
+    return int(ts.timestamp() * 1000)
+
+
+def _event_time_column(conn: sqlite3.Connection) -> tuple[str, set[str]]:
+    """Pick the column to range-scan and return it with the known event columns.
+
+    Databases written by the current bot expose integer `created_at_ms`; older
+    ones only have ISO-8601 `created_at` text.
+    """
+    table_columns = {
+        row[1]
+        for row in conn.execute("PRAGMA table_info(latex_events);").fetchall()
+    }
+    if "created_at_ms" in table_columns:
+        return "created_at_ms", table_columns
+    return "created_at", table_columns
+
+
 def _parse_window_key(raw_value: str | None) -> str:
     if raw_value is None:
         return DEFAULT_WINDOW_KEY
@@ -443,6 +465,141 @@ def _percentile(values: list[int], percentile: float) -> int | None:
     return int(round(interpolated))
 
 
+def _has_rollups(conn: sqlite3.Connection) -> bool:
+    row = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'latex_event_rollups_daily';"
+    ).fetchone()
+    return row is not None
+
+
+def _apply_status_counts(response: dict, rows: list[tuple[str, str, int]]) -> None:
+    """Fill the totals and per-source counts from `(source, status, total)` rows."""
+    by_source: dict[str, dict[str, int]] = {}
+    for source, status, total in rows:
+        total = int(total)
+        bucket = by_source.setdefault(source, {"attempts": 0, "errors": 0, "successes": 0, "queued": 0})
+        if status != "queued":
+            bucket["attempts"] += total
+            response["attempts"] += total
+        if status == "success":
+            bucket["successes"] += total
+            response["successes"] += total
+        elif status in ERROR_STATUSES:
+            bucket["errors"] += total
+            response["errors"] += total
+        elif status == "queued":
+            bucket["queued"] += total
+            response["queued"] += total
+    response["by_source"] = by_source
+
+
+def _rollup_window_sql(prefix: str, columns: str) -> str:
+    # Hourly buckets up to the first midnight in the window, daily buckets from there on,
+    # so even 90 days is a few thousand rows and the window edge is exact to the hour.
+    return f"""
+        SELECT {columns} FROM {prefix}_hourly WHERE bucket_ms >= ? AND bucket_ms < ?
+        UNION ALL
+        SELECT {columns} FROM {prefix}_daily WHERE bucket_ms >= ?
+    """
+
+
+def _histogram_percentile(buckets: list[tuple[int, int | None, int]], percentile: float) -> int | None:
+    """Estimate a percentile from `(lower_ms, upper_ms, count)` buckets sorted by bound."""
+    total = sum(count for _lower, _upper, count in buckets)
+    if total == 0:
+        return None
+    rank = (total - 1) * (percentile / 100.0)
+    seen = 0
+    for lower, upper, count in buckets:
+        if rank < seen + count:
+            if upper is None:
+                return lower
+            # Spread the bucket's samples evenly across its range.
+            return int(round(lower + (upper - lower) * (rank - seen + 0.5) / count))
+        seen += count
+    return buckets[-1][0]
+
+
+def _fill_summary_from_rollups(conn: sqlite3.Connection, response: dict, window_start_ms: int) -> None:
+    hour_start = window_start_ms // HOUR_MS * HOUR_MS
+    first_day = -(-hour_start // DAY_MS) * DAY_MS
+    params = (hour_start, first_day, first_day)
+    rows = conn.execute(
+        f"""
+        SELECT src.name, st.name, SUM(r.events), SUM(r.coalesced)
+        FROM ({_rollup_window_sql("latex_event_rollups", "source_id, status_id, events, coalesced")}) AS r
+        JOIN latex_event_sources AS src ON src.id = r.source_id
+        JOIN latex_event_statuses AS st ON st.id = r.status_id
+        GROUP BY src.name, st.name;
+        """,
+        params,
+    ).fetchall()
+    _apply_status_counts(response, [(source, status, total) for source, status, total, _ in rows])
+    response["coalesced"] = sum(int(coalesced) for *_counts, coalesced in rows)
+
+    histogram = conn.execute(
+        f"""
+        SELECT lower_ms, upper_ms, SUM(events)
+        FROM ({_rollup_window_sql("latex_event_latency", "lower_ms, upper_ms, events")})
+        GROUP BY lower_ms, upper_ms
+        ORDER BY lower_ms ASC;
+        """,
+        params,
+    ).fetchall()
+    response["latency_ms"] = {
+        "p50": _histogram_percentile(histogram, 50),
+        "p95": _histogram_percentile(histogram, 95),
+        "p99": _histogram_percentile(histogram, 99),
+        "samples": sum(int(count) for _lower, _upper, count in histogram),
+    }
+
+
+def _fill_summary_from_events(conn: sqlite3.Connection, response: dict, threshold: str) -> None:
+    """Summarize raw events, for databases written before the rollup tables existed."""
+    time_column, table_columns = _event_time_column(conn)
+    window_start = (
+        _epoch_ms(datetime.fromisoformat(threshold))
+        if time_column == "created_at_ms"
+        else threshold
+    )
+    rows = conn.execute(
+        f"""
+        SELECT source, status, COUNT(*) AS total
+        FROM latex_events
+        WHERE {time_column} >= ?
+        GROUP BY source, status;
+        """,
+        (window_start,),
+    ).fetchall()
+    _apply_status_counts(response, rows)
+
+    if "duration_ms" in table_columns:
+        duration_rows = conn.execute(
+            f"""
+            SELECT duration_ms
+            FROM latex_events
+            WHERE {time_column} >= ?
+              AND status != 'queued'
+              AND duration_ms IS NOT NULL
+              AND duration_ms >= 0;
+            """,
+            (window_start,),
+        ).fetchall()
+        durations = [int(row[0]) for row in duration_rows if row[0] is not None]
+        response["latency_ms"] = {
+            "p50": _percentile(durations, 50),
+            "p95": _percentile(durations, 95),
+            "p99": _percentile(durations, 99),
+            "samples": len(durations),
+        }
+    if "coalesced" in table_columns:
+        response["coalesced"] = _fetch_one_int(
+            conn,
+            f"SELECT COUNT(*) FROM latex_events WHERE {time_column} >= ? AND coalesced = 1;",
+            (window_start,),
+        )
+
+
 def _query_summary(db_path: str, window_key: str) -> dict:
     window_hours = WINDOW_HOURS_BY_KEY[window_key]
     threshold = _window_start_iso(window_hours)
@@ -456,6 +613,7 @@ def _query_summary(db_path: str, window_key: str) -> dict:
         "successes": 0,
         "errors": 0,
         "queued": 0,
+        "coalesced": 0,
         "error_rate_percent": 0.0,
         "latency_ms": {
             "p50": None,
@@ -472,75 +630,10 @@ def _query_summary(db_path: str, window_key: str) -> dict:
 
     try:
         with sqlite3.connect(db_path) as conn:
-            response["attempts"] = _fetch_one_int(
-                conn,
-                "SELECT COUNT(*) FROM latex_events WHERE created_at >= ? AND status != 'queued';",
-                (threshold,),
-            )
-            response["queued"] = _fetch_one_int(
-                conn,
-                "SELECT COUNT(*) FROM latex_events WHERE created_at >= ? AND status = 'queued';",
-                (threshold,),
-            )
-            response["successes"] = _fetch_one_int(
-                conn,
-                "SELECT COUNT(*) FROM latex_events WHERE created_at >= ? AND status = ?;",
-                (threshold, "success"),
-            )
-            response["errors"] = _fetch_one_int(
-                conn,
-                """
-                SELECT COUNT(*) FROM latex_events
-                WHERE created_at >= ? AND status IN (?, ?, ?, ?);
-                """,
-                (threshold, *ERROR_STATUSES),
-            )
-
-            table_columns = {
-                row[1]
-                for row in conn.execute("PRAGMA table_info(latex_events);").fetchall()
-            }
-            if "duration_ms" in table_columns:
-                duration_rows = conn.execute(
-                    """
-                    SELECT duration_ms
-                    FROM latex_events
-                    WHERE created_at >= ?
-                      AND status != 'queued'
-                      AND duration_ms IS NOT NULL
-                      AND duration_ms >= 0;
-                    """,
-                    (threshold,),
-                ).fetchall()
-                durations = [int(row[0]) for row in duration_rows if row[0] is not None]
-                response["latency_ms"] = {
-                    "p50": _percentile(durations, 50),
-                    "p95": _percentile(durations, 95),
-                    "p99": _percentile(durations, 99),
-                    "samples": len(durations),
-                }
-
-            by_source: dict[str, dict[str, int]] = {}
-            rows = conn.execute(
-                """
-                SELECT source, status, COUNT(*) AS total
-                FROM latex_events
-                WHERE created_at >= ?
-                GROUP BY source, status;
-                """,
-                (threshold,),
-            ).fetchall()
-            for source, status, total in rows:
-                bucket = by_source.setdefault(source, {"attempts": 0, "errors": 0, "successes": 0, "queued": 0})
-                if status != "queued":
-                    bucket["attempts"] += int(total)
-                if status == "success":
-                    bucket["successes"] += int(total)
-                elif status in ERROR_STATUSES:
-                    bucket["errors"] += int(total)
-                elif status == "queued":
-                    bucket["queued"] += int(total)
-            response["by_source"] = by_source
+            if _has_rollups(conn):
+                _fill_summary_from_rollups(conn, response, _epoch_ms(datetime.fromisoformat(threshold)))
+            else:
+                _fill_summary_from_events(conn, response, threshold)
     except sqlite3.Error:
         LOGGER.exception("Failed to query summary from db=%s", db_path)
         return response
@@ -613,6 +706,7 @@ def _query_timeseries(db_path: str, window_key: str) -> dict:
             "compile_error": [0] * bucket_count,
             "internal_error": [0] * bucket_count,
             "rejected": [0] * bucket_count,
+            "rate_limited": [0] * bucket_count,
         },
         "by_source": {},
         "generated_at": now_utc.isoformat(timespec="seconds"),
@@ -621,54 +715,87 @@ def _query_timeseries(db_path: str, window_key: str) -> dict:
     if not Path(db_path).exists():
         return response
 
-    start_iso = labels[0]
+    start_ms = _epoch_ms(start_bucket)
+    step_ms = int(step.total_seconds() * 1000)
+    end_ms = _epoch_ms(end_bucket_start + step)
 
     try:
         with sqlite3.connect(db_path) as conn:
-            conn.row_factory = sqlite3.Row
-            rows = conn.execute(
-                """
-                SELECT created_at, source, status
-                FROM latex_events
-                WHERE created_at >= ?
-                ORDER BY created_at ASC;
-                """,
-                (start_iso,),
-            ).fetchall()
+            if _has_rollups(conn):
+                counts = conn.execute(
+                    f"""
+                    SELECT (r.bucket_ms - ?) / ?, src.name, st.name, r.events
+                    FROM latex_event_rollups_{"hourly" if bucket == "hour" else "daily"} AS r
+                    JOIN latex_event_sources AS src ON src.id = r.source_id
+                    JOIN latex_event_statuses AS st ON st.id = r.status_id
+                    WHERE r.bucket_ms >= ? AND r.bucket_ms < ?;
+                    """,
+                    (start_ms, step_ms, start_ms, end_ms),
+                ).fetchall()
+            elif _event_time_column(conn)[0] == "created_at_ms":
+                counts = conn.execute(
+                    """
+                    SELECT (created_at_ms - ?) / ? AS bucket_index, source, status, COUNT(*)
+                    FROM latex_events
+                    WHERE created_at_ms >= ? AND created_at_ms < ?
+                    GROUP BY bucket_index, source, status;
+                    """,
+                    (start_ms, step_ms, start_ms, end_ms),
+                ).fetchall()
+            else:
+                counts = _bucket_text_timestamps(conn, start_bucket, bucket, bucket_count)
     except sqlite3.Error:
         LOGGER.exception("Failed to query timeseries from db=%s", db_path)
         return response
 
-    for row in rows:
-        parsed = _parse_event_timestamp(row["created_at"])
-        if parsed is None:
-            continue
-        bucket_start = _floor_to_bucket(parsed, bucket)
-        if bucket_start < start_bucket or bucket_start > end_bucket_start:
-            continue
-        index = int((bucket_start - start_bucket) / step)
+    for index, source, status, total in counts:
         if index < 0 or index >= bucket_count:
             continue
 
-        status = row["status"]
         if status != "queued":
-            response["totals"]["attempts"][index] += 1
+            response["totals"]["attempts"][index] += total
 
         if status == "success":
-            response["totals"]["successes"][index] += 1
+            response["totals"]["successes"][index] += total
         elif status in ERROR_STATUSES:
-            response["totals"]["errors"][index] += 1
-            response["errors_by_status"][status][index] += 1
+            response["totals"]["errors"][index] += total
+            response["errors_by_status"][status][index] += total
         elif status == "queued":
-            response["totals"]["queued"][index] += 1
+            response["totals"]["queued"][index] += total
 
-        source = row["source"]
         source_series = response["by_source"].setdefault(source, [0] * bucket_count)
-        source_series[index] += 1
+        source_series[index] += total
 
     return response
 
 
+def _bucket_text_timestamps(
+    conn: sqlite3.Connection,
+    start_bucket: datetime,
+    bucket: str,
+    bucket_count: int,
+) -> list[tuple[int, str, str, int]]:
+    """Bucket rows of a database that predates `created_at_ms` by parsing each timestamp."""
+    step = _bucket_step(bucket)
+    counts: dict[tuple[int, str, str], int] = {}
+    rows = conn.execute(
+        """
+        SELECT created_at, source, status
+        FROM latex_events
+        WHERE created_at >= ?;
+        """,
+        (start_bucket.isoformat(timespec="seconds"),),
+    ).fetchall()
+    for created_at, source, status in rows:
+        parsed = _parse_event_timestamp(created_at)
+        if parsed is None:
+            continue
+        index = int((_floor_to_bucket(parsed, bucket) - start_bucket) / step)
+        if 0 <= index < bucket_count:
+            counts[(index, source, status)] = counts.get((index, source, status), 0) + 1
+    return [(index, source, status, total) for (index, source, status), total in counts.items()]
+
+
 def _query_events(db_path: str, limit: int) -> list[dict]:
     if not Path(db_path).exists():
         return []
@@ -0,0 +1,131 @@
+"""Per-user and per-guild limits applied before a request may join the compile queue."""
+
+import time
+from collections.abc import Callable, Hashable
+
+from env_settings import read_non_negative_float_env, read_non_negative_int_env
+
+_DEFAULT_USER_RATE_PER_MINUTE = 12.0
+_DEFAULT_USER_BURST = 5
+_DEFAULT_USER_MAX_IN_FLIGHT = 2
+_DEFAULT_GUILD_RATE_PER_MINUTE = 60.0
+_DEFAULT_GUILD_BURST = 20
+_DEFAULT_GUILD_MAX_IN_FLIGHT = 10
+# Idle, fully refilled buckets are dropped once this many keys are tracked.
+_MAX_TRACKED_KEYS = 4096
+
+
+class AdmissionLimit:
+    """Token bucket plus in-flight cap for one kind of key (user or guild).
+
+    `rate_per_minute` of 0 disables the bucket and `max_in_flight` of 0
+    disables the cap.
+    """
+
+    def __init__(
+            self,
+            rate_per_minute: float,
+            burst: int,
+            max_in_flight: int,
+            clock: Callable[[], float] = time.monotonic,
+    ):
+        self.rate_per_second = max(0.0, rate_per_minute) / 60.0
+        self.burst = max(1, burst)
+        self.max_in_flight = max(0, max_in_flight)
+        self._clock = clock
+        self._buckets: dict[Hashable, tuple[float, float]] = {}
+        self._in_flight: dict[Hashable, int] = {}
+
+    def _tokens(self, key: Hashable, now: float) -> float:
+        tokens, updated = self._buckets.get(key, (float(self.burst), now))
+        return min(float(self.burst), tokens + (now - updated) * self.rate_per_second)
+
+    def check(self, key: Hashable) -> str | None:
+        """Return "in_flight" or "rate" when `key` must be refused, else None."""
+        if self.max_in_flight and self._in_flight.get(key, 0) >= self.max_in_flight:
+            return "in_flight"
+        if self.rate_per_second and self._tokens(key, self._clock()) < 1:
+            return "rate"
+        return None
+
+    def acquire(self, key: Hashable) -> None:
+        now = self._clock()
+        if self.rate_per_second:
+            self._buckets[key] = (self._tokens(key, now) - 1, now)
+        self._in_flight[key] = self._in_flight.get(key, 0) + 1
+        if len(self._buckets) > _MAX_TRACKED_KEYS:
+            self._prune(now)
+
+    def release(self, key: Hashable) -> None:
+        remaining = self._in_flight.get(key, 0) - 1
+        if remaining > 0:
+            self._in_flight[key] = remaining
+        else:
+            self._in_flight.pop(key, None)
+
+    def _prune(self, now: float) -> None:
+        idle = [
+            key
+            for key in self._buckets
+            if key not in self._in_flight and self._tokens(key, now) >= self.burst
+        ]
+        for key in idle:
+            del self._buckets[key]
+
+
+class AdmissionController:
+    """Admit or refuse compile requests by user and guild before they queue.
+
+    A request is admitted only if both its user and its guild (when it has
+    one) pass; tokens are taken from neither otherwise. Every admitted
+    request must be released once its compile finishes or is abandoned.
+    """
+
+    def __init__(self, user_limit: AdmissionLimit, guild_limit: AdmissionLimit):
+        self.user_limit = user_limit
+        self.guild_limit = guild_limit
+
+    @classmethod
+    def from_env(cls) -> "AdmissionController":
+        return cls(
+            user_limit=AdmissionLimit(
+                rate_per_minute=read_non_negative_float_env(
+                    "LATEX_USER_RATE_PER_MINUTE",
+                    _DEFAULT_USER_RATE_PER_MINUTE,
+                ),
+                burst=read_non_negative_int_env("LATEX_USER_BURST", _DEFAULT_USER_BURST),
+                max_in_flight=read_non_negative_int_env(
+                    "LATEX_USER_MAX_IN_FLIGHT",
+                    _DEFAULT_USER_MAX_IN_FLIGHT,
+                ),
+            ),
+            guild_limit=AdmissionLimit(
+                rate_per_minute=read_non_negative_float_env(
+                    "LATEX_GUILD_RATE_PER_MINUTE",
+                    _DEFAULT_GUILD_RATE_PER_MINUTE,
+                ),
+                burst=read_non_negative_int_env("LATEX_GUILD_BURST", _DEFAULT_GUILD_BURST),
+                max_in_flight=read_non_negative_int_env(
+                    "LATEX_GUILD_MAX_IN_FLIGHT",
+                    _DEFAULT_GUILD_MAX_IN_FLIGHT,
+                ),
+            ),
+        )
+
+    def try_admit(self, user_id: Hashable | None, guild_id: Hashable | None) -> str | None:
+        """Admit the request, or return why it was refused (e.g. "user_rate")."""
+        checks = [("user", self.user_limit, user_id), ("guild", self.guild_limit, guild_id)]
+        checks = [(scope, limit, key) for scope, limit, key in checks if key is not None]
+        for scope, limit, key in checks:
+            reason = limit.check(key)
+            if reason is not None:
+                return f"{scope}_{reason}"
+        for _scope, limit, key in checks:
+            limit.acquire(key)
+        return None
+
+    def release(self, user_id: Hashable | None, guild_id: Hashable | None) -> None:
+        if user_id is not None:
+            self.user_limit.release(user_id)
+        if guild_id is not None:
+            self.guild_limit.release(guild_id)
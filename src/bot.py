@@ -1,6 +1,9 @@
 import asyncio
+import functools
+import io
 import logging
 import os
+from collections import deque
 from pathlib import Path
 from concurrent.futures import ThreadPoolExecutor
 
@@ -13,6 +16,8 @@ import uuid
 from aiohttp import web
 from discord import app_commands, Color
 
+from admission_control import AdmissionController
+
 
 def _read_int_env(
     name: str,
@@ -37,67 +42,383 @@ def _read_int_env(
 
 LATEX_COMPILE_CONCURRENCY = _read_int_env("LATEX_COMPILE_CONCURRENCY", 3)
 LATEX_MAX_QUEUE = _read_int_env("LATEX_MAX_QUEUE", 20)
+# Total time a render may take, counted from the interaction defer (queue wait included).
+LATEX_RENDER_DEADLINE_SECONDS = _read_int_env("LATEX_RENDER_DEADLINE_SECONDS", 15)
+# Discord allows at most 10 attachments per message.
+LATEX_BATCH_MAX_ITEMS = min(_read_int_env("LATEX_BATCH_MAX_ITEMS", 10), 10)
+# Render through asyncio subprocesses instead of executor threads.
+LATEX_ASYNC_RENDER = os.getenv("LATEX_ASYNC_RENDER", "").strip().lower() in {"1", "true", "yes", "on"}
+
+# Compile lanes, cheapest first: dvipng inline, pdflatex inline, structured/TikZ.
+COMPILE_LANES = ("fast", "inline", "structured")
+_DEFAULT_LANE_WEIGHTS = {"fast": 4, "inline": 2, "structured": 1}
+
+
+def _default_lane_slots(total: int) -> dict[str, int]:
+    base, extra = divmod(total, len(COMPILE_LANES))
+    return {lane: base + (1 if index < extra else 0) for index, lane in enumerate(COMPILE_LANES)}
+
+
+def _read_lane_slots(total: int) -> dict[str, int]:
+    defaults = _default_lane_slots(total)
+    slots = {
+        lane: _read_int_env(f"LATEX_LANE_{lane.upper()}_CONCURRENCY", defaults[lane], minimum=0)
+        for lane in COMPILE_LANES
+    }
+    return slots if sum(slots.values()) > 0 else defaults
+
+
+# Lanes split LATEX_COMPILE_CONCURRENCY unless their own concurrency is set.
+LATEX_LANE_SLOTS = _read_lane_slots(LATEX_COMPILE_CONCURRENCY)
+LATEX_LANE_WEIGHTS = {
+    lane: _read_int_env(f"LATEX_LANE_{lane.upper()}_WEIGHT", weight)
+    for lane, weight in _DEFAULT_LANE_WEIGHTS.items()
+}
+
+
+_RATE_LIMIT_MESSAGES = {
+    "user_in_flight": "You already have renders in progress. Wait for them to finish before sending more.",
+    "user_rate": "You are sending renders too quickly. Please wait a moment and try again.",
+    "guild_in_flight": "This server has too many renders in progress. Please try again in a moment.",
+    "guild_rate": "This server is sending renders too quickly. Please try again in a moment.",
+}
+
+
+class CompileLane:
+    def __init__(self, name: str, slots: int, weight: int = 1):
+        self.name = name
+        self.slots = slots
+        self.weight = max(1, weight)
+        # Slots of this lane in use, whichever lane borrowed them.
+        self.busy = 0
+        self.waiters: deque[asyncio.Future] = deque()
+        # Stride-scheduling position; the lowest waiting lane gets the next borrowed slot.
+        self.pass_value = 0.0
+
+    def has_free_slot(self) -> bool:
+        return self.busy < self.slots
+
 
 class CompileQueue:
-    def __init__(self, max_concurrent: int = 3, max_queued: int = 20):
-        self._max_concurrent = max_concurrent
-        self._semaphore = asyncio.Semaphore(max_concurrent)
+    """Admission control for TeX compiles, split into cost lanes.
+
+    Every lane owns `lane_slots[lane]` compile slots, so slow structured jobs
+    cannot hold up cheap inline renders. A lane with no waiters lends its free
+    slots to the others; when several lanes wait, `lane_weights` decide who
+    borrows next. `max_queued` caps the waiters across all lanes, and the
+    optional `admission` controller limits each user and guild before that.
+    """
+
+    def __init__(
+        self,
+        max_concurrent: int = 3,
+        max_queued: int = 20,
+        lane_slots: dict[str, int] | None = None,
+        lane_weights: dict[str, int] | None = None,
+        admission: AdmissionController | None = None,
+    ):
+        lane_slots = lane_slots or _default_lane_slots(max_concurrent)
+        lane_weights = lane_weights or _DEFAULT_LANE_WEIGHTS
+        self._lanes = {
+            lane: CompileLane(lane, slots, lane_weights.get(lane, 1))
+            for lane, slots in lane_slots.items()
+        }
+        self._max_concurrent = sum(lane_slots.values())
         self._waiting = 0
         self._max_queued = max_queued
+        self._steal_clock = 0.0
+        self._admission = admission
+        self._in_flight: dict[str, asyncio.Future] = {}
+
+    def has_spare_capacity(self) -> bool:
+        """True when nobody is queued and another compile could start right now.
+
+        Render threads call this without the event loop; a stale answer only
+        starts or skips one speculative race.
+        """
+        return self._waiting == 0 and any(lane.has_free_slot() for lane in self._lanes.values())
+
+    def _take_free_slot(self, lane: CompileLane) -> CompileLane | None:
+        if lane.has_free_slot():
+            return lane
+        return next(
+            (
+                owner
+                for owner in self._lanes.values()
+                if owner.has_free_slot() and not owner.waiters
+            ),
+            None,
+        )
+
+    def _next_borrower(self) -> CompileLane | None:
+        waiting = [lane for lane in self._lanes.values() if lane.waiters]
+        return min(waiting, key=lambda lane: lane.pass_value, default=None)
+
+    def _dispatch(self) -> None:
+        """Hand free slots to waiters: owners first, then borrowers by weight."""
+        progressed = True
+        while progressed:
+            progressed = False
+            for owner in self._lanes.values():
+                if not owner.has_free_slot():
+                    continue
+                lane = owner if owner.waiters else self._next_borrower()
+                if lane is None:
+                    return
+                waiter = lane.waiters.popleft()
+                progressed = True
+                if waiter.done():
+                    continue
+                if lane is not owner:
+                    lane.pass_value += 1 / lane.weight
+                    self._steal_clock = lane.pass_value
+                owner.busy += 1
+                waiter.set_result(owner)
+
+    def _release(self, owner: CompileLane, release_admission=None) -> None:
+        owner.busy -= 1
+        if release_admission is not None:
+            release_admission()
+        self._dispatch()
+
+    async def _acquire(self, loop, lane: CompileLane) -> CompileLane:
+        if not lane.waiters:
+            owner = self._take_free_slot(lane)
+            if owner is not None:
+                owner.busy += 1
+                return owner
+            # A lane that sat idle does not bank credit against the busy ones.
+            lane.pass_value = max(lane.pass_value, self._steal_clock)
+        waiter = loop.create_future()
+        lane.waiters.append(waiter)
+        self._dispatch()
+        try:
+            return await waiter
+        except asyncio.CancelledError:
+            if waiter.done() and not waiter.cancelled():
+                self._release(waiter.result())
+            elif waiter in lane.waiters:
+                lane.waiters.remove(waiter)
+            raise
+
+    async def _admit(self, user_id, guild_id, source, dpi, notify_coro) -> bool:
+        """Take the caller's admission tokens, or tell them to slow down and return False."""
+        refusal = self._admission.try_admit(user_id, guild_id) if self._admission else None
+        if refusal is None:
+            return True
+        increment_counter(f"compile_queue.rate_limited.{refusal}")
+        _safe_record_latex_event(
+            source=source, status="rate_limited", dpi=dpi, user_id=user_id, error_message=refusal
+        )
+        if notify_coro:
+            embed = discord.Embed(
+                title="Slow Down",
+                description=_RATE_LIMIT_MESSAGES[refusal],
+                color=Color.red(),
+            )
+            await notify_coro(embed=embed, ephemeral=True)
+        return False
 
-    async def execute(self, loop, func, *args, notify_coro=None, timeout=15.0, user_id=None, source="slash", dpi=275):
-        if self._waiting >= self._max_queued:
-            _safe_record_latex_event(source=source, status="rejected", dpi=dpi, user_id=user_id, error_message="Queue full")
-            if notify_coro:
-                embed = discord.Embed(
-                    title="Server Busy",
-                    description="The compile queue is currently full. Please try again in a moment.",
-                    color=Color.red(),
-                )
-                await notify_coro(embed=embed, ephemeral=True)
+    async def execute(
+        self,
+        loop,
+        func,
+        *args,
+        notify_coro=None,
+        timeout=15.0,
+        user_id=None,
+        guild_id=None,
+        source="slash",
+        dpi=275,
+        cancel_token=None,
+        deadline=None,
+        lane="structured",
+    ):
+        if not await self._admit(user_id, guild_id, source, dpi, notify_coro):
             return "REJECTED", None
 
-        self._waiting += 1
-        position = self._waiting
-        queued_msg = None
-        
-        if self._semaphore.locked():
-            _safe_record_latex_event(source=source, status="queued", dpi=dpi, user_id=user_id)
-            if notify_coro:
-                estimated_wait_seconds = position * timeout / max(self._max_concurrent, 1)
-                embed = discord.Embed(
-                    title="Queued",
-                    description=f"You are #{position} in the compile queue. Estimated wait: ~{estimated_wait_seconds:.0f}s.",
-                    color=Color.orange(),
-                )
+        release_admission = None
+        if self._admission is not None:
+            release_admission = functools.partial(self._admission.release, user_id, guild_id)
+        return await self._execute_admitted(
+            loop, func, *args,
+            notify_coro=notify_coro, timeout=timeout, user_id=user_id, source=source, dpi=dpi,
+            cancel_token=cancel_token, deadline=deadline, lane=lane, release_admission=release_admission,
+        )
+
+    async def _execute_admitted(
+        self,
+        loop,
+        func,
+        *args,
+        notify_coro=None,
+        timeout=15.0,
+        user_id=None,
+        source="slash",
+        dpi=275,
+        cancel_token=None,
+        deadline=None,
+        lane="structured",
+        release_admission=None,
+    ):
+        orphaned = False
+        try:
+            if self._waiting >= self._max_queued:
+                _safe_record_latex_event(source=source, status="rejected", dpi=dpi, user_id=user_id, error_message="Queue full")
+                if notify_coro:
+                    embed = discord.Embed(
+                        title="Server Busy",
+                        description="The compile queue is currently full. Please try again in a moment.",
+                        color=Color.red(),
+                    )
+                    await notify_coro(embed=embed, ephemeral=True)
+                return "REJECTED", None
+
+            compile_lane = self._lanes[lane]
+            self._waiting += 1
+            position = len(compile_lane.waiters) + 1
+            queued_msg = None
+            queued_at = time.monotonic()
+
+            if compile_lane.waiters or self._take_free_slot(compile_lane) is None:
+                _safe_record_latex_event(source=source, status="queued", dpi=dpi, user_id=user_id)
+                if notify_coro:
+                    estimated_wait_seconds = position * timeout / max(compile_lane.slots, 1)
+                    embed = discord.Embed(
+                        title="Queued",
+                        description=f"You are #{position} in the compile queue. Estimated wait: ~{estimated_wait_seconds:.0f}s.",
+                        color=Color.orange(),
+                    )
+                    try:
+                        queued_msg = await notify_coro(embed=embed)
+                    except Exception:
+                        pass
+
+            try:
+                owner = await self._acquire(loop, compile_lane)
+            finally:
+                self._waiting -= 1
+            increment_counter(f"compile_queue.lane.{lane}.admitted")
+            increment_counter(
+                f"compile_queue.lane.{lane}.wait_ms",
+                int((time.monotonic() - queued_at) * 1000),
+            )
+            if owner is not compile_lane:
+                increment_counter(f"compile_queue.lane.{lane}.borrowed")
+
+            if queued_msg:
                 try:
-                    queued_msg = await notify_coro(embed=embed)
+                    await queued_msg.delete()
                 except Exception:
                     pass
 
-        await self._semaphore.acquire()
-        self._waiting -= 1
-
-        if queued_msg:
+            thread_future = None
+            release_slot = True
             try:
-                await queued_msg.delete()
-            except Exception:
-                pass
-
+                compile_started = time.monotonic()
+                if deadline is not None:
+                    # Time spent queued comes out of the same budget.
+                    timeout = min(timeout, deadline - compile_started)
+                    if timeout <= 0:
+                        raise asyncio.TimeoutError
+                # Coroutine renders are cancelled by wait_for, which kills their subprocesses.
+                if asyncio.iscoroutinefunction(func):
+                    work = func(*args)
+                else:
+                    thread_future = executor.submit(func, *args)
+                    work = asyncio.wrap_future(thread_future, loop=loop)
+                result = await asyncio.wait_for(work, timeout=timeout)
+                duration_ms = int((time.monotonic() - compile_started) * 1000)
+                return result, duration_ms
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                if cancel_token is not None:
+                    cancel_token.cancel()
+                if thread_future is not None and not thread_future.done():
+                    # The thread cannot be interrupted; keep its slot until it exits so
+                    # abandoned work never pushes TeX processes past the concurrency cap.
+                    increment_counter("compile_queue.orphaned_work")
+                    thread_future.add_done_callback(
+                        lambda _future: loop.call_soon_threadsafe(
+                            self._release, owner, release_admission
+                        )
+                    )
+                    release_slot = False
+                    # The user's in-flight count also stays taken until the thread exits.
+                    orphaned = True
+                raise
+            finally:
+                if release_slot:
+                    self._release(owner)
+        finally:
+            if release_admission is not None and not orphaned:
+                release_admission()
+
+    async def execute_shared(self, key, loop, func, *args, **kwargs):
+        """Run `execute`, letting identical requests share one compile.
+
+        While a request with the same `key` is in flight, later ones wait for
+        its result instead of taking a queue slot. Returns
+        `(result, duration_ms, coalesced)`; a follower's duration is its own wait.
+        """
+        leader = self._in_flight.get(key) if key is not None else None
+        if leader is not None:
+            user_id, guild_id = kwargs.get("user_id"), kwargs.get("guild_id")
+            # Followers are rate limited like anyone else and hold an in-flight slot while they wait.
+            if not await self._admit(
+                user_id, guild_id, kwargs.get("source", "slash"), kwargs.get("dpi", 275),
+                kwargs.get("notify_coro"),
+            ):
+                return "REJECTED", None, False
+            try:
+                started = time.monotonic()
+                timeout = kwargs.get("timeout", 15.0)
+                deadline = kwargs.get("deadline")
+                if deadline is not None:
+                    timeout = min(timeout, deadline - started)
+                # asyncio.wait never cancels the leader, whatever happens to this request.
+                done, _pending = await asyncio.wait({leader}, timeout=max(timeout, 0))
+                if not done:
+                    raise asyncio.TimeoutError
+                if not leader.cancelled():
+                    result, _duration_ms = leader.result()
+                    if result != "REJECTED":
+                        increment_counter("compile_queue.coalesced")
+                        return result, int((time.monotonic() - started) * 1000), True
+            finally:
+                if self._admission is not None:
+                    self._admission.release(user_id, guild_id)
+            # The leader never compiled; queue on our own so the user is notified.
+            leader = None
+
+        if key is None or key in self._in_flight:
+            result, duration_ms = await self.execute(loop, func, *args, **kwargs)
+            return result, duration_ms, False
+
+        leader = loop.create_future()
+        self._in_flight[key] = leader
         try:
-            compile_started = time.monotonic()
-            result = await asyncio.wait_for(
-                loop.run_in_executor(executor, func, *args),
-                timeout=timeout,
-            )
-            duration_ms = int((time.monotonic() - compile_started) * 1000)
-            return result, duration_ms
+            outcome = await self.execute(loop, func, *args, **kwargs)
+        except asyncio.CancelledError:
+            leader.cancel()
+            raise
+        except BaseException as exc:
+            leader.set_exception(exc)
+            # Followers re-raise it; a leader without followers must not log it as lost.
+            leader.exception()
+            raise
+        else:
+            leader.set_result(outcome)
+            return outcome[0], outcome[1], False
         finally:
-            self._semaphore.release()
+            if self._in_flight.get(key) is leader:
+                del self._in_flight[key]
 
 compile_queue = CompileQueue(
     max_concurrent=LATEX_COMPILE_CONCURRENCY,
     max_queued=LATEX_MAX_QUEUE,
+    lane_slots=LATEX_LANE_SLOTS,
+    lane_weights=LATEX_LANE_WEIGHTS,
+    admission=AdmissionController.from_env(),
 )
 
 
@@ -124,13 +445,17 @@ def _format_compile_error_description(message: str) -> str:
 from discord.ext import commands, tasks
 from latex_module import *
 from logging_config import configure_logging
-from metrics_store import init_metrics_db, record_latex_event
+from metrics_store import MetricsWriter, init_metrics_db, run_metrics_maintenance
+from runtime_counters import increment_counter, snapshot_counters
 from stats import get_manual_users_count, update_stats
 
 from dotenv import load_dotenv
 
 from AIAPI import create_chat_session, reset_history
 
+# Speculative dvipng/pdflatex races only use slots the queue would leave idle.
+set_spare_capacity_probe(compile_queue.has_spare_capacity)
+
 load_dotenv()
 configure_logging()
 logger = logging.getLogger(__name__)
@@ -146,6 +471,7 @@ BOT_HEALTH_PORT = _read_int_env(
     maximum=65535,
 )
 _warned_missing_heartbeat_url = False
+metrics_writer = MetricsWriter.from_env(METRICS_DB_PATH)
 
 
 def _safe_record_latex_event(
@@ -155,16 +481,17 @@ def _safe_record_latex_event(
     user_id: int | None,
     error_message: str | None = None,
     duration_ms: int | None = None,
+    coalesced: bool = False,
 ) -> None:
     try:
-        record_latex_event(
-            db_path=METRICS_DB_PATH,
+        metrics_writer.record_latex_event(
             source=source,
             status=status,
             dpi=dpi,
             user_id=user_id,
             error_message=error_message,
             duration_ms=duration_ms,
+            coalesced=coalesced,
         )
     except Exception:
         logger.exception(
@@ -175,6 +502,33 @@ def _safe_record_latex_event(
         )
 
 
+# Values last handed to the metrics writer; unchanged counters are not rewritten.
+_last_recorded_counters: dict[str, int] = {}
+
+
+def _safe_record_counter_snapshot() -> None:
+    counters = snapshot_counters()
+    changed = {
+        name: value
+        for name, value in counters.items()
+        if _last_recorded_counters.get(name) != value
+    }
+    if not changed:
+        return
+    try:
+        metrics_writer.record_counter_snapshot(changed)
+    except Exception:
+        logger.exception("Failed to record runtime counter snapshot")
+        return
+    _last_recorded_counters.update(changed)
+
+
+def _page_filename(unique_id: str, index: int) -> str:
+    if index == 0:
+        return f"{unique_id}.png"
+    return f"{unique_id}-{index + 1}.png"
+
+
 def _log_command_success(
     *,
     user_id: int,
@@ -205,9 +559,11 @@ try:
     logger.info("Metrics database initialized path=%s", METRICS_DB_PATH)
 except Exception:
     logger.exception("Failed to initialize metrics database path=%s", METRICS_DB_PATH)
+# Metrics are written in batches on their own thread; a slow disk never blocks the gateway.
+metrics_writer.start()
 
 # Default to three local render workers when the bot owns the machine.
-executor = ThreadPoolExecutor(max_workers=LATEX_COMPILE_CONCURRENCY)
+executor = ThreadPoolExecutor(max_workers=sum(LATEX_LANE_SLOTS.values()))
 
 # Defaults include guild lifecycle events but exclude privileged message content.
 intents = discord.Intents.default()
@@ -231,6 +587,16 @@ class LatexBot(commands.Bot):
     async def setup_hook(self):
         await super().setup_hook()
         await self.start_health_server()
+        await self.warm_render_formats()
+
+    async def warm_render_formats(self):
+        loop = asyncio.get_running_loop()
+        try:
+            warmed = await loop.run_in_executor(executor, warm_render_formats)
+        except Exception:
+            logger.exception("Failed to warm LaTeX format files")
+            return
+        logger.info("LaTeX inline format warm-up finished ready=%s", warmed)
 
     async def start_health_server(self):
         if self._health_runner is not None:
@@ -262,6 +628,7 @@ class LatexBot(commands.Bot):
             self._health_runner = None
             logger.info("Bot health server stopped")
         await super().close()
+        await asyncio.get_running_loop().run_in_executor(None, metrics_writer.close)
 
 
 bot = LatexBot(
@@ -329,6 +696,21 @@ async def before_betterstack_heartbeat_task():
     await bot.wait_until_ready()
 
 
+@tasks.loop(minutes=1)
+async def runtime_counters_task():
+    _safe_record_counter_snapshot()
+
+
+# Retention, the size cap and vacuuming run here, never inside a metrics write.
+@tasks.loop(seconds=_read_int_env("METRICS_MAINTENANCE_INTERVAL_SECONDS", 60))
+async def metrics_maintenance_task():
+    loop = asyncio.get_running_loop()
+    try:
+        await loop.run_in_executor(None, run_metrics_maintenance, METRICS_DB_PATH)
+    except Exception:
+        logger.exception("Metrics maintenance failed path=%s", METRICS_DB_PATH)
+
+
 # this is used for a sheild.io badge nothing else 
 def _collect_user_stats() -> dict[str, int]:
     guilds = list(bot.guilds)
@@ -391,6 +773,14 @@ async def on_ready():
         betterstack_heartbeat_task.start()
         logger.info("Started Better Stack heartbeat task")
 
+    if not runtime_counters_task.is_running():
+        runtime_counters_task.start()
+        logger.info("Started runtime counter snapshot task")
+
+    if not metrics_maintenance_task.is_running():
+        metrics_maintenance_task.start()
+        logger.info("Started metrics maintenance task")
+
     # Debug Check
 
     # # Use a set to avoid duplicate users across guilds
@@ -443,17 +833,44 @@ class LatexCodeModal(discord.ui.Modal):
         )
 
 
+class LatexBatchModal(discord.ui.Modal):
+    batch_input = discord.ui.TextInput(
+        label="LaTeX expressions, one per line",
+        style=discord.TextStyle.long,
+        placeholder="\\frac{1}{2}\nx^2 + y^2 = z^2",
+        required=True,
+        max_length=DISCORD_MODAL_LATEX_INPUT_CHARS,
+    )
+
+    def __init__(
+        self,
+        *,
+        original_code: str = "",
+        dpi: int = DEFAULT_DPI,
+        title: str = "Enter LaTeX Expressions",
+    ):
+        super().__init__(title=title)
+        self.batch_input.default = original_code
+        self.dpi = dpi
+
+    async def on_submit(self, interaction: discord.Interaction):
+        await handle_latex_batch(
+            interaction, self.batch_input.value, self.dpi, source="batch"
+        )
+
+
 class FixCodeView(discord.ui.View):
-    def __init__(self, latex_code: str, dpi: int):
+    def __init__(self, latex_code: str, dpi: int, modal_cls=LatexCodeModal):
         super().__init__(timeout=None)
         self.latex_code = latex_code
         self.dpi = dpi
+        self.modal_cls = modal_cls
 
     @discord.ui.button(label="Fix Code", style=discord.ButtonStyle.danger, emoji="🔧")
     async def fix_code_button(
         self, interaction: discord.Interaction, button: discord.ui.Button
     ):
-        modal = LatexCodeModal(
+        modal = self.modal_cls(
             original_code=self.latex_code,
             dpi=self.dpi,
             title="Fix LaTeX Code",
@@ -464,6 +881,7 @@ class FixCodeView(discord.ui.View):
 async def handle_latex_compilation(
     interaction: discord.Interaction, latex_code: str, dpi: int, source: str = "modal"
 ):
+    deadline = time.monotonic() + LATEX_RENDER_DEADLINE_SECONDS
     if not interaction.response.is_done():
         await interaction.response.defer(thinking=True)
 
@@ -475,10 +893,24 @@ async def handle_latex_compilation(
         return await interaction.followup.send(embed=embed, ephemeral=ephemeral, wait=True)
 
     try:
-        output, duration_ms = await compile_queue.execute(
-            loop, text_to_latex, latex_code, unique_id, dpi,
-            notify_coro=notify_slash, timeout=15.0, user_id=interaction.user.id, source=source, dpi=dpi
-        )
+        # Invalid input is answered here, before it can queue or take a compile slot.
+        render_request = prepare_render_request(latex_code, dpi, unique_id)
+        if isinstance(render_request, str):
+            output, duration_ms, coalesced = render_request, None, False
+        else:
+            if LATEX_ASYNC_RENDER:
+                render_args = (arender_prepared_pages, render_request, unique_id, deadline)
+                cancel_token = None
+            else:
+                cancel_token = CancellationToken()
+                render_args = (render_prepared_pages, render_request, unique_id, cancel_token, deadline)
+            # Identical snippets already compiling are awaited rather than compiled again.
+            output, duration_ms, coalesced = await compile_queue.execute_shared(
+                render_request_key(render_request), loop, *render_args,
+                notify_coro=notify_slash, timeout=LATEX_RENDER_DEADLINE_SECONDS, user_id=interaction.user.id,
+                source=source, dpi=dpi, cancel_token=cancel_token, deadline=deadline,
+                lane=render_lane(render_request), guild_id=getattr(interaction, "guild_id", None),
+            )
         if output == "REJECTED":
             return
     except asyncio.TimeoutError:
@@ -526,7 +958,7 @@ async def handle_latex_compilation(
         await interaction.followup.send(embed=embed, view=view, ephemeral=True)
         return
 
-    if output is True:
+    if isinstance(output, list):
         logger.debug(
             "LaTeX compile success user_id=%s request_id=%s",
             interaction.user.id,
@@ -538,18 +970,22 @@ async def handle_latex_compilation(
             dpi=dpi,
             user_id=interaction.user.id,
             duration_ms=duration_ms,
+            coalesced=coalesced,
         )
-        file = discord.File(f"{unique_id}.png", filename=f"{unique_id}.png")
+        # The embed shows the first page; further pages ride along as attachments.
+        files = [
+            discord.File(io.BytesIO(page), filename=_page_filename(unique_id, index))
+            for index, page in enumerate(output)
+        ]
         embed = discord.Embed(color=Color.blue())
-        embed.set_image(url=f"attachment://{unique_id}.png")
-        await interaction.followup.send(embed=embed, file=file)
+        embed.set_image(url=f"attachment://{_page_filename(unique_id, 0)}")
+        await interaction.followup.send(embed=embed, files=files)
         _log_command_success(
             user_id=interaction.user.id,
             command="latex",
             source=source,
             detail=f"request_id={unique_id}",
         )
-        os.remove(f"{unique_id}.png")
     else:
         logger.warning(
             "LaTeX compile failed user_id=%s request_id=%s reason=%s",
@@ -564,6 +1000,7 @@ async def handle_latex_compilation(
             user_id=interaction.user.id,
             error_message=str(output),
             duration_ms=duration_ms,
+            coalesced=coalesced,
         )
         embed = discord.Embed(
             title="Compilation Error",
@@ -575,6 +1012,153 @@ async def handle_latex_compilation(
         return
 
 
+def _split_batch_input(batch_code: str) -> list[str]:
+    return [line.strip() for line in batch_code.splitlines() if line.strip()]
+
+
+def _batch_lane(prepared: list) -> str:
+    """Heaviest lane among the batch items, since the whole batch holds one slot."""
+    lanes = [render_lane(item) for item in prepared if not isinstance(item, str)]
+    return max(lanes, key=COMPILE_LANES.index, default="fast")
+
+
+def _summarize_batch_error(message: str, limit: int = 300) -> str:
+    summary = " ".join(message.split())
+    return summary if len(summary) <= limit else summary[: limit - 1] + "…"
+
+
+async def handle_latex_batch(
+    interaction: discord.Interaction, batch_code: str, dpi: int, source: str = "batch"
+):
+    deadline = time.monotonic() + LATEX_RENDER_DEADLINE_SECONDS
+    if not interaction.response.is_done():
+        await interaction.response.defer(thinking=True)
+
+    exprs = _split_batch_input(batch_code)
+    if not exprs or len(exprs) > LATEX_BATCH_MAX_ITEMS:
+        embed = discord.Embed(
+            title="Invalid Batch",
+            description=f"Enter between 1 and {LATEX_BATCH_MAX_ITEMS} expressions, one per line.",
+            color=Color.red(),
+        )
+        view = FixCodeView(batch_code, dpi, LatexBatchModal)
+        await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+        return
+
+    unique_id = str(uuid.uuid4())[7:14]
+    loop = asyncio.get_running_loop()
+
+    async def notify_slash(embed, ephemeral=False):
+        return await interaction.followup.send(embed=embed, ephemeral=ephemeral, wait=True)
+
+    # Items are validated once, here, before taking a slot. One TeX run serves the
+    # inline items, so the batch takes a single slot; it always renders on a thread.
+    prepared = [
+        prepare_render_request(expr, dpi, f"{unique_id}-{index + 1}")
+        for index, expr in enumerate(exprs)
+    ]
+    cancel_token = CancellationToken()
+    try:
+        results, duration_ms = await compile_queue.execute(
+            loop, render_prepared_many, prepared, dpi, cancel_token, deadline, unique_id,
+            notify_coro=notify_slash, timeout=LATEX_RENDER_DEADLINE_SECONDS, user_id=interaction.user.id,
+            source=source, dpi=dpi, cancel_token=cancel_token, deadline=deadline, lane=_batch_lane(prepared),
+            guild_id=getattr(interaction, "guild_id", None),
+        )
+        if results == "REJECTED":
+            return
+    except asyncio.TimeoutError:
+        logger.warning(
+            "LaTeX batch timeout user_id=%s request_id=%s items=%s",
+            interaction.user.id,
+            unique_id,
+            len(exprs),
+        )
+        _safe_record_latex_event(
+            source=source,
+            status="timeout",
+            dpi=dpi,
+            user_id=interaction.user.id,
+            error_message="LaTeX batch timed out",
+        )
+        embed = discord.Embed(
+            title="Timeout Error",
+            description="The batch took too long. Please try fewer or simpler expressions.",
+            color=Color.red(),
+        )
+        view = FixCodeView(batch_code, dpi, LatexBatchModal)
+        await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+        return
+    except Exception as exc:
+        logger.exception(
+            "LaTeX batch internal error user_id=%s request_id=%s items=%s",
+            interaction.user.id,
+            unique_id,
+            len(exprs),
+        )
+        _safe_record_latex_event(
+            source=source,
+            status="internal_error",
+            dpi=dpi,
+            user_id=interaction.user.id,
+            error_message=str(exc),
+        )
+        embed = discord.Embed(
+            title="Internal Error",
+            description="Unexpected compile error. Please try again in a moment.",
+            color=Color.red(),
+        )
+        view = FixCodeView(batch_code, dpi, LatexBatchModal)
+        await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+        return
+
+    files = []
+    errors = []
+    for position, result in enumerate(results, start=1):
+        if isinstance(result, bytes):
+            files.append(discord.File(io.BytesIO(result), filename=f"{unique_id}-{position}.png"))
+            _safe_record_latex_event(
+                source=source,
+                status="success",
+                dpi=dpi,
+                user_id=interaction.user.id,
+                duration_ms=duration_ms,
+            )
+        else:
+            errors.append(f"**#{position}**: {_summarize_batch_error(str(result))}")
+            _safe_record_latex_event(
+                source=source,
+                status="compile_error",
+                dpi=dpi,
+                user_id=interaction.user.id,
+                error_message=str(result),
+                duration_ms=duration_ms,
+            )
+
+    if not files:
+        embed = discord.Embed(
+            title="Compilation Error",
+            description="\n".join(errors),
+            color=Color.red(),
+        )
+        view = FixCodeView(batch_code, dpi, LatexBatchModal)
+        await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+        return
+
+    embed = discord.Embed(
+        title=f"Rendered {len(files)} of {len(results)} expressions",
+        description="\n".join(errors) or None,
+        color=Color.blue() if not errors else Color.orange(),
+    )
+    await interaction.followup.send(embed=embed, files=files)
+    _log_command_success(
+        user_id=interaction.user.id,
+        command="latex-batch",
+        source=source,
+        detail=f"request_id={unique_id} items={len(results)} failed={len(errors)}",
+    )
+
+
 # ===== Commands =====
 
 
@@ -609,6 +1193,16 @@ async def latex_inline(interaction: discord.Interaction, latex_code: str):
     )
 
 
+@bot.tree.command(
+    name="latex-batch",
+    description="Render up to 10 expressions, one per line, in a single compile",
+)
+@app_commands.allowed_installs(guilds=True, users=True)
+@app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
+async def latex_batch(interaction: discord.Interaction):
+    await interaction.response.send_modal(LatexBatchModal(dpi=DEFAULT_DPI))
+
+
 @bot.tree.command(name="help", description="See Features and Commands")
 @app_commands.allowed_installs(guilds=True, users=True)
 @app_commands.allowed_contexts(guilds=True, dms=True, private_channels=True)
@@ -629,6 +1223,7 @@ async def help(interaction: discord.Interaction):
         "/help                         To well get help\n\n"
         "/latex                        Open the LaTeX editor modal\n\n"
         "/latex-inline                 Single-line slash command input\n\n"
+        "/latex-batch                  Render several expressions, one per line\n\n"
         "/talk-to-me                   Talk to me\n\n"
         "/ping                         See if I'm awake!\n\n"
         "```",
@@ -0,0 +1,125 @@
+"""Negative cache of inputs the dvipng fast path has already failed on."""
+
+import hashlib
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable
+
+from env_settings import read_non_negative_int_env
+from runtime_counters import increment_counter
+
+_DEFAULT_MAX_ENTRIES = 1024
+_DEFAULT_MAX_TOKENS = 128
+_DEFAULT_TOKEN_THRESHOLD = 2
+
+
+def fast_path_key(latex_code: str) -> str:
+    return hashlib.sha256(latex_code.encode("utf-8")).hexdigest()
+
+
+class FastPathBlocklist:
+    """Bounded memory of dvipng fast-path failures.
+
+    A failing input is remembered by hash, so resubmitting it goes straight to
+    pdflatex. Command names the failing log blames are tallied per distinct
+    input; once `token_threshold` inputs blame the same command, every input
+    using it skips the fast path. A fast-path success clears the tally of the
+    commands it used, so common commands are never learned by accident.
+
+    Counters are published through `runtime_counters` under the `fast_path.`
+    prefix.
+    """
+
+    def __init__(
+            self,
+            max_entries: int = _DEFAULT_MAX_ENTRIES,
+            max_tokens: int = _DEFAULT_MAX_TOKENS,
+            token_threshold: int = _DEFAULT_TOKEN_THRESHOLD,
+    ):
+        self.max_entries = max(0, max_entries)
+        self.max_tokens = max(0, max_tokens)
+        self.token_threshold = max(1, token_threshold)
+        self._lock = threading.Lock()
+        self._failed_inputs: OrderedDict[str, None] = OrderedDict()
+        self._pending_tokens: OrderedDict[str, set[str]] = OrderedDict()
+        self._learned_tokens: OrderedDict[str, None] = OrderedDict()
+
+    @classmethod
+    def from_env(cls) -> "FastPathBlocklist":
+        return cls(
+            max_entries=read_non_negative_int_env(
+                "LATEX_FAST_PATH_NEGATIVE_ENTRIES",
+                _DEFAULT_MAX_ENTRIES,
+            ),
+            max_tokens=read_non_negative_int_env(
+                "LATEX_FAST_PATH_LEARNED_TOKENS",
+                _DEFAULT_MAX_TOKENS,
+            ),
+            token_threshold=read_non_negative_int_env(
+                "LATEX_FAST_PATH_TOKEN_THRESHOLD",
+                _DEFAULT_TOKEN_THRESHOLD,
+            ),
+        )
+
+    @property
+    def learned_tokens(self) -> list[str]:
+        with self._lock:
+            return list(self._learned_tokens)
+
+    def should_skip(self, key: str, tokens: Iterable[str]) -> bool:
+        """True when `key` failed before or uses a learned command."""
+        with self._lock:
+            if key in self._failed_inputs:
+                self._failed_inputs.move_to_end(key)
+                reason = "input"
+            else:
+                blocked = next((token for token in tokens if token in self._learned_tokens), None)
+                if blocked is None:
+                    return False
+                self._learned_tokens.move_to_end(blocked)
+                reason = "token"
+        increment_counter(f"fast_path.skipped_{reason}")
+        return True
+
+    def is_suspect(self, tokens: Iterable[str]) -> bool:
+        """True when a failing log has blamed one of `tokens`, short of learning it."""
+        with self._lock:
+            return any(token in self._pending_tokens for token in tokens)
+
+    def record_failure(self, key: str, blamed_tokens: Iterable[str]) -> None:
+        learned = 0
+        with self._lock:
+            if self.max_entries > 0:
+                self._failed_inputs[key] = None
+                self._failed_inputs.move_to_end(key)
+                while len(self._failed_inputs) > self.max_entries:
+                    self._failed_inputs.popitem(last=False)
+            if self.max_tokens == 0:
+                return
+            for token in blamed_tokens:
+                if token in self._learned_tokens:
+                    continue
+                blamers = self._pending_tokens.pop(token, set())
+                blamers.add(key)
+                if len(blamers) < self.token_threshold:
+                    self._pending_tokens[token] = blamers
+                    continue
+                self._learned_tokens[token] = None
+                learned += 1
+            while len(self._pending_tokens) > self.max_tokens:
+                self._pending_tokens.popitem(last=False)
+            while len(self._learned_tokens) > self.max_tokens:
+                self._learned_tokens.popitem(last=False)
+        if learned:
+            increment_counter("fast_path.learned_tokens", learned)
+
+    def record_success(self, tokens: Iterable[str]) -> None:
+        with self._lock:
+            for token in tokens:
+                self._pending_tokens.pop(token, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._failed_inputs.clear()
+            self._pending_tokens.clear()
+            self._learned_tokens.clear()
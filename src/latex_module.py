@@ -1,8 +1,38 @@
+import asyncio
+import atexit
 import logging
+import os
 import re
-from dataclasses import dataclass, field
-
-from modified_packages import InlineDviPngRenderer, Latex2PNG
+import threading
+import time
+from collections.abc import Callable
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from contextlib import contextmanager
+from dataclasses import dataclass, field, replace
+from io import BytesIO
+
+from PIL import Image
+
+from modified_packages import (
+    AsyncInlineDviPngRenderer,
+    AsyncLatex2PNG,
+    CancellationToken,
+    CompilationCancelledError,
+    CompilationTimeoutError,
+    FormatCache,
+    InlineDviPngRenderer,
+    Latex2PNG,
+    WarmWorkerPool,
+)
+from modified_packages.latex_compiler import _resolve_compile_dir
+from env_settings import (
+    read_non_negative_float_env,
+    read_non_negative_int_env,
+    read_positive_float_env,
+)
+from fast_path_blocklist import FastPathBlocklist, fast_path_key
+from render_cache import RenderCache, render_cache_key
+from runtime_counters import increment_counter
 
 _logger = logging.getLogger(__name__)
 _UNKNOWN_COMPILE_ERROR = (
@@ -77,6 +107,82 @@ _IGNORE_WRAPPER_COMMANDS = {
     r"\begin",
     r"\end",
 }
+_CANCELLED_RENDER_ERROR = "Render cancelled: the request stopped waiting for this compile."
+_RENDER_CACHE = RenderCache.from_env()
+_FAST_PATH_BLOCKLIST = FastPathBlocklist.from_env()
+_ERROR_CONTEXT_RE = re.compile(r"(?m)^l\.\d+\s+(.*)$")
+_FORMAT_CACHE_DIR_NAME = "formats"
+
+
+def _env_flag_enabled(name: str, default: bool = True) -> bool:
+    raw_value = os.getenv(name)
+    if raw_value is None:
+        return default
+    return raw_value.strip().lower() not in {"0", "false", "no", "off", ""}
+
+
+# Per-input-class compile budgets, so cheap requests cannot hold a slot as
+# long as TikZ ones. Every stage (dvipng attempt, pdflatex fallback, poppler)
+# draws from the same budget.
+_RENDER_BUDGET_SECONDS = {
+    "inline": read_positive_float_env("LATEX_INLINE_BUDGET_SECONDS", 6.0),
+    "structured": read_positive_float_env("LATEX_STRUCTURED_BUDGET_SECONDS", 10.0),
+    "tikz": read_positive_float_env("LATEX_TIKZ_BUDGET_SECONDS", 14.0),
+}
+# Skip the pdflatex fallback when less than this is left; it cannot finish anyway.
+_FALLBACK_MIN_SECONDS = read_positive_float_env("LATEX_FALLBACK_MIN_SECONDS", 1.5)
+
+_MULTIPAGE_POLICIES = ("first", "attachments", "stitch")
+
+
+def _read_multipage_policy() -> str:
+    policy = os.getenv("LATEX_MULTIPAGE_POLICY", "first").strip().lower()
+    return policy if policy in _MULTIPAGE_POLICIES else "first"
+
+
+# What a multi-page document renders to: the "first" page only, up to
+# LATEX_MAX_PAGES pages as separate "attachments", or those pages "stitch"ed
+# into one tall image. Pages past the limit are never rasterized.
+_MULTIPAGE_POLICY = _read_multipage_policy()
+_MAX_PAGES = max(1, read_non_negative_int_env("LATEX_MAX_PAGES", 4))
+
+# The inline preamble never changes, so one dumped format serves every request.
+_INLINE_FORMAT_CACHE = (
+    FormatCache(_resolve_compile_dir() / _FORMAT_CACHE_DIR_NAME / "inline", max_formats=1)
+    if _env_flag_enabled("LATEX_INLINE_FORMAT")
+    else None
+)
+
+
+def _build_document_format_cache() -> FormatCache | None:
+    max_formats = read_non_negative_int_env("LATEX_DOCUMENT_FORMAT_CACHE_SIZE", 8)
+    if max_formats == 0:
+        return None
+    return FormatCache(
+        _resolve_compile_dir() / _FORMAT_CACHE_DIR_NAME / "documents",
+        max_formats=max_formats,
+        min_uses=read_non_negative_int_env("LATEX_DOCUMENT_FORMAT_MIN_USES", 2),
+    )
+
+
+def _build_warm_worker_pool() -> WarmWorkerPool | None:
+    size = read_non_negative_int_env("LATEX_WARM_WORKERS", 0)
+    if size == 0:
+        return None
+    pool = WarmWorkerPool(
+        size=size,
+        max_idle_seconds=read_non_negative_float_env("LATEX_WARM_WORKER_MAX_IDLE_SECONDS", 300.0),
+    )
+    atexit.register(pool.close)
+    return pool
+
+
+# Opt-in: idle `latex` processes that have already loaded the inline format.
+_INLINE_WORKER_POOL = _build_warm_worker_pool()
+
+# Full documents and TikZ shells repeat a handful of heavy preambles (tikz,
+# pgfplots), especially across "Fix Code" resubmissions.
+_DOCUMENT_FORMAT_CACHE = _build_document_format_cache()
 _FRIENDLY_ERROR_PREFIXES = (
     "input too long:",
     "dpi too large:",
@@ -129,6 +235,70 @@ _DVIPNG_FAST_PATH_BLOCKLIST = (
 )
 
 
+# Packages that behave the same under latex+dvipng as under pdflatex. Anything
+# else (graphicx, hyperref, microtype, tikz, fontspec, ...) keeps the PDF path.
+_DVI_SAFE_PACKAGES = frozenset({
+    "amsmath",
+    "amssymb",
+    "amsfonts",
+    "amsthm",
+    "mathtools",
+    "mathrsfs",
+    "bm",
+    "bbm",
+    "dsfont",
+    "esint",
+    "cancel",
+    "braket",
+    "physics",
+    "siunitx",
+    "xcolor",
+    "color",
+    "array",
+    "booktabs",
+    "multirow",
+    "enumitem",
+    "inputenc",
+    "fontenc",
+    "lmodern",
+    "textcomp",
+    "gensymb",
+})
+_DVI_UNSAFE_DOCUMENT_PATTERNS = (
+    r"\\documentclass\[[^\]]*\b(?:tikz|pstricks|convert)\b",
+    r"\\includegraphics\b",
+    r"\\graphicspath\b",
+    r"\\input\b",
+    r"\\include\b",
+    r"\\import\b",
+    r"\\subimport\b",
+    r"\\special\b",
+    r"\\pdf[A-Za-z]+",
+    r"\\tikz\b",
+    r"\\pgf[A-Za-z]*",
+    r"\\usetikzlibrary\b",
+)
+# Full documents without PDF-only features go through latex+dvipng on a white background.
+_DVIPNG_DOCUMENTS_ENABLED = _env_flag_enabled("LATEX_DVIPNG_DOCUMENTS")
+# Render path names used in the render.path.* counters.
+_DVIPNG_INLINE_PATH = "dvipng_inline"
+_DVIPNG_DOCUMENT_PATH = "dvipng_document"
+_PDFLATEX_PATH = "pdflatex"
+_DVIPNG_BATCH_PATH = "dvipng_batch"
+_PDFLATEX_BATCH_PATH = "pdflatex_batch"
+_BATCH_PAGE_ENV = "batchpage"
+# Opt-in: race dvipng against pdflatex for inputs dvipng has failed on, when the queue is idle.
+_SPECULATIVE_RACE_ENABLED = _env_flag_enabled("LATEX_SPECULATIVE_RACE", default=False)
+_spare_capacity_probe: Callable[[], bool] | None = None
+# Threaded races share one small pool; a losing leg keeps its race slot until it exits.
+_MAX_CONCURRENT_RACES = 2
+_RACE_SLOTS = threading.BoundedSemaphore(_MAX_CONCURRENT_RACES)
+_RACE_EXECUTOR = ThreadPoolExecutor(
+    max_workers=2 * _MAX_CONCURRENT_RACES,
+    thread_name_prefix="latex-race",
+)
+
+
 # Should Fork or was it pork :)
 
 
@@ -462,7 +632,13 @@ def _run_preflight_checks(expr: str) -> PreflightIssue | None:
     return None
 
 
-def text_to_latex(expr: str, output_file: str, dpi=300) -> bool | str:
+def text_to_latex(
+        expr: str,
+        output_file: str,
+        dpi=300,
+        cancel_token: CancellationToken | None = None,
+        deadline: float | None = None,
+) -> bool | str:
     """
     Converts LaTeX input to a PNG file.
     Returns True on success, or a user-facing error string on failure.
@@ -473,10 +649,91 @@ def text_to_latex(expr: str, output_file: str, dpi=300) -> bool | str:
      expr: str
      output_file: str
      dpi=(1000 , optional) int | sets resolution
+     cancel_token=(None, optional) CancellationToken | kills the running compile when cancelled
+     deadline=(None, optional) float | time.monotonic() by which the caller stops waiting
     """
+    result = text_to_png_bytes(expr, output_file, dpi, cancel_token, deadline)
+    return _write_png_result(result, output_file)
+
 
+async def atext_to_latex(
+        expr: str,
+        output_file: str,
+        dpi=300,
+        deadline: float | None = None,
+) -> bool | str:
+    """Async variant of `text_to_latex`.
+
+    The latex, dvipng and poppler stages run as asyncio subprocesses, so no
+    executor thread is held and cancelling the caller kills the active stage.
+    """
+    result = await atext_to_png_bytes(expr, output_file, dpi, deadline)
+    return _write_png_result(result, output_file)
+
+
+def text_to_png_bytes(
+        expr: str,
+        request_id: str,
+        dpi=300,
+        cancel_token: CancellationToken | None = None,
+        deadline: float | None = None,
+) -> bytes | str:
+    """Like `text_to_latex`, but return the PNG bytes instead of writing a file.
+
+    `request_id` only labels log lines. Returns the first (or stitched) page
+    on success, or a user-facing error string on failure.
+    """
+    return _first_page(text_to_png_pages(expr, request_id, dpi, cancel_token, deadline))
+
+
+async def atext_to_png_bytes(
+        expr: str,
+        request_id: str,
+        dpi=300,
+        deadline: float | None = None,
+) -> bytes | str:
+    """Async variant of `text_to_png_bytes`."""
+    return _first_page(await atext_to_png_pages(expr, request_id, dpi, deadline))
+
+
+def text_to_png_pages(
+        expr: str,
+        request_id: str,
+        dpi=300,
+        cancel_token: CancellationToken | None = None,
+        deadline: float | None = None,
+) -> list[bytes] | str:
+    """Render `expr` to one PNG per page allowed by LATEX_MULTIPAGE_POLICY.
+
+    Returns a non-empty list of PNGs on success, or a user-facing error string.
+    """
     # Interaction input is LaTeX source, not a message command. Keep it intact
     # so command-like text is validated and rendered consistently.
+    render_request = prepare_render_request(expr, dpi, request_id)
+    if not isinstance(render_request, RenderRequest):
+        return render_request
+    return render_prepared_pages(render_request, request_id, cancel_token, deadline)
+
+
+async def atext_to_png_pages(
+        expr: str,
+        request_id: str,
+        dpi=300,
+        deadline: float | None = None,
+) -> list[bytes] | str:
+    """Async variant of `text_to_png_pages`."""
+    render_request = prepare_render_request(expr, dpi, request_id)
+    if not isinstance(render_request, RenderRequest):
+        return render_request
+    return await arender_prepared_pages(render_request, request_id, deadline)
+
+
+def prepare_render_request(expr: str, dpi=300, request_id: str = "") -> RenderRequest | str:
+    """Validate `expr` and build its render request without compiling anything.
+
+    Cheap enough to run on the event loop before a compile slot is taken.
+    Returns a user-facing error string for input that cannot be rendered.
+    """
     if len(expr) > MAX_LATEX_INPUT_CHARS:
         return (
             f"Input too long: {len(expr)} characters. "
@@ -491,12 +748,39 @@ def text_to_latex(expr: str, output_file: str, dpi=300) -> bool | str:
         user_error = _format_preflight_issue(render_request.preflight_issue)
         _logger.warning(
             "Latex2PNG rejected invalid input output_file=%s dpi=%s expr_len=%s latex_error=%s",
-            output_file,
+            request_id,
             dpi,
             len(expr),
             user_error,
         )
         return user_error
+    return render_request
+
+
+def render_request_key(render_request: RenderRequest) -> str:
+    """Canonical identity of a prepared render; equivalent inputs share it."""
+    return _render_request_cache_key(render_request)
+
+
+def render_lane(render_request: RenderRequest) -> str:
+    """Compile-queue lane for a prepared render: "fast", "inline" or "structured"."""
+    if render_request.input_kind != "inline" or _content_suggests_tikz(render_request.source_expr):
+        return "structured"
+    if _is_dvipng_fast_path_eligible(render_request.source_expr):
+        return "fast"
+    return "inline"
+
+
+def render_prepared_pages(
+        render_request: RenderRequest,
+        request_id: str,
+        cancel_token: CancellationToken | None = None,
+        deadline: float | None = None,
+) -> list[bytes] | str:
+    """Render a request from `prepare_render_request`, like `text_to_png_pages`."""
+    png_bytes = _cached_png(render_request, request_id)
+    if png_bytes is not None:
+        return [png_bytes]
 
     try:
         png_data = _render_png_request(
@@ -504,64 +788,438 @@ def text_to_latex(expr: str, output_file: str, dpi=300) -> bool | str:
             latex_code=render_request.latex_code,
             transparent=render_request.transparent,
             render_dpi=render_request.render_dpi,
-            output_file=output_file,
+            output_file=request_id,
+            cancel_token=cancel_token,
+            deadline=_render_deadline(render_request, deadline),
         )
     except Exception as exc:
-        normalized_error = _normalize_error_log(exc)
-        truncated_input_error = _detect_truncated_complex_input_error(
-            render_request.source_expr,
-            normalized_error,
+        return _render_failure_message(exc, render_request, request_id, render_request.render_dpi)
+
+    return _finish_text_render(render_request, png_data, request_id)
+
+
+async def arender_prepared_pages(
+        render_request: RenderRequest,
+        request_id: str,
+        deadline: float | None = None,
+) -> list[bytes] | str:
+    """Async variant of `render_prepared_pages`."""
+    png_bytes = _cached_png(render_request, request_id)
+    if png_bytes is not None:
+        return [png_bytes]
+
+    try:
+        png_data = await _arender_png_request(
+            expr=render_request.source_expr,
+            latex_code=render_request.latex_code,
+            transparent=render_request.transparent,
+            render_dpi=render_request.render_dpi,
+            output_file=request_id,
+            deadline=_render_deadline(render_request, deadline),
         )
-        if truncated_input_error:
-            _logger.warning(
-                "Latex2PNG rejected truncated structured input output_file=%s dpi=%s expr_len=%s",
-                output_file,
-                dpi,
-                len(expr),
+    except Exception as exc:
+        return _render_failure_message(exc, render_request, request_id, render_request.render_dpi)
+
+    return _finish_text_render(render_request, png_data, request_id)
+
+
+def render_many(
+        exprs: list[str],
+        dpi=300,
+        cancel_token: CancellationToken | None = None,
+        deadline: float | None = None,
+        request_id: str = "batch",
+) -> list[bytes | str]:
+    """Render independent expressions, compiling all the inline ones in one TeX run.
+
+    Returns one entry per expression, in order: its PNG, or a user-facing
+    error string. An item that breaks the shared run gets that error and the
+    run is retried without it. Structured documents render one by one.
+    """
+    prepared = [
+        prepare_render_request(expr, dpi, f"{request_id}-{index + 1}")
+        for index, expr in enumerate(exprs)
+    ]
+    return render_prepared_many(prepared, dpi, cancel_token, deadline, request_id)
+
+
+def render_prepared_many(
+        prepared: list[RenderRequest | str],
+        dpi=300,
+        cancel_token: CancellationToken | None = None,
+        deadline: float | None = None,
+        request_id: str = "batch",
+) -> list[bytes | str]:
+    """`render_many` for items already run through `prepare_render_request`.
+
+    Error strings from preparation are passed through as that item's result.
+    Batches always render on the calling thread, whatever LATEX_ASYNC_RENDER says.
+    """
+    results: list[bytes | str | None] = [None] * len(prepared)
+    batch: dict[int, RenderRequest] = {}
+    for index, render_request in enumerate(prepared):
+        item_id = f"{request_id}-{index + 1}"
+        if not isinstance(render_request, RenderRequest):
+            results[index] = render_request
+            continue
+        png_bytes = _cached_png(render_request, item_id)
+        if png_bytes is not None:
+            results[index] = png_bytes
+        elif render_request.input_kind != "inline":
+            results[index] = _first_page(
+                render_prepared_pages(render_request, item_id, cancel_token, deadline)
             )
-            _logger.debug(
-                "Latex2PNG raw compiler output output_file=%s\n%s",
-                output_file,
-                normalized_error,
+        else:
+            png_bytes = _RENDER_CACHE.get(_batch_cache_key(render_request))
+            if png_bytes is not None:
+                results[index] = png_bytes
+            else:
+                batch[index] = render_request
+
+    if batch:
+        # The run (and any one-by-one fallback) gets the largest budget among its items.
+        batch_deadline = max(_render_deadline(render_request, deadline) for render_request in batch.values())
+        _render_batch(batch, results, request_id, dpi, cancel_token, batch_deadline)
+    return results
+
+
+def _render_batch(
+        batch: dict[int, RenderRequest],
+        results: list[bytes | str | None],
+        request_id: str,
+        dpi: int,
+        cancel_token: CancellationToken | None,
+        deadline: float,
+) -> None:
+    while batch:
+        render_requests = list(batch.values())
+        latex_code, spans = _build_batch_document(render_requests)
+        increment_counter("render.batch.runs")
+        try:
+            pages = _render_batch_document(latex_code, spans, render_requests, cancel_token, deadline)
+        except Exception as exc:
+            if isinstance(exc, CompilationCancelledError):
+                for index, render_request in batch.items():
+                    results[index] = _render_failure_message(
+                        exc, render_request, f"{request_id}-{index + 1}", dpi
+                    )
+                return
+            position = _batch_position_for_error(_normalize_error_log(exc), spans)
+            if position is None:
+                increment_counter("render.batch.unattributed_failures")
+                _render_batch_items_individually(batch, results, request_id, dpi, cancel_token, deadline)
+                return
+            index = list(batch)[position]
+            failed_request = replace(
+                batch.pop(index),
+                latex_code=latex_code,
+                generated_to_user_line=spans[position][2],
             )
-            return truncated_input_error
+            results[index] = _render_failure_message(exc, failed_request, f"{request_id}-{index + 1}", dpi)
+            increment_counter("render.batch.item_failures")
+            continue
 
-        user_error = find_latex_error(
-            normalized_error,
-            render_request=render_request,
+        if len(pages) != len(batch):
+            # An item that typesets nothing drops its page, so pages no longer line up.
+            increment_counter("render.batch.page_mismatches")
+            _render_batch_items_individually(batch, results, request_id, dpi, cancel_token, deadline)
+            return
+        for (index, render_request), png_bytes in zip(batch.items(), pages):
+            _RENDER_CACHE.put(_batch_cache_key(render_request), png_bytes)
+            results[index] = png_bytes
+        increment_counter("render.batch.items", len(pages))
+        return
+
+
+def _render_batch_items_individually(
+        batch: dict[int, RenderRequest],
+        results: list[bytes | str | None],
+        request_id: str,
+        dpi: int,
+        cancel_token: CancellationToken | None,
+        deadline: float,
+) -> None:
+    for index, render_request in batch.items():
+        results[index] = _first_page(
+            render_prepared_pages(render_request, f"{request_id}-{index + 1}", cancel_token, deadline)
         )
 
-        if user_error:
-            _logger.warning(
-                "Latex2PNG compile failed output_file=%s dpi=%s expr_len=%s latex_error=%s",
-                output_file,
-                dpi,
-                len(expr),
-                user_error,
-            )
+
+def _render_batch_document(
+        latex_code: str,
+        spans: list[tuple[int, int, dict[int, int]]],
+        render_requests: list[RenderRequest],
+        cancel_token: CancellationToken | None,
+        deadline: float,
+) -> list[bytes]:
+    """Compile the batch with dvipng when every item may use it, else (or on failure) pdflatex."""
+    render_dpi = render_requests[0].render_dpi
+    if _batch_may_use_dvipng(render_requests):
+        increment_counter("fast_path.attempts")
+        try:
+            with _timed_render_path(_DVIPNG_BATCH_PATH):
+                png_data = InlineDviPngRenderer(
+                    format_cache=_DOCUMENT_FORMAT_CACHE,
+                    cancel_token=cancel_token,
+                    deadline=deadline,
+                ).compile_pages(latex_code, transparent=True, dpi=render_dpi)
+        except CompilationCancelledError:
+            raise
+        except Exception as exc:
+            _record_batch_fast_path_failure(exc, spans, render_requests)
+            if _fallback_budget_exhausted(deadline):
+                _log_skipped_fallback(_DVIPNG_BATCH_PATH, "batch", render_dpi, latex_code)
+                raise
+            _log_fast_path_failure(_DVIPNG_BATCH_PATH, exc, "batch", render_dpi, latex_code)
         else:
-            _logger.warning(
-                "Latex2PNG compile failed output_file=%s dpi=%s expr_len=%s err=%s",
-                output_file,
-                dpi,
-                len(expr),
-                exc,
-            )
+            for render_request in render_requests:
+                _FAST_PATH_BLOCKLIST.record_success(_command_tokens(render_request.source_expr))
+            return _coerce_png_pages(png_data, "batch")
+
+    with _timed_render_path(_PDFLATEX_BATCH_PATH):
+        png_data = Latex2PNG(
+            format_cache=_DOCUMENT_FORMAT_CACHE,
+            cancel_token=cancel_token,
+            deadline=deadline,
+        ).compile(
+            latex_code,
+            transparent=True,
+            compiler='pdflatex',
+            dpi=render_dpi,
+            first_page=1,
+            last_page=len(render_requests),
+        )
+    return _coerce_png_pages(png_data, "batch")
+
+
+def _batch_may_use_dvipng(render_requests: list[RenderRequest]) -> bool:
+    return all(
+        _is_dvipng_fast_path_eligible(render_request.source_expr)
+        for render_request in render_requests
+    ) and not any(
+        _FAST_PATH_BLOCKLIST.should_skip(
+            fast_path_key(render_request.latex_code),
+            _command_tokens(render_request.source_expr),
+        )
+        for render_request in render_requests
+    )
+
+
+def _record_batch_fast_path_failure(
+        exc: Exception,
+        spans: list[tuple[int, int, dict[int, int]]],
+        render_requests: list[RenderRequest],
+) -> None:
+    """Blame the item the log points at, keyed like its single render so both paths learn."""
+    position = _batch_position_for_error(_normalize_error_log(exc), spans)
+    if position is None:
+        increment_counter("fast_path.failures")
+        return
+    failed_request = render_requests[position]
+    _record_fast_path_failure(failed_request.source_expr, failed_request.latex_code, exc)
+
+
+def _batch_position_for_error(
+        log_text: str,
+        spans: list[tuple[int, int, dict[int, int]]],
+) -> int | None:
+    generated_line_no = _extract_generated_line_number(log_text)
+    if generated_line_no is None:
+        return None
+    for position, (first_line, last_line, _line_map) in enumerate(spans):
+        if first_line <= generated_line_no <= last_line:
+            return position
+    return None
+
+
+def _first_page(result: list[bytes] | str) -> bytes | str:
+    return result if isinstance(result, str) else result[0]
+
+
+def _write_png_result(result: bytes | str, output_file: str) -> bool | str:
+    if isinstance(result, str):
+        return result
+    with open(output_file + '.png', 'wb') as f:
+        f.write(result)
+    return True
+
+
+def _cached_png(render_request: RenderRequest, output_file: str) -> bytes | None:
+    png_bytes = _RENDER_CACHE.get(_render_request_cache_key(render_request))
+    if png_bytes is not None:
+        _logger.debug("PNG served from render cache output_file=%s", output_file)
+    return png_bytes
+
+
+def _render_budget_class(render_request: RenderRequest) -> str:
+    if render_request.input_kind == "inline":
+        return "inline"
+    if _content_suggests_tikz(render_request.source_expr):
+        return "tikz"
+    return "structured"
+
+
+def _render_deadline(render_request: RenderRequest, deadline: float | None) -> float:
+    """Combine the caller's deadline with the budget for this input class."""
+    budget_deadline = time.monotonic() + _RENDER_BUDGET_SECONDS[_render_budget_class(render_request)]
+    return budget_deadline if deadline is None else min(deadline, budget_deadline)
+
+
+def _render_request_cache_key(render_request: RenderRequest) -> str:
+    return render_cache_key(
+        render_request.latex_code,
+        render_request.render_dpi,
+        render_request.transparent,
+        variant=f"{_MULTIPAGE_POLICY}:{_MAX_PAGES}",
+    )
+
 
+def _batch_cache_key(render_request: RenderRequest) -> str:
+    """Pages cut from a batch document differ from single renders, so they get their own keys."""
+    return render_cache_key(
+        render_request.latex_code,
+        render_request.render_dpi,
+        render_request.transparent,
+        variant="batch",
+    )
+
+
+def _render_failure_message(
+        exc: Exception,
+        render_request: RenderRequest,
+        output_file: str,
+        dpi: int,
+) -> str:
+    expr_len = len(render_request.source_expr)
+    if isinstance(exc, CompilationCancelledError):
+        increment_counter("render.cancelled")
+        _logger.info(
+            "Latex2PNG compile cancelled output_file=%s dpi=%s expr_len=%s",
+            output_file,
+            dpi,
+            expr_len,
+        )
+        return _CANCELLED_RENDER_ERROR
+
+    normalized_error = _normalize_error_log(exc)
+    truncated_input_error = _detect_truncated_complex_input_error(
+        render_request.source_expr,
+        normalized_error,
+    )
+    if truncated_input_error:
+        _logger.warning(
+            "Latex2PNG rejected truncated structured input output_file=%s dpi=%s expr_len=%s",
+            output_file,
+            dpi,
+            expr_len,
+        )
         _logger.debug(
             "Latex2PNG raw compiler output output_file=%s\n%s",
             output_file,
             normalized_error,
         )
-        return user_error or _UNKNOWN_COMPILE_ERROR
+        return truncated_input_error
 
-    png_bytes = _coerce_png_bytes(png_data, output_file)
+    user_error = find_latex_error(
+        normalized_error,
+        render_request=render_request,
+    )
 
-    with open(output_file + '.png', 'wb') as f:
-        f.write(png_bytes)
+    if user_error:
+        _logger.warning(
+            "Latex2PNG compile failed output_file=%s dpi=%s expr_len=%s latex_error=%s",
+            output_file,
+            dpi,
+            expr_len,
+            user_error,
+        )
+    else:
+        _logger.warning(
+            "Latex2PNG compile failed output_file=%s dpi=%s expr_len=%s err=%s",
+            output_file,
+            dpi,
+            expr_len,
+            exc,
+        )
 
-    _logger.debug("PNG generated output_file=%s.png", output_file)
-    return True
+    _logger.debug(
+        "Latex2PNG raw compiler output output_file=%s\n%s",
+        output_file,
+        normalized_error,
+    )
+    return user_error or _UNKNOWN_COMPILE_ERROR
+
+
+def _finish_text_render(
+        render_request: RenderRequest,
+        png_data: list[bytes] | bytes,
+        output_file: str,
+) -> list[bytes] | str:
+    pages = _apply_multipage_policy(_coerce_png_pages(png_data, output_file))
+    if not pages:
+        _logger.warning("Renderer returned no PNG pages output_file=%s", output_file)
+        return _UNKNOWN_COMPILE_ERROR
+    # The cache holds one image per key; separate attachments are re-rendered.
+    if len(pages) == 1:
+        _RENDER_CACHE.put(_render_request_cache_key(render_request), pages[0])
+    _logger.debug("PNG generated output_file=%s pages=%s", output_file, len(pages))
+    return pages
+
+
+def _page_limit() -> int:
+    return 1 if _MULTIPAGE_POLICY == "first" else _MAX_PAGES
+
+
+def _apply_multipage_policy(pages: list[bytes]) -> list[bytes]:
+    pages = pages[:_page_limit()]
+    if _MULTIPAGE_POLICY == "stitch" and len(pages) > 1:
+        return [_stitch_png_pages(pages)]
+    return pages
+
+
+def _stitch_png_pages(pages: list[bytes]) -> bytes:
+    """Stack pages top to bottom, left aligned, keeping transparency when any page has it."""
+    images = [Image.open(BytesIO(page)) for page in pages]
+    has_alpha = any(image.mode in ("RGBA", "LA") or "transparency" in image.info for image in images)
+    mode = "RGBA" if has_alpha else "RGB"
+    background = (255, 255, 255, 0) if has_alpha else (255, 255, 255)
+    canvas = Image.new(
+        mode,
+        (max(image.width for image in images), sum(image.height for image in images)),
+        background,
+    )
+    top = 0
+    for image in images:
+        canvas.paste(image.convert(mode), (0, top))
+        top += image.height
+    with BytesIO() as output:
+        canvas.save(output, "PNG")
+        return output.getvalue()
+
+
+def warm_render_formats() -> bool:
+    """Dump the inline preamble format and start warm workers before the first inline render."""
+    renderer = _inline_renderer()
+    inline_document = _build_inline_document("")
+    warmed = renderer.warm_format(inline_document)
+    renderer.warm_workers(inline_document)
+    return warmed
+
+
+def _inline_renderer(
+        cancel_token: CancellationToken | None = None,
+        deadline: float | None = None,
+) -> InlineDviPngRenderer:
+    return InlineDviPngRenderer(
+        format_cache=_INLINE_FORMAT_CACHE,
+        worker_pool=_INLINE_WORKER_POOL,
+        cancel_token=cancel_token,
+        deadline=deadline,
+    )
+
+
+def _fallback_budget_exhausted(deadline: float | None) -> bool:
+    return deadline is not None and deadline - time.monotonic() < _FALLBACK_MIN_SECONDS
 
 
 def _is_full_document(expr: str) -> bool:
@@ -620,6 +1278,16 @@ def _is_dvipng_fast_path_eligible(expr: str) -> bool:
     return _matched_dvipng_block_pattern(stripped) is None
 
 
+def _is_dvi_safe_document(expr: str) -> bool:
+    """True for structured input that uses nothing dvipng renders differently from poppler."""
+    stripped = _strip_comments_preserving_lines(expr).strip()
+    if not stripped or _content_suggests_tikz(stripped):
+        return False
+    if any(re.search(pattern, stripped) for pattern in _DVI_UNSAFE_DOCUMENT_PATTERNS):
+        return False
+    return _parse_imported_packages(stripped) <= _DVI_SAFE_PACKAGES
+
+
 def _structured_document_kind(expr: str) -> str:
     stripped = expr.strip()
     return "TikZ document" if _content_suggests_tikz(stripped) else "LaTeX document"
@@ -646,33 +1314,405 @@ def _render_png_request(
         transparent: bool,
         render_dpi: int,
         output_file: str,
+        cancel_token: CancellationToken | None = None,
+        deadline: float | None = None,
 ):
-    if transparent and _is_dvipng_fast_path_eligible(expr):
+    dvipng_path = _dvipng_render_path(expr, latex_code, transparent)
+    if dvipng_path is not None and _should_race(expr) and _RACE_SLOTS.acquire(blocking=False):
+        return _race_render_png_request(
+            expr, latex_code, transparent, render_dpi, dvipng_path, cancel_token, deadline
+        )
+    if dvipng_path is not None:
         try:
-            return InlineDviPngRenderer().compile(
+            png_data = _render_dvipng(
+                dvipng_path, latex_code, transparent, render_dpi, cancel_token, deadline
+            )
+        except CompilationCancelledError:
+            raise
+        except Exception as exc:
+            _record_fast_path_failure(expr, latex_code, exc)
+            if _fallback_budget_exhausted(deadline):
+                _log_skipped_fallback(dvipng_path, output_file, render_dpi, expr)
+                raise
+            _log_fast_path_failure(dvipng_path, exc, output_file, render_dpi, expr)
+        else:
+            _FAST_PATH_BLOCKLIST.record_success(_command_tokens(expr))
+            return png_data
+
+    return _render_pdflatex(latex_code, transparent, render_dpi, cancel_token, deadline)
+
+
+def _render_dvipng(
+        dvipng_path: str,
+        latex_code: str,
+        transparent: bool,
+        render_dpi: int,
+        cancel_token: CancellationToken | None,
+        deadline: float | None,
+):
+    with _timed_render_path(dvipng_path):
+        if dvipng_path == _DVIPNG_INLINE_PATH:
+            return _inline_renderer(cancel_token, deadline).compile(
                 latex_code,
                 transparent=transparent,
                 dpi=render_dpi,
             )
+        return _document_dvipng_renderer(cancel_token, deadline).compile_pages(
+            latex_code,
+            transparent=transparent,
+            dpi=render_dpi,
+            first_page=1,
+            last_page=_page_limit(),
+        )
+
+
+def _render_pdflatex(
+        latex_code: str,
+        transparent: bool,
+        render_dpi: int,
+        cancel_token: CancellationToken | None,
+        deadline: float | None,
+):
+    with _timed_render_path(_PDFLATEX_PATH):
+        return Latex2PNG(
+            format_cache=_DOCUMENT_FORMAT_CACHE,
+            cancel_token=cancel_token,
+            deadline=deadline,
+        ).compile(
+            latex_code,
+            transparent=transparent,
+            compiler='pdflatex',
+            dpi=render_dpi,
+            first_page=1,
+            last_page=_page_limit(),
+        )
+
+
+def _race_render_png_request(
+        expr: str,
+        latex_code: str,
+        transparent: bool,
+        render_dpi: int,
+        dvipng_path: str,
+        cancel_token: CancellationToken | None,
+        deadline: float | None,
+):
+    """Run dvipng and pdflatex side by side; the first success wins and the other is killed."""
+    increment_counter("render.race.started")
+    parent_token = cancel_token or CancellationToken()
+    leg_tokens = {dvipng_path: parent_token.child(), _PDFLATEX_PATH: parent_token.child()}
+    errors: dict[str, Exception] = {}
+    futures = {
+        _RACE_EXECUTOR.submit(
+            _render_dvipng,
+            dvipng_path,
+            latex_code,
+            transparent,
+            render_dpi,
+            leg_tokens[dvipng_path],
+            deadline,
+        ): dvipng_path,
+        _RACE_EXECUTOR.submit(
+            _render_pdflatex,
+            latex_code,
+            transparent,
+            render_dpi,
+            leg_tokens[_PDFLATEX_PATH],
+            deadline,
+        ): _PDFLATEX_PATH,
+    }
+    _release_race_slot_when_done(list(futures))
+    for future in as_completed(futures):
+        path = futures[future]
+        try:
+            png_data = future.result()
         except Exception as exc:
-            _logger.info(
-                "InlineDviPngRenderer failed output_file=%s dpi=%s expr_len=%s; retrying pdflatex",
-                output_file,
-                render_dpi,
-                len(expr),
+            errors[path] = exc
+            _record_race_leg_failure(path, expr, latex_code, exc)
+            continue
+        # The loser is cancelled but not awaited; it frees its race slot once it exits.
+        for loser, token in leg_tokens.items():
+            if loser != path:
+                token.cancel()
+        _record_race_win(path, expr)
+        return png_data
+    raise errors[_PDFLATEX_PATH]
+
+
+def _release_race_slot_when_done(legs: list) -> None:
+    pending = set(legs)
+    lock = threading.Lock()
+    slots = _RACE_SLOTS
+
+    def leg_finished(leg) -> None:
+        with lock:
+            pending.discard(leg)
+            if pending:
+                return
+        slots.release()
+
+    for leg in legs:
+        leg.add_done_callback(leg_finished)
+
+
+def _should_race(expr: str) -> bool:
+    """Race only inputs whose commands dvipng failed on before, and only when the queue is idle."""
+    if not _SPECULATIVE_RACE_ENABLED or _spare_capacity_probe is None:
+        return False
+    if not _FAST_PATH_BLOCKLIST.is_suspect(_command_tokens(expr)):
+        return False
+    return _spare_capacity_probe()
+
+
+def set_spare_capacity_probe(probe: Callable[[], bool] | None) -> None:
+    """Register how the renderer asks the compile queue whether it has idle slots to race on."""
+    global _spare_capacity_probe
+    _spare_capacity_probe = probe
+
+
+def _record_race_leg_failure(path: str, expr: str, latex_code: str, exc: Exception) -> None:
+    if path != _PDFLATEX_PATH and not isinstance(exc, CompilationCancelledError):
+        _record_fast_path_failure(expr, latex_code, exc)
+
+
+def _record_race_win(path: str, expr: str) -> None:
+    increment_counter(f"render.race.won.{path}")
+    if path != _PDFLATEX_PATH:
+        _FAST_PATH_BLOCKLIST.record_success(_command_tokens(expr))
+
+
+def _dvipng_render_path(expr: str, latex_code: str, transparent: bool) -> str | None:
+    """Pick the dvipng pipeline for this input, or None to go straight to pdflatex."""
+    if transparent and _is_dvipng_fast_path_eligible(expr):
+        path = _DVIPNG_INLINE_PATH
+    elif not transparent and _DVIPNG_DOCUMENTS_ENABLED and _is_dvi_safe_document(expr):
+        path = _DVIPNG_DOCUMENT_PATH
+    else:
+        return None
+    if _FAST_PATH_BLOCKLIST.should_skip(fast_path_key(latex_code), _command_tokens(expr)):
+        return None
+    increment_counter("fast_path.attempts")
+    return path
+
+
+def _command_tokens(expr: str) -> set[str]:
+    return {
+        command
+        for command in map(_normalize_command_name, _COMMAND_TOKEN_RE.findall(expr))
+        if command
+    }
+
+
+def _blamed_commands(log_text: str, expr: str) -> set[str]:
+    """Commands TeX stopped on (the last one on each `l.<n>` context line) that the user wrote."""
+    used = _command_tokens(expr)
+    blamed = set()
+    for match in _ERROR_CONTEXT_RE.finditer(log_text):
+        commands = [
+            command
+            for command in map(_normalize_command_name, _COMMAND_TOKEN_RE.findall(match.group(1)))
+            if command and command not in _IGNORE_WRAPPER_COMMANDS
+        ]
+        if commands and commands[-1] in used:
+            blamed.add(commands[-1])
+    return blamed
+
+
+def _record_fast_path_failure(expr: str, latex_code: str, exc: Exception) -> None:
+    increment_counter("fast_path.failures")
+    # A timeout or an expired deadline reflects load, not the input.
+    if isinstance(exc, CompilationTimeoutError):
+        return
+    log_text = _normalize_error_log(exc)
+    _FAST_PATH_BLOCKLIST.record_failure(
+        fast_path_key(latex_code),
+        _blamed_commands(log_text, expr),
+    )
+
+
+def _document_dvipng_renderer(
+        cancel_token: CancellationToken | None = None,
+        deadline: float | None = None,
+) -> InlineDviPngRenderer:
+    return InlineDviPngRenderer(
+        format_cache=_DOCUMENT_FORMAT_CACHE,
+        cancel_token=cancel_token,
+        deadline=deadline,
+    )
+
+
+@contextmanager
+def _timed_render_path(path: str):
+    """Count successes and failures per render path, with their summed latency."""
+    started = time.monotonic()
+    try:
+        yield
+    except CompilationCancelledError:
+        raise
+    except Exception:
+        _record_render_path(path, "failure", started)
+        raise
+    _record_render_path(path, "success", started)
+
+
+def _record_render_path(path: str, outcome: str, started: float) -> None:
+    increment_counter(f"render.path.{path}.{outcome}")
+    increment_counter(
+        f"render.path.{path}.{outcome}_ms",
+        int((time.monotonic() - started) * 1000),
+    )
+
+
+def _log_fast_path_failure(
+        path: str,
+        exc: Exception,
+        output_file: str,
+        render_dpi: int,
+        expr: str,
+) -> None:
+    _logger.info(
+        "dvipng render failed path=%s output_file=%s dpi=%s expr_len=%s; retrying pdflatex",
+        path,
+        output_file,
+        render_dpi,
+        len(expr),
+    )
+    _logger.debug(
+        "dvipng raw compiler output output_file=%s\n%s",
+        output_file,
+        _normalize_error_log(exc),
+    )
+
+
+def _log_skipped_fallback(path: str, output_file: str, render_dpi: int, expr: str) -> None:
+    increment_counter("render.fallback_skipped_deadline")
+    _logger.info(
+        "dvipng render failed path=%s output_file=%s dpi=%s expr_len=%s; "
+        "render budget too small for pdflatex fallback",
+        path,
+        output_file,
+        render_dpi,
+        len(expr),
+    )
+
+
+async def _arender_png_request(
+        expr: str,
+        latex_code: str,
+        transparent: bool,
+        render_dpi: int,
+        output_file: str,
+        deadline: float | None = None,
+):
+    dvipng_path = _dvipng_render_path(expr, latex_code, transparent)
+    if dvipng_path is not None and _should_race(expr):
+        return await _arace_render_png_request(
+            expr, latex_code, transparent, render_dpi, dvipng_path, deadline
+        )
+    if dvipng_path is not None:
+        try:
+            png_data = await _arender_dvipng(
+                dvipng_path, latex_code, transparent, render_dpi, deadline
             )
-            _logger.debug(
-                "InlineDviPngRenderer raw compiler output output_file=%s\n%s",
-                output_file,
-                _normalize_error_log(exc),
+        except Exception as exc:
+            _record_fast_path_failure(expr, latex_code, exc)
+            if _fallback_budget_exhausted(deadline):
+                _log_skipped_fallback(dvipng_path, output_file, render_dpi, expr)
+                raise
+            _log_fast_path_failure(dvipng_path, exc, output_file, render_dpi, expr)
+        else:
+            _FAST_PATH_BLOCKLIST.record_success(_command_tokens(expr))
+            return png_data
+
+    return await _arender_pdflatex(latex_code, transparent, render_dpi, deadline)
+
+
+async def _arender_dvipng(
+        dvipng_path: str,
+        latex_code: str,
+        transparent: bool,
+        render_dpi: int,
+        deadline: float | None,
+):
+    with _timed_render_path(dvipng_path):
+        if dvipng_path == _DVIPNG_INLINE_PATH:
+            return await AsyncInlineDviPngRenderer(
+                format_cache=_INLINE_FORMAT_CACHE,
+                deadline=deadline,
+            ).acompile(
+                latex_code,
+                transparent=transparent,
+                dpi=render_dpi,
             )
+        return await AsyncInlineDviPngRenderer(
+            format_cache=_DOCUMENT_FORMAT_CACHE,
+            deadline=deadline,
+        ).acompile_pages(
+            latex_code,
+            transparent=transparent,
+            dpi=render_dpi,
+            first_page=1,
+            last_page=_page_limit(),
+        )
 
-    return Latex2PNG().compile(
-        latex_code,
-        transparent=transparent,
-        compiler='pdflatex',
-        dpi=render_dpi,
-    )
+
+async def _arender_pdflatex(
+        latex_code: str,
+        transparent: bool,
+        render_dpi: int,
+        deadline: float | None,
+):
+    with _timed_render_path(_PDFLATEX_PATH):
+        return await AsyncLatex2PNG(
+            format_cache=_DOCUMENT_FORMAT_CACHE,
+            deadline=deadline,
+        ).acompile(
+            latex_code,
+            transparent=transparent,
+            compiler='pdflatex',
+            dpi=render_dpi,
+            first_page=1,
+            last_page=_page_limit(),
+        )
+
+
+async def _arace_render_png_request(
+        expr: str,
+        latex_code: str,
+        transparent: bool,
+        render_dpi: int,
+        dvipng_path: str,
+        deadline: float | None,
+):
+    increment_counter("render.race.started")
+    tasks = {
+        asyncio.ensure_future(
+            _arender_dvipng(dvipng_path, latex_code, transparent, render_dpi, deadline)
+        ): dvipng_path,
+        asyncio.ensure_future(
+            _arender_pdflatex(latex_code, transparent, render_dpi, deadline)
+        ): _PDFLATEX_PATH,
+    }
+    errors: dict[str, BaseException] = {}
+    try:
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                path = tasks[task]
+                exc = task.exception()
+                if exc is not None:
+                    errors[path] = exc
+                    _record_race_leg_failure(path, expr, latex_code, exc)
+                    continue
+                _record_race_win(path, expr)
+                return task.result()
+        raise errors[_PDFLATEX_PATH]
+    finally:
+        # Cancelling a task kills its subprocess; wait so the loser is gone before returning.
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
 
 
 def _prepare_render_request(expr: str, dpi: int) -> RenderRequest:
@@ -786,14 +1826,19 @@ def _normalize_full_document(expr: str) -> str:
     return _normalize_full_document_with_line_map(expr)[0]
 
 
+_INLINE_PREAMBLE = (
+    r"\usepackage{amsmath}" "\n"
+    r"\usepackage{amssymb}" "\n"
+    r"\usepackage{amsfonts}" "\n"
+    r"\usepackage{xcolor}" "\n"
+    r"\definecolor{customtext}{HTML}{FFFFFF}" "\n"
+)
+
+
 def _build_inline_document_with_line_map(expr: str) -> tuple[str, dict[int, int]]:
     generated = (
         r"\documentclass[border=1mm]{standalone}" "\n"
-        r"\usepackage{amsmath}" "\n"
-        r"\usepackage{amssymb}" "\n"
-        r"\usepackage{amsfonts}" "\n"
-        r"\usepackage{xcolor}" "\n"
-        r"\definecolor{customtext}{HTML}{FFFFFF}" "\n"
+        f"{_INLINE_PREAMBLE}"
         r"\begin{document}" "\n"
         r"\color{customtext}" "\n"
         f"{expr}\n"
@@ -806,15 +1851,40 @@ def _build_inline_document(expr: str) -> str:
     return _build_inline_document_with_line_map(expr)[0]
 
 
-def _coerce_png_bytes(png_data: list[bytes] | bytes, output_file: str) -> bytes:
+def _build_batch_document(
+        render_requests: list[RenderRequest],
+) -> tuple[str, list[tuple[int, int, dict[int, int]]]]:
+    """One standalone page per inline request.
+
+    Also returns, per request, the generated lines it spans and their map back
+    to the user's lines, so a compile error can be pinned on one item.
+    """
+    lines = [
+        rf"\documentclass[border=1mm,multi={_BATCH_PAGE_ENV}]{{standalone}}",
+        *_INLINE_PREAMBLE.splitlines(),
+        rf"\newenvironment{{{_BATCH_PAGE_ENV}}}{{\color{{customtext}}}}{{}}",
+        r"\begin{document}",
+    ]
+    spans = []
+    for render_request in render_requests:
+        body = remove_superfluous(render_request.source_expr)
+        first_line = len(lines) + 1
+        lines.append(rf"\begin{{{_BATCH_PAGE_ENV}}}")
+        lines.extend(body.splitlines() or [""])
+        lines.append(rf"\end{{{_BATCH_PAGE_ENV}}}")
+        spans.append((first_line, len(lines), _offset_line_map(body, first_line + 1)))
+    lines.append(r"\end{document}")
+    return "\n".join(lines), spans
+
+
+def _coerce_png_pages(png_data: list[bytes] | bytes, output_file: str) -> list[bytes]:
     if isinstance(png_data, list):
-        try:
-            return b''.join(png_data)
-        except TypeError:
+        pages = [item for item in png_data if isinstance(item, bytes)]
+        if len(pages) != len(png_data):
             _logger.warning("png_data list contains non-bytes items output_file=%s", output_file)
-            return b''.join([item if isinstance(item, bytes) else b'' for item in png_data])
+        return pages
     if isinstance(png_data, bytes):
-        return png_data
+        return [png_data]
     raise TypeError("png_data is neither a list nor bytes.")
 
 
@@ -1,13 +1,27 @@
+import bisect
 import logging
 import os
+import queue
 import sqlite3
 import threading
 import time
+from collections.abc import Callable
+from dataclasses import dataclass
 from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
+from runtime_counters import increment_counter
 
-_VALID_STATUSES = {"success", "timeout", "compile_error", "internal_error", "queued", "rejected"}
+_VALID_STATUSES = {
+    "success",
+    "timeout",
+    "compile_error",
+    "internal_error",
+    "queued",
+    "rejected",
+    # Refused by per-user/per-guild admission control, as opposed to a full queue.
+    "rate_limited",
+}
 _DEFAULT_RETENTION_DAYS = 90
 _DEFAULT_MAX_SIZE_BYTES = 512 * 1024 * 1024
 _DEFAULT_MAINTENANCE_INTERVAL_SECONDS = 60
@@ -15,9 +29,78 @@ _PRUNE_BATCH_SIZE = 5000
 _MIN_RETENTION_DAYS = 1
 _MIN_MAX_SIZE_BYTES = 1024 * 1024
 _MIN_MAINTENANCE_INTERVAL_SECONDS = 1
+_DEFAULT_VACUUM_PAGES_PER_RUN = 2000
+_SQLITE_AUTO_VACUUM_INCREMENTAL = 2
+_DEFAULT_WRITER_QUEUE_SIZE = 10000
+_DEFAULT_WRITER_FLUSH_INTERVAL_MS = 500
+_DEFAULT_WRITER_BATCH_SIZE = 200
+_MS_PER_DAY = 24 * 60 * 60 * 1000
+# Events live in one table per UTC week, read through the `latex_events` view.
+_EVENT_PARTITION_PREFIX = "latex_events_p"
+_EVENT_PARTITION_DAYS = 7
+# Tables in the old text schema (ISO created_at, string source/status/user_id) are renamed
+# under this prefix; maintenance migrates their rows into the compact partitions.
+_LEGACY_EVENT_PARTITION = "latex_events_legacy"
+_LEGACY_MIGRATION_ROWS_PER_RUN = 50000
+_INSERT_LATEX_EVENT_SQL = """
+    INSERT INTO {table} (
+        id, created_at_ms, source_id, status_id, dpi, user_id, error_message, duration_ms, coalesced
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?);
+"""
+# The view keeps the text columns readers used before the compact schema, and adds
+# `created_at_ms` so new readers can range-scan and bucket on the integer index.
+_EVENT_SELECT_SQL = """
+    SELECT e.id,
+           strftime('%Y-%m-%dT%H:%M:%S+00:00', e.created_at_ms / 1000, 'unixepoch') AS created_at,
+           src.name AS source,
+           st.name AS status,
+           e.dpi,
+           CAST(e.user_id AS TEXT) AS user_id,
+           e.error_message,
+           e.duration_ms,
+           e.coalesced,
+           e.created_at_ms
+    FROM {table} AS e
+    JOIN latex_event_sources AS src ON src.id = e.source_id
+    JOIN latex_event_statuses AS st ON st.id = e.status_id
+"""
+_LEGACY_CREATED_AT_MS_SQL = "CAST(strftime('%s', created_at) AS INTEGER) * 1000"
+_LEGACY_EVENT_SELECT_SQL = f"""
+    SELECT id, created_at, source, status, dpi, user_id, error_message, duration_ms, coalesced,
+           {_LEGACY_CREATED_AT_MS_SQL} AS created_at_ms
+    FROM {{table}}
+"""
+# Per-bucket aggregates the dashboard reads instead of scanning raw events. Each granularity
+# has a (bucket, source, status) table and a latency histogram for percentiles.
+_ROLLUP_PREFIX = "latex_event_rollups"
+_LATENCY_ROLLUP_PREFIX = "latex_event_latency"
+_ROLLUP_WIDTHS_MS = (("hourly", 60 * 60 * 1000), ("daily", _MS_PER_DAY))
+# Histogram bucket edges grow by 25%, from 5ms to several minutes.
+_LATENCY_BOUNDS_MS = tuple(sorted({int(5 * 1.25 ** exponent) for exponent in range(50)}))
+_UPSERT_ROLLUP_SQL = """
+    INSERT INTO {table} (
+        bucket_ms, source_id, status_id, events, coalesced,
+        duration_count, duration_sum, duration_max
+    )
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (bucket_ms, source_id, status_id) DO UPDATE SET
+        events = events + excluded.events,
+        coalesced = coalesced + excluded.coalesced,
+        duration_count = duration_count + excluded.duration_count,
+        duration_sum = duration_sum + excluded.duration_sum,
+        duration_max = MAX(duration_max, excluded.duration_max);
+"""
+_UPSERT_LATENCY_ROLLUP_SQL = """
+    INSERT INTO {table} (bucket_ms, lower_ms, upper_ms, events)
+    VALUES (?, ?, ?, ?)
+    ON CONFLICT (bucket_ms, lower_ms) DO UPDATE SET events = events + excluded.events;
+"""
+_INSERT_COUNTER_SQL = """
+    INSERT INTO runtime_counters (created_at, name, value)
+    VALUES (?, ?, ?);
+"""
 _LOGGER = logging.getLogger(__name__)
-_MAINTENANCE_STATE_LOCK = threading.Lock()
-_LAST_MAINTENANCE_RUN_MONOTONIC: dict[str, float] = {}
 
 
 def _utc_now_iso() -> str:
@@ -28,6 +111,23 @@ def _utc_cutoff_iso(days: int) -> str:
     return (datetime.now(timezone.utc) - timedelta(days=days)).isoformat(timespec="seconds")
 
 
+def _utc_now_ms() -> int:
+    return time.time_ns() // 1_000_000
+
+
+def _iso_to_epoch_ms(value: str) -> int | None:
+    candidate = value.strip()
+    if candidate.endswith("Z"):
+        candidate = f"{candidate[:-1]}+00:00"
+    try:
+        parsed = datetime.fromisoformat(candidate)
+    except ValueError:
+        return None
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return int(parsed.timestamp() * 1000)
+
+
 def _read_positive_int_env(var_name: str, default_value: int, minimum: int) -> int:
     raw_value = os.getenv(var_name)
     if raw_value is None:
@@ -65,72 +165,595 @@ def _get_maintenance_interval_seconds() -> int:
     )
 
 
-def _metrics_storage_size_bytes(db_path: str) -> int:
-    paths = (Path(db_path), Path(f"{db_path}-wal"), Path(f"{db_path}-shm"))
-    total = 0
-    for path in paths:
-        try:
-            total += path.stat().st_size
-        except FileNotFoundError:
-            continue
-    return total
+def _get_vacuum_pages_per_run() -> int:
+    return _read_positive_int_env(
+        "METRICS_VACUUM_PAGES_PER_RUN",
+        _DEFAULT_VACUUM_PAGES_PER_RUN,
+        1,
+    )
+
+
+def _pragma_int(conn: sqlite3.Connection, pragma: str) -> int:
+    return int(conn.execute(f"PRAGMA {pragma};").fetchone()[0])
+
+
+def _live_size_bytes(conn: sqlite3.Connection) -> int:
+    """Bytes held by live pages; free pages awaiting incremental vacuum do not count."""
+    live_pages = _pragma_int(conn, "page_count") - _pragma_int(conn, "freelist_count")
+    return live_pages * _pragma_int(conn, "page_size")
+
+
+def _delete_oldest_batch(
+    conn: sqlite3.Connection,
+    table: str,
+    time_column: str,
+    batch_size: int,
+) -> int:
+    cursor = conn.execute(
+        f"""
+        DELETE FROM {table}
+        WHERE id IN (
+            SELECT id
+            FROM {table}
+            ORDER BY {time_column} ASC, id ASC
+            LIMIT ?
+        );
+        """,
+        (batch_size,),
+    )
+    return int(cursor.rowcount or 0)
 
 
-def _delete_oldest_batch(conn: sqlite3.Connection, batch_size: int) -> int:
+def _oldest_counter_ms(conn: sqlite3.Connection) -> int | None:
+    oldest = conn.execute("SELECT MIN(created_at) FROM runtime_counters;").fetchone()[0]
+    return None if oldest is None else _iso_to_epoch_ms(oldest)
+
+
+def _delete_oldest_counter_batch(conn: sqlite3.Connection, before_ms: int, batch_size: int) -> int:
+    before = datetime.fromtimestamp(before_ms / 1000, tz=timezone.utc).isoformat(timespec="seconds")
     cursor = conn.execute(
         """
-        DELETE FROM latex_events
+        DELETE FROM runtime_counters
         WHERE id IN (
             SELECT id
-            FROM latex_events
+            FROM runtime_counters
+            WHERE created_at < ?
             ORDER BY created_at ASC, id ASC
             LIMIT ?
         );
         """,
-        (batch_size,),
+        (before, batch_size),
     )
     return int(cursor.rowcount or 0)
 
 
-def _run_metrics_maintenance(db_path: str) -> None:
-    retention_days = _get_retention_days()
+@dataclass(frozen=True)
+class MaintenanceReport:
+    duration_ms: int
+    deleted_rows: int
+    dropped_partitions: int
+    migrated_rows: int
+    vacuumed_pages: int
+    size_bytes: int
+
+
+def run_metrics_maintenance(db_path: str) -> MaintenanceReport:
+    """Apply retention and the size cap, then hand free pages back to the OS.
+
+    Meant for a background task, since it can hold the write lock for a while.
+    Weekly event partitions that fall entirely outside the retention window
+    (or are the oldest while over the size cap) are dropped whole; rows are
+    only deleted one by one from the partition straddling the cutoff and
+    from legacy tables. The size cap prunes old counter snapshots alongside
+    old partitions, oldest first, but never the current week's partition; if
+    that alone exceeds the cap, the run logs a warning and stops. Each run
+    also moves up to `_LEGACY_MIGRATION_ROWS_PER_RUN` legacy rows into
+    compact partitions.
+    The size cap counts live pages, and free pages are released with
+    `incremental_vacuum` in budgets of METRICS_VACUUM_PAGES_PER_RUN, so a run
+    never rewrites the whole file (except once, to switch an old database to
+    incremental auto-vacuum).
+    """
+    started = time.monotonic()
     max_size_bytes = _get_max_size_bytes()
-    retention_cutoff = _utc_cutoff_iso(retention_days)
+    retention_cutoff = _utc_cutoff_iso(_get_retention_days())
+    retention_cutoff_ms = _iso_to_epoch_ms(retention_cutoff)
 
     with sqlite3.connect(db_path) as conn:
-        conn.execute(
-            "DELETE FROM latex_events WHERE created_at < ?;",
+        _ensure_incremental_auto_vacuum(conn, db_path)
+        dropped_partitions = 0
+        deleted_rows = 0
+        # The newest partition is never dropped; it carries the id sequence forward.
+        for name in _event_partitions(conn)[:-1]:
+            if _event_partition_end_ms(name) <= retention_cutoff_ms:
+                _drop_event_table(conn, name)
+                dropped_partitions += 1
+        for name in _event_partitions(conn):
+            if _event_partition_start_ms(name) >= retention_cutoff_ms:
+                break
+            deleted_rows += conn.execute(
+                f"DELETE FROM {name} WHERE created_at_ms < ?;",
+                (retention_cutoff_ms,),
+            ).rowcount
+        for name in _legacy_event_tables(conn):
+            deleted_rows += conn.execute(
+                f"DELETE FROM {name} WHERE created_at < ?;",
+                (retention_cutoff,),
+            ).rowcount
+        deleted_rows += conn.execute(
+            "DELETE FROM runtime_counters WHERE created_at < ?;",
             (retention_cutoff,),
-        )
+        ).rowcount
+        # Same transaction as the deletes, so rollups never count pruned events.
+        _prune_rollups_before(conn, retention_cutoff_ms)
         conn.commit()
 
-        current_size = _metrics_storage_size_bytes(db_path)
-        if current_size <= max_size_bytes:
-            return
+        migrated_rows, drained_tables = _migrate_legacy_events(conn, _LEGACY_MIGRATION_ROWS_PER_RUN)
+        dropped_partitions += drained_tables
 
-        while current_size > max_size_bytes:
-            deleted_rows = _delete_oldest_batch(conn, _PRUNE_BATCH_SIZE)
-            conn.commit()
+        while _live_size_bytes(conn) > max_size_bytes:
+            legacy_tables = _legacy_event_tables(conn)
+            if legacy_tables:
+                oldest = legacy_tables[0]
+                batch_start_ms, batch_end_ms = conn.execute(
+                    f"""
+                    SELECT MIN(batch_ms), MAX(batch_ms)
+                    FROM (
+                        SELECT {_LEGACY_CREATED_AT_MS_SQL} AS batch_ms
+                        FROM {oldest}
+                        ORDER BY created_at ASC, id ASC
+                        LIMIT ?
+                    );
+                    """,
+                    (_PRUNE_BATCH_SIZE,),
+                ).fetchone()
+                batch_rows = _delete_oldest_batch(conn, oldest, "created_at", _PRUNE_BATCH_SIZE)
+                if batch_start_ms is not None:
+                    _recompute_rollups(conn, batch_start_ms, batch_end_ms)
+                conn.commit()
+                deleted_rows += batch_rows
+                if batch_rows <= 0:
+                    _drop_event_table(conn, oldest)
+                    conn.commit()
+                    dropped_partitions += 1
+                continue
 
+            # Older partitions and counter rows go oldest first. The current
+            # partition, and counters written since it began, are kept even over the cap.
+            partitions = _event_partitions(conn)
+            kept_from_ms = _event_partition_start_ms(partitions[-1]) if partitions else _utc_now_ms()
+            oldest_counter_ms = _oldest_counter_ms(conn)
+            if oldest_counter_ms is not None and oldest_counter_ms < min(
+                kept_from_ms,
+                _event_partition_start_ms(partitions[0]) if len(partitions) > 1 else kept_from_ms,
+            ):
+                deleted_rows += _delete_oldest_counter_batch(conn, kept_from_ms, _PRUNE_BATCH_SIZE)
+                conn.commit()
+            elif len(partitions) > 1:
+                oldest = partitions[0]
+                _drop_event_table(conn, oldest)
+                _recompute_rollups(
+                    conn,
+                    _event_partition_start_ms(oldest),
+                    _event_partition_end_ms(oldest) - 1,
+                )
+                conn.commit()
+                dropped_partitions += 1
+            else:
+                _LOGGER.warning(
+                    "Metrics database still over the size cap with only the current partition "
+                    "left path=%s max_size_bytes=%s",
+                    db_path,
+                    max_size_bytes,
+                )
+                break
+
+        free_pages = _pragma_int(conn, "freelist_count")
+        # execute() would step this pragma once and free a single page; a script runs it to the end.
+        conn.executescript(f"PRAGMA incremental_vacuum({_get_vacuum_pages_per_run()});")
+        vacuumed_pages = free_pages - _pragma_int(conn, "freelist_count")
+        if vacuumed_pages:
             conn.execute("PRAGMA wal_checkpoint(TRUNCATE);")
-            conn.execute("VACUUM;")
-            current_size = _metrics_storage_size_bytes(db_path)
+        size_bytes = _live_size_bytes(conn)
+
+    report = MaintenanceReport(
+        duration_ms=int((time.monotonic() - started) * 1000),
+        deleted_rows=max(0, deleted_rows),
+        dropped_partitions=dropped_partitions,
+        migrated_rows=migrated_rows,
+        vacuumed_pages=vacuumed_pages,
+        size_bytes=size_bytes,
+    )
+    increment_counter("metrics_maintenance.runs")
+    increment_counter("metrics_maintenance.ms", report.duration_ms)
+    increment_counter("metrics_maintenance.deleted_rows", report.deleted_rows)
+    increment_counter("metrics_maintenance.dropped_partitions", report.dropped_partitions)
+    increment_counter("metrics_maintenance.migrated_rows", report.migrated_rows)
+    increment_counter("metrics_maintenance.vacuumed_pages", report.vacuumed_pages)
+    _LOGGER.info(
+        "Metrics maintenance finished path=%s duration_ms=%s deleted_rows=%s "
+        "dropped_partitions=%s migrated_rows=%s vacuumed_pages=%s size_bytes=%s",
+        db_path,
+        report.duration_ms,
+        report.deleted_rows,
+        report.dropped_partitions,
+        report.migrated_rows,
+        report.vacuumed_pages,
+        report.size_bytes,
+    )
+    return report
+
+
+def _event_partition_name(created_at_ms: int) -> str:
+    day = datetime.fromtimestamp(created_at_ms / 1000, tz=timezone.utc).date()
+    week_start = day - timedelta(days=day.weekday())
+    return f"{_EVENT_PARTITION_PREFIX}{week_start:%Y%m%d}"
+
+
+def _event_partition_start_ms(name: str) -> int:
+    """Inclusive lower bound of a weekly partition in epoch milliseconds."""
+    start = datetime.strptime(name[len(_EVENT_PARTITION_PREFIX):], "%Y%m%d")
+    return int(start.replace(tzinfo=timezone.utc).timestamp() * 1000)
+
+
+def _event_partition_end_ms(name: str) -> int:
+    return _event_partition_start_ms(name) + _EVENT_PARTITION_DAYS * _MS_PER_DAY
+
+
+def _event_tables(conn: sqlite3.Connection, pattern: str) -> list[str]:
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ? ORDER BY name;",
+        (pattern,),
+    ).fetchall()
+    return [row[0] for row in rows]
+
+
+def _event_partitions(conn: sqlite3.Connection) -> list[str]:
+    """Compact weekly partitions, oldest first."""
+    return _event_tables(conn, f"{_EVENT_PARTITION_PREFIX}[0-9]*")
+
+
+def _legacy_event_tables(conn: sqlite3.Connection) -> list[str]:
+    """Tables still in the text schema, waiting to be migrated or to age out."""
+    return _event_tables(conn, f"{_LEGACY_EVENT_PARTITION}*")
+
+
+def _has_column(conn: sqlite3.Connection, table: str, column: str) -> bool:
+    return any(row[1] == column for row in conn.execute(f"PRAGMA table_info({table});").fetchall())
+
+
+def _begin_if_needed(conn: sqlite3.Connection) -> None:
+    # sqlite3 only opens transactions implicitly for DML; partition DDL must not autocommit
+    # halfway, or readers could see a view that names a missing table.
+    if not conn.in_transaction:
+        conn.execute("BEGIN;")
+
+
+def _rebuild_events_view(conn: sqlite3.Connection) -> None:
+    selects = [_LEGACY_EVENT_SELECT_SQL.format(table=name) for name in _legacy_event_tables(conn)]
+    selects += [_EVENT_SELECT_SQL.format(table=name) for name in _event_partitions(conn)]
+    conn.execute("DROP VIEW IF EXISTS latex_events;")
+    conn.execute(f"CREATE VIEW latex_events AS {' UNION ALL '.join(selects)};")
+
+
+def _create_event_partition(conn: sqlite3.Connection, name: str) -> None:
+    conn.execute(
+        f"""
+        CREATE TABLE IF NOT EXISTS {name} (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            created_at_ms INTEGER NOT NULL,
+            source_id INTEGER NOT NULL,
+            status_id INTEGER NOT NULL,
+            dpi INTEGER,
+            user_id INTEGER,
+            error_message TEXT,
+            duration_ms INTEGER,
+            coalesced INTEGER NOT NULL DEFAULT 0
+        );
+        """
+    )
+    conn.execute(
+        f"""
+        CREATE INDEX IF NOT EXISTS idx_{name}_created_at_ms
+        ON {name}(created_at_ms, status_id, source_id);
+        """
+    )
+
+
+def _ensure_event_partition(conn: sqlite3.Connection, name: str) -> None:
+    exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;",
+        (name,),
+    ).fetchone()
+    if exists:
+        return
+    _begin_if_needed(conn)
+    _create_event_partition(conn, name)
+    _rebuild_events_view(conn)
+
+
+def _drop_event_table(conn: sqlite3.Connection, name: str) -> None:
+    """Drop an event table and take it out of the view; the caller commits."""
+    _begin_if_needed(conn)
+    conn.execute(f"DROP TABLE {name};")
+    _rebuild_events_view(conn)
+
+
+def _next_event_id(conn: sqlite3.Connection) -> int:
+    # Ids stay unique across partitions so the view can still be ordered and paged by id.
+    # Take the write lock before reading the sequence: another connection could otherwise
+    # read the same MAX(seq) and insert the same id. A transaction already open here has
+    # written (sqlite3 only opens them for DML or our own BEGIN), so it holds the lock.
+    if not conn.in_transaction:
+        conn.execute("BEGIN IMMEDIATE;")
+    row = conn.execute(
+        "SELECT MAX(seq) FROM sqlite_sequence WHERE name GLOB 'latex_events_*';"
+    ).fetchone()
+    return int(row[0] or 0) + 1
+
+
+def _label_ids(conn: sqlite3.Connection, table: str, names: set[str]) -> dict[str, int]:
+    conn.executemany(f"INSERT OR IGNORE INTO {table} (name) VALUES (?);", [(name,) for name in names])
+    return dict(conn.execute(f"SELECT name, id FROM {table};").fetchall())
+
+
+def _write_event_rows(conn: sqlite3.Connection, rows: list[tuple], rollup: bool = True) -> None:
+    """Insert `(id, created_at_ms, source, status, ...)` rows into their partitions.
+
+    With `rollup` the rows are folded into the rollup tables in the same
+    transaction, so the dashboard never sees one without the other.
+    """
+    source_ids = _label_ids(conn, "latex_event_sources", {row[2] for row in rows})
+    status_ids = _label_ids(conn, "latex_event_statuses", {row[3] for row in rows})
+    rows_by_partition: dict[str, list[tuple]] = {}
+    rollup_rows = []
+    for event_id, created_at_ms, source, status, dpi, user_id, error_message, duration_ms, coalesced in rows:
+        rows_by_partition.setdefault(_event_partition_name(created_at_ms), []).append(
+            (
+                event_id,
+                created_at_ms,
+                source_ids[source],
+                status_ids[status],
+                dpi,
+                user_id,
+                error_message,
+                duration_ms,
+                coalesced,
+            )
+        )
+        rollup_rows.append(
+            (created_at_ms, source_ids[source], status_ids[status], status, duration_ms, coalesced)
+        )
+    for name, partition_rows in rows_by_partition.items():
+        _ensure_event_partition(conn, name)
+        conn.executemany(_INSERT_LATEX_EVENT_SQL.format(table=name), partition_rows)
+    if rollup:
+        _add_to_rollups(conn, rollup_rows)
+
+
+def _insert_latex_event_rows(conn: sqlite3.Connection, rows: list[tuple]) -> None:
+    """Insert event rows into their weekly partitions; the caller commits."""
+    first_id = _next_event_id(conn)
+    _write_event_rows(conn, [(first_id + offset, *row) for offset, row in enumerate(rows)])
+
+
+def _legacy_user_id(raw_value: str | None) -> int | None:
+    if raw_value is None or not str(raw_value).isdigit():
+        return None
+    return int(raw_value)
+
+
+def _migrate_legacy_events(conn: sqlite3.Connection, max_rows: int) -> tuple[int, int]:
+    """Move up to `max_rows` legacy rows into compact partitions, keeping their ids.
 
-            if deleted_rows <= 0:
+    Each batch is inserted and deleted in one transaction, so readers of the
+    view see every row exactly once while the migration is under way.
+    Returns (rows migrated, legacy tables drained and dropped).
+    """
+    migrated_rows = 0
+    drained_tables = 0
+    for table in _legacy_event_tables(conn):
+        while migrated_rows < max_rows:
+            rows = conn.execute(
+                f"""
+                SELECT id, created_at, source, status, dpi, user_id,
+                       error_message, duration_ms, coalesced
+                FROM {table}
+                ORDER BY id ASC
+                LIMIT ?;
+                """,
+                (min(_PRUNE_BATCH_SIZE, max_rows - migrated_rows),),
+            ).fetchall()
+            if not rows:
+                _drop_event_table(conn, table)
+                conn.commit()
+                drained_tables += 1
                 break
+            converted = []
+            for event_id, created_at, source, status, dpi, user_id, *rest in rows:
+                created_at_ms = _iso_to_epoch_ms(created_at)
+                if created_at_ms is None:
+                    # The dashboard never showed rows it could not date; there is nothing to keep.
+                    continue
+                converted.append(
+                    (event_id, created_at_ms, source, status, dpi, _legacy_user_id(user_id), *rest)
+                )
+            _begin_if_needed(conn)
+            # Legacy rows were counted when the rollups were backfilled; moving them changes nothing.
+            _write_event_rows(conn, converted, rollup=False)
+            conn.execute(f"DELETE FROM {table} WHERE id <= ?;", (rows[-1][0],))
+            conn.commit()
+            migrated_rows += len(rows)
+        if migrated_rows >= max_rows:
+            break
+    return migrated_rows, drained_tables
+
+
+def _latency_bucket(duration_ms: int) -> tuple[int, int | None]:
+    index = bisect.bisect_right(_LATENCY_BOUNDS_MS, duration_ms)
+    lower = _LATENCY_BOUNDS_MS[index - 1] if index else 0
+    upper = _LATENCY_BOUNDS_MS[index] if index < len(_LATENCY_BOUNDS_MS) else None
+    return lower, upper
+
+
+def _latency_case_sql(column: str, bound: str) -> str:
+    """SQL twin of `_latency_bucket`, so rollups can be rebuilt without leaving SQLite."""
+    branches = " ".join(
+        f"WHEN {column} < {upper} THEN {lower if bound == 'lower' else upper}"
+        for lower, upper in zip((0, *_LATENCY_BOUNDS_MS), _LATENCY_BOUNDS_MS)
+    )
+    overflow = _LATENCY_BOUNDS_MS[-1] if bound == "lower" else "NULL"
+    return f"CASE {branches} ELSE {overflow} END"
+
+
+def _create_rollup_tables(conn: sqlite3.Connection) -> bool:
+    """Create the rollup tables; True when they did not exist yet and need a backfill."""
+    existed = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = ?;",
+        (f"{_ROLLUP_PREFIX}_{_ROLLUP_WIDTHS_MS[-1][0]}",),
+    ).fetchone()
+    for granularity, _width_ms in _ROLLUP_WIDTHS_MS:
+        conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {_ROLLUP_PREFIX}_{granularity} (
+                bucket_ms INTEGER NOT NULL,
+                source_id INTEGER NOT NULL,
+                status_id INTEGER NOT NULL,
+                events INTEGER NOT NULL,
+                coalesced INTEGER NOT NULL,
+                duration_count INTEGER NOT NULL,
+                duration_sum INTEGER NOT NULL,
+                duration_max INTEGER NOT NULL,
+                PRIMARY KEY (bucket_ms, source_id, status_id)
+            ) WITHOUT ROWID;
+            """
+        )
+        conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {_LATENCY_ROLLUP_PREFIX}_{granularity} (
+                bucket_ms INTEGER NOT NULL,
+                lower_ms INTEGER NOT NULL,
+                upper_ms INTEGER,
+                events INTEGER NOT NULL,
+                PRIMARY KEY (bucket_ms, lower_ms)
+            ) WITHOUT ROWID;
+            """
+        )
+    return existed is None
+
+
+def _add_to_rollups(conn: sqlite3.Connection, rows: list[tuple]) -> None:
+    """Fold `(created_at_ms, source_id, status_id, status, duration_ms, coalesced)` rows in."""
+    for granularity, width_ms in _ROLLUP_WIDTHS_MS:
+        totals: dict[tuple[int, int, int], list[int]] = {}
+        latency: dict[tuple[int, int, int | None], int] = {}
+        for created_at_ms, source_id, status_id, status, duration_ms, coalesced in rows:
+            bucket_ms = created_at_ms // width_ms * width_ms
+            total = totals.setdefault((bucket_ms, source_id, status_id), [0, 0, 0, 0, 0])
+            total[0] += 1
+            total[1] += coalesced
+            if duration_ms is not None:
+                total[2] += 1
+                total[3] += duration_ms
+                total[4] = max(total[4], duration_ms)
+                if status != "queued":
+                    key = (bucket_ms, *_latency_bucket(duration_ms))
+                    latency[key] = latency.get(key, 0) + 1
+        conn.executemany(
+            _UPSERT_ROLLUP_SQL.format(table=f"{_ROLLUP_PREFIX}_{granularity}"),
+            [(*key, *total) for key, total in totals.items()],
+        )
+        conn.executemany(
+            _UPSERT_LATENCY_ROLLUP_SQL.format(table=f"{_LATENCY_ROLLUP_PREFIX}_{granularity}"),
+            [(*key, events) for key, events in latency.items()],
+        )
+
+
+def _recompute_rollups(conn: sqlite3.Connection, start_ms: int, end_ms: int) -> None:
+    """Rebuild every rollup bucket touching [start_ms, end_ms] from the raw events.
+
+    Maintenance calls this after deleting raw rows, so the rollups never count
+    events that retention or the size cap has removed. The caller commits.
+    """
+    _begin_if_needed(conn)
+    if _legacy_event_tables(conn):
+        # Legacy rows carry names the lookup tables may not have seen yet.
+        for table, column in (("latex_event_sources", "source"), ("latex_event_statuses", "status")):
+            conn.execute(
+                f"""
+                INSERT OR IGNORE INTO {table} (name)
+                SELECT DISTINCT {column} FROM latex_events
+                WHERE created_at_ms >= ? AND created_at_ms <= ?;
+                """,
+                (start_ms, end_ms),
+            )
+    lower_sql = _latency_case_sql("v.duration_ms", "lower")
+    upper_sql = _latency_case_sql("v.duration_ms", "upper")
+    for granularity, width_ms in _ROLLUP_WIDTHS_MS:
+        first_bucket = start_ms // width_ms * width_ms
+        end_bucket = end_ms // width_ms * width_ms + width_ms
+        rollup_table = f"{_ROLLUP_PREFIX}_{granularity}"
+        latency_table = f"{_LATENCY_ROLLUP_PREFIX}_{granularity}"
+        for table in (rollup_table, latency_table):
+            conn.execute(
+                f"DELETE FROM {table} WHERE bucket_ms >= ? AND bucket_ms < ?;",
+                (first_bucket, end_bucket),
+            )
+        conn.execute(
+            f"""
+            INSERT INTO {rollup_table} (
+                bucket_ms, source_id, status_id, events, coalesced,
+                duration_count, duration_sum, duration_max
+            )
+            SELECT v.created_at_ms / {width_ms} * {width_ms}, src.id, st.id, COUNT(*),
+                   SUM(v.coalesced), COUNT(v.duration_ms),
+                   COALESCE(SUM(v.duration_ms), 0), COALESCE(MAX(v.duration_ms), 0)
+            FROM latex_events AS v
+            JOIN latex_event_sources AS src ON src.name = v.source
+            JOIN latex_event_statuses AS st ON st.name = v.status
+            WHERE v.created_at_ms >= ? AND v.created_at_ms < ?
+            GROUP BY 1, 2, 3;
+            """,
+            (first_bucket, end_bucket),
+        )
+        conn.execute(
+            f"""
+            INSERT INTO {latency_table} (bucket_ms, lower_ms, upper_ms, events)
+            SELECT v.created_at_ms / {width_ms} * {width_ms}, {lower_sql}, {upper_sql}, COUNT(*)
+            FROM latex_events AS v
+            WHERE v.created_at_ms >= ? AND v.created_at_ms < ?
+              AND v.status != 'queued'
+              AND v.duration_ms IS NOT NULL
+              AND v.duration_ms >= 0
+            GROUP BY 1, 2;
+            """,
+            (first_bucket, end_bucket),
+        )
+
 
+def _prune_rollups_before(conn: sqlite3.Connection, cutoff_ms: int) -> None:
+    """Drop rollups for buckets whose raw rows are all gone; rebuild the one holding the cutoff."""
+    _begin_if_needed(conn)
+    for granularity, width_ms in _ROLLUP_WIDTHS_MS:
+        for prefix in (_ROLLUP_PREFIX, _LATENCY_ROLLUP_PREFIX):
+            conn.execute(
+                f"DELETE FROM {prefix}_{granularity} WHERE bucket_ms < ?;",
+                (cutoff_ms // width_ms * width_ms,),
+            )
+    _recompute_rollups(conn, cutoff_ms, cutoff_ms)
 
-def _should_run_throttled_maintenance(db_path: str) -> bool:
-    interval_seconds = _get_maintenance_interval_seconds()
-    db_key = str(Path(db_path))
-    now_monotonic = time.monotonic()
 
-    with _MAINTENANCE_STATE_LOCK:
-        previous = _LAST_MAINTENANCE_RUN_MONOTONIC.get(db_key)
-        if previous is not None and (now_monotonic - previous) < interval_seconds:
-            return False
-        _LAST_MAINTENANCE_RUN_MONOTONIC[db_key] = now_monotonic
-        return True
+def _insert_counter_rows(conn: sqlite3.Connection, rows: list[tuple]) -> None:
+    conn.executemany(_INSERT_COUNTER_SQL, rows)
+
+
+def _ensure_incremental_auto_vacuum(conn: sqlite3.Connection, db_path: str) -> None:
+    if _pragma_int(conn, "auto_vacuum") == _SQLITE_AUTO_VACUUM_INCREMENTAL:
+        return
+    # Files created before incremental auto-vacuum need one full rebuild to switch.
+    _LOGGER.info("Switching metrics database to incremental auto-vacuum path=%s", db_path)
+    conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
+    conn.execute("VACUUM;")
 
 
 def init_metrics_db(db_path: str) -> None:
@@ -139,50 +762,71 @@ def init_metrics_db(db_path: str) -> None:
         path.parent.mkdir(parents=True, exist_ok=True)
 
     with sqlite3.connect(path) as conn:
+        # Only takes effect on a new file; run_metrics_maintenance converts old ones.
+        conn.execute("PRAGMA auto_vacuum=INCREMENTAL;")
         conn.execute("PRAGMA journal_mode=WAL;")
         conn.execute("PRAGMA synchronous=NORMAL;")
+        events_type = conn.execute(
+            "SELECT type FROM sqlite_master WHERE name = 'latex_events';"
+        ).fetchone()
+        conn.execute("BEGIN;")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS latex_event_sources (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS latex_event_statuses (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE);"
+        )
+        if events_type is not None and events_type[0] == "table":
+            # Renaming is O(1); the old rows stay readable through the view while they migrate.
+            existing_columns = {
+                row[1]
+                for row in conn.execute("PRAGMA table_info(latex_events);").fetchall()
+            }
+            if "duration_ms" not in existing_columns:
+                conn.execute("ALTER TABLE latex_events ADD COLUMN duration_ms INTEGER;")
+            if "coalesced" not in existing_columns:
+                conn.execute("ALTER TABLE latex_events ADD COLUMN coalesced INTEGER NOT NULL DEFAULT 0;")
+            conn.execute(f"ALTER TABLE latex_events RENAME TO {_LEGACY_EVENT_PARTITION};")
+        else:
+            conn.execute("DROP VIEW IF EXISTS latex_events;")
+        # Weekly partitions written before the compact schema join the legacy tables.
+        for name in _event_partitions(conn):
+            if not _has_column(conn, name, "created_at_ms"):
+                legacy_name = name.replace(_EVENT_PARTITION_PREFIX, f"{_LEGACY_EVENT_PARTITION}_p", 1)
+                conn.execute(f"ALTER TABLE {name} RENAME TO {legacy_name};")
+        _create_event_partition(conn, _event_partition_name(_utc_now_ms()))
+        _rebuild_events_view(conn)
+        if _create_rollup_tables(conn):
+            # One-off backfill from the events already stored; afterwards every write keeps them current.
+            first_ms, last_ms = conn.execute(
+                "SELECT MIN(created_at_ms), MAX(created_at_ms) FROM latex_events;"
+            ).fetchone()
+            if first_ms is not None:
+                _recompute_rollups(conn, first_ms, last_ms)
         conn.execute(
             """
-            CREATE TABLE IF NOT EXISTS latex_events (
+            CREATE TABLE IF NOT EXISTS runtime_counters (
                 id INTEGER PRIMARY KEY AUTOINCREMENT,
                 created_at TEXT NOT NULL,
-                source TEXT NOT NULL,
-                status TEXT NOT NULL,
-                dpi INTEGER,
-                user_id TEXT,
-                error_message TEXT,
-                duration_ms INTEGER
+                name TEXT NOT NULL,
+                value INTEGER NOT NULL
             );
             """
         )
-        existing_columns = {
-            row[1]
-            for row in conn.execute("PRAGMA table_info(latex_events);").fetchall()
-        }
-        if "duration_ms" not in existing_columns:
-            conn.execute("ALTER TABLE latex_events ADD COLUMN duration_ms INTEGER;")
-        conn.execute(
-            "CREATE INDEX IF NOT EXISTS idx_latex_events_created_at ON latex_events(created_at);"
-        )
         conn.execute(
             """
-            CREATE INDEX IF NOT EXISTS idx_latex_events_created_at_status
-            ON latex_events(created_at, status);
+            CREATE INDEX IF NOT EXISTS idx_runtime_counters_name_created_at
+            ON runtime_counters(name, created_at);
             """
         )
         conn.execute(
             """
-            CREATE INDEX IF NOT EXISTS idx_latex_events_created_at_source
-            ON latex_events(created_at, source);
+            CREATE INDEX IF NOT EXISTS idx_runtime_counters_created_at
+            ON runtime_counters(created_at);
             """
         )
         conn.commit()
 
-    try:
-        _run_metrics_maintenance(str(path))
-    except sqlite3.Error:
-        _LOGGER.exception("Metrics maintenance failed during db init path=%s", path)
-
 
 def record_latex_event(
     db_path: str,
@@ -192,7 +836,28 @@ def record_latex_event(
     user_id: int | None,
     error_message: str | None = None,
     duration_ms: int | None = None,
+    coalesced: bool = False,
 ) -> None:
+    """Store one LaTeX request outcome.
+
+    `coalesced` marks requests that shared another in-flight request's compile.
+    """
+    row = _latex_event_row(source, status, dpi, user_id, error_message, duration_ms, coalesced)
+
+    with sqlite3.connect(db_path) as conn:
+        _insert_latex_event_rows(conn, [row])
+        conn.commit()
+
+
+def _latex_event_row(
+    source: str,
+    status: str,
+    dpi: int | None,
+    user_id: int | None,
+    error_message: str | None,
+    duration_ms: int | None,
+    coalesced: bool,
+) -> tuple:
     if status not in _VALID_STATUSES:
         raise ValueError(f"Invalid status '{status}'")
 
@@ -200,28 +865,169 @@ def record_latex_event(
     if duration_ms is not None:
         normalized_duration_ms = max(0, int(duration_ms))
 
+    return (
+        _utc_now_ms(),
+        source,
+        status,
+        dpi,
+        int(user_id) if user_id is not None else None,
+        (error_message or "")[:500] or None,
+        normalized_duration_ms,
+        1 if coalesced else 0,
+    )
+
+
+def record_counter_snapshot(db_path: str, counters: dict[str, int]) -> None:
+    """Store cumulative process counters (cache hits, evictions, ...) as one snapshot."""
+    if not counters:
+        return
+
     with sqlite3.connect(db_path) as conn:
-        conn.execute(
-            """
-            INSERT INTO latex_events (created_at, source, status, dpi, user_id, error_message, duration_ms)
-            VALUES (?, ?, ?, ?, ?, ?, ?);
-            """,
-            (
-                _utc_now_iso(),
-                source,
-                status,
-                dpi,
-                str(user_id) if user_id is not None else None,
-                (error_message or "")[:500] or None,
-                normalized_duration_ms,
+        _insert_counter_rows(conn, _counter_snapshot_rows(counters))
+        conn.commit()
+
+
+def _counter_snapshot_rows(counters: dict[str, int]) -> list[tuple]:
+    created_at = _utc_now_iso()
+    return [(created_at, name, int(value)) for name, value in sorted(counters.items())]
+
+
+_RowWriter = Callable[[sqlite3.Connection, list[tuple]], None]
+
+
+class MetricsWriter:
+    """Write metrics from a background thread in batched transactions.
+
+    `record_latex_event` and `record_counter_snapshot` only validate and
+    enqueue, so callers on the event loop never touch the disk. The writer
+    thread keeps one connection, commits whatever arrived within
+    `flush_interval_seconds` (or `batch_size` events) with `executemany`,
+    and leaves maintenance to `run_metrics_maintenance`. When the queue is full new
+    events are dropped and counted as `metrics_writer.dropped`.
+    """
+
+    def __init__(
+        self,
+        db_path: str,
+        max_queued: int = _DEFAULT_WRITER_QUEUE_SIZE,
+        flush_interval_seconds: float = _DEFAULT_WRITER_FLUSH_INTERVAL_MS / 1000,
+        batch_size: int = _DEFAULT_WRITER_BATCH_SIZE,
+    ):
+        self.db_path = db_path
+        self.flush_interval_seconds = flush_interval_seconds
+        self.batch_size = max(1, batch_size)
+        self._queue: queue.Queue[tuple[_RowWriter, list[tuple]]] = queue.Queue(maxsize=max(1, max_queued))
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    @classmethod
+    def from_env(cls, db_path: str) -> "MetricsWriter":
+        return cls(
+            db_path,
+            max_queued=_read_positive_int_env(
+                "METRICS_WRITER_QUEUE_SIZE",
+                _DEFAULT_WRITER_QUEUE_SIZE,
+                1,
+            ),
+            flush_interval_seconds=_read_positive_int_env(
+                "METRICS_WRITER_FLUSH_INTERVAL_MS",
+                _DEFAULT_WRITER_FLUSH_INTERVAL_MS,
+                1,
+            ) / 1000,
+            batch_size=_read_positive_int_env(
+                "METRICS_WRITER_BATCH_SIZE",
+                _DEFAULT_WRITER_BATCH_SIZE,
+                1,
             ),
         )
-        conn.commit()
 
-    if not _should_run_throttled_maintenance(db_path):
-        return
+    def start(self) -> None:
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="metrics-writer", daemon=True)
+        self._thread.start()
 
-    try:
-        _run_metrics_maintenance(db_path)
-    except sqlite3.Error:
-        _LOGGER.exception("Metrics maintenance failed during event write path=%s", db_path)
+    def close(self, timeout: float | None = 5.0) -> None:
+        """Write everything already queued, then stop the thread."""
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+
+    def flush(self, timeout: float | None = None) -> bool:
+        """Wait until every queued metric is written; False on timeout."""
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(
+                lambda: not self._queue.unfinished_tasks,
+                timeout,
+            )
+
+    def record_latex_event(
+        self,
+        source: str,
+        status: str,
+        dpi: int | None,
+        user_id: int | None,
+        error_message: str | None = None,
+        duration_ms: int | None = None,
+        coalesced: bool = False,
+    ) -> None:
+        row = _latex_event_row(source, status, dpi, user_id, error_message, duration_ms, coalesced)
+        self._enqueue(_insert_latex_event_rows, [row])
+
+    def record_counter_snapshot(self, counters: dict[str, int]) -> None:
+        if counters:
+            self._enqueue(_insert_counter_rows, _counter_snapshot_rows(counters))
+
+    def _enqueue(self, insert: _RowWriter, rows: list[tuple]) -> None:
+        try:
+            self._queue.put_nowait((insert, rows))
+        except queue.Full:
+            increment_counter("metrics_writer.dropped", len(rows))
+
+    def _run(self) -> None:
+        # Background maintenance may hold the write lock; waiting here costs the loop nothing.
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            while True:
+                batch = self._next_batch()
+                if batch:
+                    self._write(conn, batch)
+                elif self._stop.is_set():
+                    return
+        finally:
+            conn.close()
+
+    def _next_batch(self) -> list[tuple[_RowWriter, list[tuple]]]:
+        try:
+            batch = [self._queue.get(timeout=self.flush_interval_seconds)]
+        except queue.Empty:
+            return []
+        flush_at = time.monotonic() + self.flush_interval_seconds
+        while len(batch) < self.batch_size:
+            # Once stopping, drain what is queued without waiting for more.
+            remaining = 0 if self._stop.is_set() else flush_at - time.monotonic()
+            try:
+                batch.append(self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _write(self, conn: sqlite3.Connection, batch: list[tuple[_RowWriter, list[tuple]]]) -> None:
+        rows_by_insert: dict[_RowWriter, list[tuple]] = {}
+        for insert, rows in batch:
+            rows_by_insert.setdefault(insert, []).extend(rows)
+        try:
+            with conn:
+                for insert, rows in rows_by_insert.items():
+                    insert(conn, rows)
+        except sqlite3.Error:
+            _LOGGER.exception("Metrics batch write failed path=%s items=%s", self.db_path, len(batch))
+            increment_counter("metrics_writer.failed", len(batch))
+        else:
+            increment_counter("metrics_writer.flushes")
+        finally:
+            for _ in batch:
+                self._queue.task_done()
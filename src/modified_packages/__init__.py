@@ -3,8 +3,13 @@ from .latex_compiler import *
 from .dvipng_renderer import *
 from .tex2img import *
 from .exceptions import *
+from .cancellation import CancellationToken as CancellationToken
+from .format_cache import FormatCache as FormatCache
+from .warm_pool import WarmWorkerPool as WarmWorkerPool
+from .pdf2image import aconvert_to_png_bytes as aconvert_to_png_bytes
 from .pdf2image import convert_from_bytes as convert_from_bytes
 from .pdf2image import convert_from_path as convert_from_path
+from .pdf2image import convert_to_png_bytes as convert_to_png_bytes
 from .pdf2image import pdfinfo_from_bytes as pdfinfo_from_bytes
 from .pdf2image import pdfinfo_from_path as pdfinfo_from_path
 
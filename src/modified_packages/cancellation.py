@@ -0,0 +1,69 @@
+"""Cooperative cancellation for compiles running on executor threads."""
+
+import threading
+from typing import Callable
+
+from .exceptions import CompilationCancelledError
+
+
+class CancellationToken:
+    """Lets the awaiting side stop a compile that runs on another thread.
+
+    Compilers attach a kill callback for the process they are waiting on;
+    `cancel()` runs it right away so the process group dies instead of
+    running on to its own timeout after nobody is waiting for the result.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._cancelled = False
+        self._kill: Callable[[], None] | None = None
+        self._children: list["CancellationToken"] = []
+
+    @property
+    def cancelled(self) -> bool:
+        with self._lock:
+            return self._cancelled
+
+    def cancel(self) -> None:
+        with self._lock:
+            if self._cancelled:
+                return
+            self._cancelled = True
+            kill = self._kill
+            children = self._children
+            self._children = []
+        if kill is not None:
+            kill()
+        for child in children:
+            child.cancel()
+
+    def child(self) -> "CancellationToken":
+        """Return a token cancelled along with this one that can also be cancelled on its own."""
+        child = CancellationToken()
+        with self._lock:
+            if not self._cancelled:
+                self._children.append(child)
+                return child
+        child.cancel()
+        return child
+
+    def attach(self, kill: Callable[[], None]) -> bool:
+        """Register the kill callback for the running process.
+
+        Returns False when the token was already cancelled, in which case the
+        caller must kill the process itself.
+        """
+        with self._lock:
+            if self._cancelled:
+                return False
+            self._kill = kill
+            return True
+
+    def detach(self) -> None:
+        with self._lock:
+            self._kill = None
+
+    def raise_if_cancelled(self) -> None:
+        if self.cancelled:
+            raise CompilationCancelledError("Compilation cancelled by caller.")
@@ -1,23 +1,18 @@
-"""Fast inline LaTeX renderer using latex -> DVI -> dvipng."""
+"""Fast LaTeX renderer using latex -> DVI -> dvipng."""
 
-import subprocess
-import sys
 import tempfile
 from pathlib import Path
 
 from .exceptions import CompilationError
-from .latex_compiler import (
-    LatexCompiler,
-    _MAIN_TEX_FILENAME,
-    _format_compilation_error,
-)
+from .latex_compiler import LatexCompiler, _format_compilation_error
 
+_DVI_ENGINE = "latex"
 _MAIN_DVI_FILENAME = "main.dvi"
 _OUTPUT_PATTERN = "output%d.png"
 
 
 class InlineDviPngRenderer(LatexCompiler):
-    """Compile conservative inline LaTeX directly to PNG bytes."""
+    """Compile conservative inline LaTeX, or DVI-safe documents, directly to PNG bytes."""
 
     def compile(
             self,
@@ -26,104 +21,138 @@ class InlineDviPngRenderer(LatexCompiler):
             transparent: bool = False,
             dpi: int = 300,
     ) -> bytes:
+        return self.compile_pages(latex_code, images, transparent=transparent, dpi=dpi)[0]
+
+    def compile_pages(
+            self,
+            latex_code,
+            images: list[tuple[str, str]] | None = None,
+            transparent: bool = False,
+            dpi: int = 300,
+            first_page: int | None = None,
+            last_page: int | None = None,
+    ) -> list[bytes]:
+        """Render every page between `first_page` and `last_page`, in page order."""
         working_dir = Path(
             tempfile.mkdtemp(prefix="latex-", dir=self._ensure_compile_dir())
         )
 
         try:
-            (working_dir / _MAIN_TEX_FILENAME).write_text(
-                latex_code,
-                encoding="utf-8",
-            )
             self._write_resources(working_dir, images or [])
-            self._run_compiler("latex", working_dir)
-
-            dvi_path = working_dir / _MAIN_DVI_FILENAME
-            if not dvi_path.exists():
-                raise CompilationError(
-                    _format_compilation_error(
-                        summary="Compiler completed without producing a DVI.",
-                        working_dir=working_dir,
-                    )
-                )
-
-            self._run_dvipng(working_dir, transparent=transparent, dpi=dpi)
-
-            png_paths = sorted(working_dir.glob("output*.png"))
-            if not png_paths:
-                raise CompilationError(
-                    _format_compilation_error(
-                        summary="dvipng completed without producing a PNG.",
-                        working_dir=working_dir,
-                    )
-                )
-
-            return png_paths[0].read_bytes()
+            self._compile_source(latex_code, working_dir, _DVI_ENGINE)
+            self._check_dvi_output(working_dir)
+            self._run_process(
+                _dvipng_command(transparent, dpi, first_page, last_page),
+                working_dir,
+                role="Renderer",
+            )
+            return self._read_png_output(working_dir)
         finally:
             self._cleanup_working_dir(working_dir)
 
-    def _run_dvipng(self, working_dir: Path, transparent: bool, dpi: int) -> None:
-        background = "Transparent" if transparent else "White"
-        command = [
-            "dvipng",
-            "-T",
-            "tight",
-            "-bg",
-            background,
-            "-D",
-            str(dpi),
-            "-o",
-            _OUTPUT_PATTERN,
-            _MAIN_DVI_FILENAME,
-        ]
-        popen_kwargs = {
-            "cwd": str(working_dir),
-            "stdout": subprocess.PIPE,
-            "stderr": subprocess.PIPE,
-            "text": True,
-        }
-        if sys.platform == "win32":
-            popen_kwargs["creationflags"] = getattr(
-                subprocess,
-                "CREATE_NEW_PROCESS_GROUP",
-                0,
-            )
-        else:
-            popen_kwargs["start_new_session"] = True
-
-        try:
-            process = subprocess.Popen(command, **popen_kwargs)
-        except FileNotFoundError as exc:
+    def _check_dvi_output(self, working_dir: Path) -> None:
+        if not (working_dir / _MAIN_DVI_FILENAME).exists():
             raise CompilationError(
                 _format_compilation_error(
-                    summary="Renderer executable 'dvipng' was not found.",
-                    working_dir=None,
-                    stderr=str(exc),
-                )
-            ) from exc
-
-        try:
-            stdout, stderr = process.communicate(timeout=self.timeout)
-        except subprocess.TimeoutExpired as exc:
-            self._terminate_process_group(process)
-            raise CompilationError(
-                _format_compilation_error(
-                    summary=f"Renderer 'dvipng' timed out after {self.timeout:.1f}s.",
+                    summary="Compiler completed without producing a DVI.",
                     working_dir=working_dir,
-                    stdout=exc.stdout,
-                    stderr=exc.stderr,
                 )
-            ) from exc
-        finally:
-            if process.poll() is None:
-                self._terminate_process_group(process)
+            )
 
-        if process.returncode != 0:
+    def _read_png_output(self, working_dir: Path) -> list[bytes]:
+        png_paths = sorted(working_dir.glob("output*.png"), key=_page_number)
+        if not png_paths:
             raise CompilationError(
                 _format_compilation_error(
-                    summary=f"Renderer 'dvipng' exited with return code {process.returncode}.",
+                    summary="dvipng completed without producing a PNG.",
                     working_dir=working_dir,
-                    stdout=stdout,
-                    stderr=stderr,
                 )
             )
+        return [png_path.read_bytes() for png_path in png_paths]
+
+    def warm_format(self, latex_code: str, engine: str = _DVI_ENGINE) -> bool:
+        return super().warm_format(latex_code, engine)
+
+    def warm_workers(self, latex_code: str, engine: str = _DVI_ENGINE) -> None:
+        super().warm_workers(latex_code, engine)
+
+
+class AsyncInlineDviPngRenderer(InlineDviPngRenderer):
+    """Inline renderer whose latex and dvipng stages run as asyncio subprocesses."""
+
+    def compile(
+            self,
+            latex_code,
+            images: list[tuple[str, str]] | None = None,
+            transparent: bool = False,
+            dpi: int = 300,
+    ) -> bytes:
+        raise NotImplementedError("Use acompile instead.")
+
+    def compile_pages(self, *args, **kwargs) -> list[bytes]:
+        raise NotImplementedError("Use acompile_pages instead.")
+
+    async def acompile(
+            self,
+            latex_code,
+            images: list[tuple[str, str]] | None = None,
+            transparent: bool = False,
+            dpi: int = 300,
+    ) -> bytes:
+        return (await self.acompile_pages(latex_code, images, transparent=transparent, dpi=dpi))[0]
+
+    async def acompile_pages(
+            self,
+            latex_code,
+            images: list[tuple[str, str]] | None = None,
+            transparent: bool = False,
+            dpi: int = 300,
+            first_page: int | None = None,
+            last_page: int | None = None,
+    ) -> list[bytes]:
+        working_dir = Path(
+            tempfile.mkdtemp(prefix="latex-", dir=self._ensure_compile_dir())
+        )
+
+        try:
+            self._write_resources(working_dir, images or [])
+            await self._acompile_source(latex_code, working_dir, _DVI_ENGINE)
+            self._check_dvi_output(working_dir)
+            await self._arun_process(
+                _dvipng_command(transparent, dpi, first_page, last_page),
+                working_dir,
+                role="Renderer",
+            )
+            return self._read_png_output(working_dir)
+        finally:
+            self._cleanup_working_dir(working_dir)
+
+
+def _dvipng_command(
+        transparent: bool,
+        dpi: int,
+        first_page: int | None = None,
+        last_page: int | None = None,
+) -> list[str]:
+    background = "Transparent" if transparent else "White"
+    command = [
+        "dvipng",
+        "-T",
+        "tight",
+        "-bg",
+        background,
+        "-D",
+        str(dpi),
+    ]
+    # "=N" selects physical pages; a bare N would match \count0, which the
+    # document may set or reset.
+    if first_page is not None:
+        command += ["-p", f"={first_page}"]
+    if last_page is not None:
+        command += ["-l", f"={last_page}"]
+    return command + ["-o", _OUTPUT_PATTERN, _MAIN_DVI_FILENAME]
+
+
+def _page_number(png_path: Path) -> int:
+    # output10.png sorts before output2.png as a string.
+    return int(png_path.stem[len("output"):])
@@ -5,17 +5,25 @@ class CompilationError(Exception):
     """ Exception raised when the compilation fails. """
 
 
-class PDFInfoNotInstalledError:
+class PDFInfoNotInstalledError(Exception):
     pass
 
 
-class PDFPageCountError:
+class PDFPageCountError(Exception):
     pass
 
 
-class PDFSyntaxError:
+class PDFSyntaxError(Exception):
     pass
 
 
-class PDFPopplerTimeoutError:
+class PDFPopplerTimeoutError(Exception):
     pass
+
+
+class CompilationCancelledError(CompilationError):
+    """ Exception raised when the caller cancelled the compilation. """
+
+
+class CompilationTimeoutError(CompilationError):
+    """ Exception raised when a stage timed out or the render deadline had already passed. """
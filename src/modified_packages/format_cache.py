@@ -0,0 +1,172 @@
+"""Dumped TeX format files for repeated LaTeX preambles."""
+
+import hashlib
+import logging
+import re
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Callable
+
+from .exceptions import CompilationCancelledError
+
+_LOGGER = logging.getLogger(__name__)
+_FORMAT_SUFFIX = ".fmt"
+_MAX_TRACKED_PREAMBLES = 512
+_BEGIN_DOCUMENT_RE = re.compile(r"\\begin\s*\{document\}")
+_DOCUMENTCLASS_RE = re.compile(r"\\documentclass\b")
+_COMMENT_RE = re.compile(r"(?<!\\)%.*$")
+_FORMAT_LOAD_ERROR_RE = re.compile(
+    r"fatal format file error|can't find the format file|was written by|"
+    r"format file .* (?:is )?(?:corrupt|invalid)",
+    re.IGNORECASE,
+)
+
+
+def split_preamble(latex_code: str) -> tuple[str, str] | None:
+    """Split a full document into (preamble, body) at the first live `\\begin{document}`.
+
+    The preamble keeps its trailing newline so `pad_body_lines` can keep
+    compiler line numbers aligned with the original source.
+    """
+    offset = 0
+    for line in latex_code.splitlines(keepends=True):
+        live_text = _COMMENT_RE.sub("", line)
+        match = _BEGIN_DOCUMENT_RE.search(live_text)
+        if match:
+            preamble = latex_code[:offset + match.start()]
+            if not _DOCUMENTCLASS_RE.search(preamble):
+                return None
+            return preamble, latex_code[offset + match.start():]
+        offset += len(line)
+    return None
+
+
+def pad_body_lines(preamble: str, body: str) -> str:
+    """Replace the preamble with comment lines so `main.tex:N:` errors still map."""
+    return "%\n" * preamble.count("\n") + body
+
+
+def is_format_load_error(error_text: str) -> bool:
+    return bool(_FORMAT_LOAD_ERROR_RE.search(error_text))
+
+
+class FormatCache:
+    """Build a dumped `.fmt` per (engine, preamble) once and reuse it across compiles.
+
+    Dumping costs more than one regular compile, so a preamble is only dumped
+    once it has been seen `min_uses` times; one-off documents never pay for it.
+    """
+
+    def __init__(self, cache_dir: str | Path, max_formats: int = 2, min_uses: int = 1):
+        self.cache_dir = Path(cache_dir)
+        self.max_formats = max(1, max_formats)
+        self.min_uses = max(1, min_uses)
+        self._lock = threading.Lock()
+        self._formats: OrderedDict[str, Path] = OrderedDict()
+        self._failed: set[str] = set()
+        self._build_locks: dict[str, threading.Lock] = {}
+        self._uses: OrderedDict[str, int] = OrderedDict()
+        self._stale_files_removed = False
+
+    @staticmethod
+    def format_name(engine: str, preamble: str) -> str:
+        digest = hashlib.sha256(f"{engine}\0{preamble}".encode("utf-8")).hexdigest()
+        return f"{engine}-{digest[:32]}"
+
+    def lookup(self, engine: str, preamble: str) -> Path | None:
+        name = self.format_name(engine, preamble)
+        with self._lock:
+            format_path = self._formats.get(name)
+            if format_path is not None:
+                self._formats.move_to_end(name)
+            return format_path
+
+    def get_or_build(
+            self,
+            engine: str,
+            preamble: str,
+            build: Callable[[str, str, Path], Path],
+            force: bool = False,
+    ) -> Path | None:
+        """Return the cached format, building it with `build(engine, preamble, dir)` if needed.
+
+        Returns None when the preamble has not been seen `min_uses` times yet
+        (unless `force` is set) or cannot be dumped; dump failures are
+        remembered so later requests go straight to a regular compile.
+        """
+        name = self.format_name(engine, preamble)
+        with self._lock:
+            if name in self._failed:
+                return None
+            format_path = self._formats.get(name)
+            if format_path is not None:
+                self._formats.move_to_end(name)
+                return format_path
+            if not force and self._record_use_locked(name) < self.min_uses:
+                return None
+            build_lock = self._build_locks.setdefault(name, threading.Lock())
+
+        with build_lock:
+            format_path = self.lookup(engine, preamble)
+            if format_path is not None:
+                return format_path
+            with self._lock:
+                if name in self._failed:
+                    return None
+
+            self._prepare_cache_dir()
+            try:
+                format_path = build(engine, preamble, self.cache_dir)
+            except CompilationCancelledError:
+                # The caller gave up; the preamble itself may be fine.
+                with self._lock:
+                    self._build_locks.pop(name, None)
+                raise
+            except Exception:
+                _LOGGER.warning("Format dump failed engine=%s name=%s", engine, name, exc_info=True)
+                with self._lock:
+                    self._failed.add(name)
+                    self._build_locks.pop(name, None)
+                return None
+
+            self._store(name, format_path)
+            return format_path
+
+    def invalidate(self, engine: str, preamble: str) -> None:
+        name = self.format_name(engine, preamble)
+        with self._lock:
+            format_path = self._formats.pop(name, None)
+            self._failed.add(name)
+        if format_path is not None:
+            format_path.unlink(missing_ok=True)
+
+    def _record_use_locked(self, name: str) -> int:
+        uses = self._uses.pop(name, 0) + 1
+        self._uses[name] = uses
+        while len(self._uses) > _MAX_TRACKED_PREAMBLES:
+            self._uses.popitem(last=False)
+        return uses
+
+    def _prepare_cache_dir(self) -> None:
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            if self._stale_files_removed:
+                return
+            self._stale_files_removed = True
+            # Formats left by a previous process are not indexed and would never be evicted.
+            for stale_path in self.cache_dir.glob(f"*{_FORMAT_SUFFIX}"):
+                stale_path.unlink(missing_ok=True)
+
+    def _store(self, name: str, format_path: Path) -> None:
+        evicted: list[Path] = []
+        with self._lock:
+            self._formats[name] = format_path
+            self._formats.move_to_end(name)
+            self._build_locks.pop(name, None)
+            self._uses.pop(name, None)
+            while len(self._formats) > self.max_formats:
+                _evicted_name, evicted_path = self._formats.popitem(last=False)
+                evicted.append(evicted_path)
+        for evicted_path in evicted:
+            evicted_path.unlink(missing_ok=True)
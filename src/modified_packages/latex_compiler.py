@@ -9,12 +9,16 @@ import signal
 import subprocess
 import sys
 import tempfile
+import time
 from pathlib import Path
 from typing import Optional
 from urllib.error import URLError
 from urllib.request import urlopen
 
-from .exceptions import CompilationError
+from .cancellation import CancellationToken
+from .exceptions import CompilationCancelledError, CompilationError, CompilationTimeoutError
+from .format_cache import FormatCache, is_format_load_error, pad_body_lines, split_preamble
+from .warm_pool import WarmTexWorker, WarmWorkerPool, discard_worker
 
 _DEFAULT_COMPILER = os.getenv("LATEX_COMPILER_ENGINE", "pdflatex")
 _DEFAULT_TIMEOUT_SECONDS = 12.0
@@ -23,28 +27,57 @@ _COMPILE_DIR_ENV_VARS = ("LATEX_COMPILE_DIR", "TMPDIR")
 _MAIN_TEX_FILENAME = "main.tex"
 _MAIN_PDF_FILENAME = "main.pdf"
 _MAIN_LOG_FILENAME = "main.log"
+_PREAMBLE_TEX_FILENAME = "preamble.tex"
+_MAIN_JOBNAME = "main"
+# Warm workers block on the terminal for the job path: \read needs scroll mode,
+# then the job itself runs non-stop like a cold compile.
+_WARM_WORKER_BOOTSTRAP = r"\scrollmode\read16 to\mainfile\nonstopmode\input\mainfile"
+# Job paths are absolute for warm workers; keep them from wrapping `file:line:` errors.
+_WARM_WORKER_MAX_PRINT_LINE = "10000"
 _ERROR_PREFIX = "Compilation failed with error logs:"
 _PROCESS_EXIT_TIMEOUT_SECONDS = 1.0
 _PROCESS_TREE_KILL_TIMEOUT_SECONDS = 3.0
 
 
 class LatexCompiler:
-    """Compile LaTeX source into PDF bytes using a local TeX engine."""
+    """Compile LaTeX source into PDF bytes using a local TeX engine.
+
+    When a `FormatCache` is supplied, the document preamble is dumped into a
+    `.fmt` once and later compiles only typeset the body against it. When a
+    `WarmWorkerPool` is supplied, resource-free compiles run on a TeX process
+    that was started (and loaded its format) before the job arrived. When a
+    `CancellationToken` is supplied, cancelling it kills the running process
+    and the compile raises `CompilationCancelledError`. A `deadline`
+    (a `time.monotonic()` value) caps every stage at the time left in the
+    request instead of granting each one the full `timeout`.
+    """
 
     api_url: str
     compile_dir: Path
     timeout: float
+    format_cache: FormatCache | None
+    worker_pool: WarmWorkerPool | None
+    cancel_token: CancellationToken | None
+    deadline: float | None
 
     def __init__(
             self,
             api_url: str = "",
             compile_dir: str | os.PathLike[str] | None = None,
             timeout: float | None = None,
+            format_cache: FormatCache | None = None,
+            worker_pool: WarmWorkerPool | None = None,
+            cancel_token: CancellationToken | None = None,
+            deadline: float | None = None,
     ):
         # Keep api_url for backward compatibility with older call sites.
         self.api_url = api_url
         self.compile_dir = Path(compile_dir) if compile_dir else _resolve_compile_dir()
         self.timeout = timeout if timeout is not None else _resolve_timeout()
+        self.format_cache = format_cache
+        self.worker_pool = worker_pool
+        self.cancel_token = cancel_token
+        self.deadline = deadline
 
     def compile(
             self,
@@ -59,26 +92,24 @@ class LatexCompiler:
         )
 
         try:
-            (working_dir / _MAIN_TEX_FILENAME).write_text(
-                latex_code,
-                encoding="utf-8",
-            )
             self._write_resources(working_dir, images or [])
-            self._run_compiler(compiler, working_dir)
-
-            pdf_path = working_dir / _MAIN_PDF_FILENAME
-            if not pdf_path.exists():
-                raise CompilationError(
-                    _format_compilation_error(
-                        summary="Compiler completed without producing a PDF.",
-                        working_dir=working_dir,
-                    )
-                )
-
-            return pdf_path.read_bytes()
+            # Warm workers run outside working_dir, so relative resource paths would not resolve.
+            self._compile_source(latex_code, working_dir, compiler, allow_worker=not images)
+            return self._check_pdf_output(working_dir).read_bytes()
         finally:
             self._cleanup_working_dir(working_dir)
 
+    def _check_pdf_output(self, working_dir: Path) -> Path:
+        pdf_path = working_dir / _MAIN_PDF_FILENAME
+        if not pdf_path.exists():
+            raise CompilationError(
+                _format_compilation_error(
+                    summary="Compiler completed without producing a PDF.",
+                    working_dir=working_dir,
+                )
+            )
+        return pdf_path
+
     def _ensure_compile_dir(self) -> str:
         self.compile_dir.mkdir(parents=True, exist_ok=True)
         return str(self.compile_dir)
@@ -130,68 +161,402 @@ class LatexCompiler:
         except (binascii.Error, ValueError):
             return content.encode("utf-8")
 
-    def _run_compiler(self, compiler: str, working_dir: Path) -> None:
-        command = [
-            compiler,
-            "-interaction=nonstopmode",
-            "-halt-on-error",
-            "-file-line-error",
-            "-no-shell-escape",
-            f"-output-directory={working_dir}",
-            _MAIN_TEX_FILENAME,
-        ]
-        popen_kwargs = {
-            "cwd": str(working_dir),
-            "stdout": subprocess.PIPE,
-            "stderr": subprocess.PIPE,
-            "text": True,
-        }
-        if sys.platform == "win32":
-            popen_kwargs["creationflags"] = getattr(
-                subprocess,
-                "CREATE_NEW_PROCESS_GROUP",
-                0,
+    def _compile_source(
+            self,
+            latex_code: str,
+            working_dir: Path,
+            engine: str,
+            allow_worker: bool = True,
+    ) -> None:
+        """Write main.tex and compile it, using a dumped preamble format when one is cached."""
+        main_tex_path = working_dir / _MAIN_TEX_FILENAME
+        split = split_preamble(latex_code) if self.format_cache is not None else None
+        format_path = None
+        if split is not None:
+            format_path = self.format_cache.get_or_build(
+                engine,
+                split[0],
+                self._dump_format,
             )
-        else:
-            popen_kwargs["start_new_session"] = True
 
+        if format_path is not None:
+            main_tex_path.write_text(pad_body_lines(*split), encoding="utf-8")
+            try:
+                self._run_compiler(
+                    engine,
+                    working_dir,
+                    format_path=format_path,
+                    allow_worker=allow_worker,
+                )
+                return
+            except CompilationError as exc:
+                if not is_format_load_error(str(exc)):
+                    raise
+                self.format_cache.invalidate(engine, split[0])
+
+        main_tex_path.write_text(latex_code, encoding="utf-8")
+        self._run_compiler(engine, working_dir, allow_worker=allow_worker)
+
+    def warm_format(self, latex_code: str, engine: str) -> bool:
+        """Build the preamble format ahead of the first request; True when it is usable."""
+        split = split_preamble(latex_code)
+        if self.format_cache is None or split is None:
+            return False
+        return self.format_cache.get_or_build(
+            engine,
+            split[0],
+            self._dump_format,
+            force=True,
+        ) is not None
+
+    def warm_workers(self, latex_code: str, engine: str) -> None:
+        """Start idle workers for the format `latex_code` would compile against."""
+        if self.worker_pool is None:
+            return
+        split = split_preamble(latex_code) if self.format_cache is not None else None
+        format_path = self.format_cache.lookup(engine, split[0]) if split is not None else None
+        self.worker_pool.prime(
+            (engine, format_path),
+            lambda: self._spawn_warm_worker(engine, format_path),
+        )
+
+    def _run_compiler(
+            self,
+            compiler: str,
+            working_dir: Path,
+            format_path: Path | None = None,
+            allow_worker: bool = False,
+    ) -> None:
+        # TeX ends a file name at the first space, so such paths stay on the cold path.
+        if allow_worker and self.worker_pool is not None and " " not in str(working_dir):
+            worker = self.worker_pool.acquire(
+                (compiler, format_path),
+                lambda: self._spawn_warm_worker(compiler, format_path),
+            )
+            if worker is not None:
+                self._run_warm_worker(compiler, worker, working_dir)
+                return
+
+        command, env = _compiler_command(compiler, working_dir, format_path)
+        self._run_process(command, working_dir, role="Compiler", env=env)
+
+    def _spawn_warm_worker(self, engine: str, format_path: Path | None) -> WarmTexWorker:
+        worker_dir = Path(
+            tempfile.mkdtemp(prefix="latex-warm-", dir=self._ensure_compile_dir())
+        )
+        command = [engine]
+        env = os.environ.copy()
+        if format_path is not None:
+            command.append(f"-fmt={format_path.stem}")
+            env = _format_search_env(format_path.parent)
+        env["max_print_line"] = _WARM_WORKER_MAX_PRINT_LINE
+        command.extend(
+            [
+                "-interaction=nonstopmode",
+                "-halt-on-error",
+                "-file-line-error",
+                "-no-shell-escape",
+                f"-jobname={_MAIN_JOBNAME}",
+                f"-output-directory={worker_dir}",
+                _WARM_WORKER_BOOTSTRAP,
+            ]
+        )
+        popen_kwargs = _popen_kwargs(worker_dir, env)
+        popen_kwargs["stdin"] = subprocess.PIPE
         try:
             process = subprocess.Popen(command, **popen_kwargs)
+        except BaseException:
+            shutil.rmtree(worker_dir, ignore_errors=True)
+            raise
+        return WarmTexWorker(
+            process=process,
+            working_dir=worker_dir,
+            started_at=time.monotonic(),
+        )
+
+    def _run_warm_worker(
+            self,
+            compiler: str,
+            worker: WarmTexWorker,
+            working_dir: Path,
+    ) -> None:
+        process = worker.process
+        timeout_exc = None
+        try:
+            timeout = self._stage_timeout(compiler, role="Compiler")
+        except CompilationError:
+            discard_worker(worker)
+            raise
+        self._attach_cancel(process)
+        try:
+            stdout, stderr = process.communicate(
+                input=f"{working_dir / _MAIN_TEX_FILENAME}\n",
+                timeout=timeout,
+            )
+        except subprocess.TimeoutExpired as exc:
+            timeout_exc = exc
+            stdout, stderr = exc.stdout, exc.stderr
+        finally:
+            self._detach_cancel()
+            if process.poll() is None:
+                self._terminate_process_group(process)
+            # Outputs land in the worker's directory; move them where callers look.
+            for output_path in worker.working_dir.glob(f"{_MAIN_JOBNAME}.*"):
+                os.replace(output_path, working_dir / output_path.name)
+            discard_worker(worker)
+
+        self._raise_if_cancelled(compiler, role="Compiler")
+
+        if timeout_exc is not None:
+            raise CompilationTimeoutError(
+                _format_compilation_error(
+                    summary=f"Compiler '{compiler}' timed out after {timeout:.1f}s.",
+                    working_dir=working_dir,
+                    stdout=stdout,
+                    stderr=stderr,
+                )
+            ) from timeout_exc
+
+        if process.returncode != 0:
+            raise CompilationError(
+                _format_compilation_error(
+                    summary=f"Compiler '{compiler}' exited with return code {process.returncode}.",
+                    working_dir=working_dir,
+                    stdout=stdout,
+                    stderr=stderr,
+                )
+            )
+
+    def _dump_format(self, engine: str, preamble: str, output_dir: Path) -> Path:
+        """Run `engine -ini` over a preamble and move the dumped format into output_dir."""
+        format_name = FormatCache.format_name(engine, preamble)
+        working_dir = Path(
+            tempfile.mkdtemp(prefix="latex-fmt-", dir=self._ensure_compile_dir())
+        )
+
+        try:
+            (working_dir / _PREAMBLE_TEX_FILENAME).write_text(
+                preamble.rstrip() + "\n\\dump\n",
+                encoding="utf-8",
+            )
+            command = [
+                engine,
+                "-ini",
+                "-interaction=nonstopmode",
+                "-halt-on-error",
+                "-file-line-error",
+                "-no-shell-escape",
+                f"-jobname={format_name}",
+                f"-output-directory={working_dir}",
+                f"&{engine}",
+                _PREAMBLE_TEX_FILENAME,
+            ]
+            # A dump outlives the request that triggered it, so it gets the
+            # full timeout; a deadline kill would mark the preamble as failed.
+            self._run_process(command, working_dir, role="Format dump", use_deadline=False)
+
+            dumped_path = working_dir / f"{format_name}.fmt"
+            if not dumped_path.exists():
+                raise CompilationError(
+                    _format_compilation_error(
+                        summary="Format dump completed without producing a .fmt file.",
+                        working_dir=working_dir,
+                    )
+                )
+
+            format_path = output_dir / dumped_path.name
+            os.replace(dumped_path, format_path)
+            return format_path
+        finally:
+            self._cleanup_working_dir(working_dir)
+
+    def _run_process(
+            self,
+            command: list[str],
+            working_dir: Path,
+            role: str,
+            env: dict[str, str] | None = None,
+            use_deadline: bool = True,
+    ) -> None:
+        executable = command[0]
+        if self.cancel_token is not None:
+            self.cancel_token.raise_if_cancelled()
+        timeout = self._stage_timeout(executable, role) if use_deadline else self.timeout
+        try:
+            process = subprocess.Popen(command, **_popen_kwargs(working_dir, env))
         except FileNotFoundError as exc:
             raise CompilationError(
                 _format_compilation_error(
-                    summary=f"Compiler executable '{compiler}' was not found.",
+                    summary=f"{role} executable '{executable}' was not found.",
                     working_dir=None,
                     stderr=str(exc),
                 )
             ) from exc
 
+        self._attach_cancel(process)
         try:
-            stdout, stderr = process.communicate(timeout=self.timeout)
+            stdout, stderr = process.communicate(timeout=timeout)
         except subprocess.TimeoutExpired as exc:
             self._terminate_process_group(process)
-            raise CompilationError(
+            raise CompilationTimeoutError(
                 _format_compilation_error(
-                    summary=f"Compiler '{compiler}' timed out after {self.timeout:.1f}s.",
+                    summary=f"{role} '{executable}' timed out after {timeout:.1f}s.",
                     working_dir=working_dir,
                     stdout=exc.stdout,
                     stderr=exc.stderr,
                 )
             ) from exc
         finally:
+            self._detach_cancel()
             if process.poll() is None:
                 self._terminate_process_group(process)
 
+        self._raise_if_cancelled(executable, role)
         if process.returncode != 0:
             raise CompilationError(
                 _format_compilation_error(
-                    summary=f"Compiler '{compiler}' exited with return code {process.returncode}.",
+                    summary=f"{role} '{executable}' exited with return code {process.returncode}.",
                     working_dir=working_dir,
                     stdout=stdout,
                     stderr=stderr,
                 )
             )
 
+    def remaining_seconds(self) -> float | None:
+        """Time left before the deadline, or None when the compile has no deadline."""
+        if self.deadline is None:
+            return None
+        return self.deadline - time.monotonic()
+
+    def _stage_timeout(self, executable: str, role: str) -> float:
+        remaining = self.remaining_seconds()
+        if remaining is None:
+            return self.timeout
+        if remaining <= 0:
+            raise CompilationTimeoutError(
+                _format_compilation_error(
+                    summary=f"{role} '{executable}' was not started: the render deadline has passed.",
+                    working_dir=None,
+                )
+            )
+        return min(self.timeout, remaining)
+
+    def _attach_cancel(self, process: subprocess.Popen) -> None:
+        if self.cancel_token is None:
+            return
+        if not self.cancel_token.attach(lambda: _kill_process_group_nowait(process)):
+            _kill_process_group_nowait(process)
+
+    def _detach_cancel(self) -> None:
+        if self.cancel_token is not None:
+            self.cancel_token.detach()
+
+    def _raise_if_cancelled(self, executable: str, role: str) -> None:
+        if self.cancel_token is not None and self.cancel_token.cancelled:
+            raise CompilationCancelledError(
+                f"{role} '{executable}' was cancelled because the caller stopped waiting."
+            )
+
+    async def _acompile_source(self, latex_code: str, working_dir: Path, engine: str) -> None:
+        """Async counterpart of `_compile_source`; warm workers are not used here."""
+        main_tex_path = working_dir / _MAIN_TEX_FILENAME
+        split = split_preamble(latex_code) if self.format_cache is not None else None
+        format_path = None
+        if split is not None:
+            # Dumps are rare but take seconds; keep them off the event loop.
+            format_path = await asyncio.to_thread(
+                self.format_cache.get_or_build,
+                engine,
+                split[0],
+                self._dump_format,
+            )
+
+        if format_path is not None:
+            main_tex_path.write_text(pad_body_lines(*split), encoding="utf-8")
+            command, env = _compiler_command(engine, working_dir, format_path)
+            try:
+                await self._arun_process(command, working_dir, role="Compiler", env=env)
+                return
+            except CompilationError as exc:
+                if not is_format_load_error(str(exc)):
+                    raise
+                self.format_cache.invalidate(engine, split[0])
+
+        main_tex_path.write_text(latex_code, encoding="utf-8")
+        command, env = _compiler_command(engine, working_dir)
+        await self._arun_process(command, working_dir, role="Compiler", env=env)
+
+    async def _arun_process(
+            self,
+            command: list[str],
+            working_dir: Path,
+            role: str,
+            env: dict[str, str] | None = None,
+    ) -> None:
+        """Run `command` without blocking the event loop.
+
+        The process group is killed as soon as the timeout expires or the
+        awaiting task is cancelled, so abandoned requests stop using CPU.
+        """
+        executable = command[0]
+        timeout = self._stage_timeout(executable, role)
+        popen_kwargs = _popen_kwargs(working_dir, env)
+        popen_kwargs.pop("text")
+        try:
+            process = await asyncio.create_subprocess_exec(*command, **popen_kwargs)
+        except FileNotFoundError as exc:
+            raise CompilationError(
+                _format_compilation_error(
+                    summary=f"{role} executable '{executable}' was not found.",
+                    working_dir=None,
+                    stderr=str(exc),
+                )
+            ) from exc
+
+        try:
+            stdout, stderr = await asyncio.wait_for(
+                process.communicate(),
+                timeout=timeout,
+            )
+        except asyncio.TimeoutError as exc:
+            await self._aterminate_process_group(process)
+            raise CompilationTimeoutError(
+                _format_compilation_error(
+                    summary=f"{role} '{executable}' timed out after {timeout:.1f}s.",
+                    working_dir=working_dir,
+                )
+            ) from exc
+        finally:
+            if process.returncode is None:
+                await self._aterminate_process_group(process)
+
+        if process.returncode != 0:
+            raise CompilationError(
+                _format_compilation_error(
+                    summary=f"{role} '{executable}' exited with return code {process.returncode}.",
+                    working_dir=working_dir,
+                    stdout=stdout,
+                    stderr=stderr,
+                )
+            )
+
+    async def _aterminate_process_group(self, process: asyncio.subprocess.Process) -> None:
+        if process.returncode is not None:
+            return
+
+        try:
+            if os.name == "nt":
+                process.kill()
+            else:
+                os.killpg(process.pid, signal.SIGKILL)
+        except ProcessLookupError:
+            return
+
+        try:
+            await asyncio.wait_for(process.wait(), timeout=_PROCESS_EXIT_TIMEOUT_SECONDS)
+        except asyncio.TimeoutError:
+            pass
+
     def _cleanup_working_dir(self, working_dir: Path) -> None:
         shutil.rmtree(working_dir, ignore_errors=True)
 
@@ -260,8 +625,20 @@ class AsyncLatexCompiler(LatexCompiler):
             api_url: str = "",
             compile_dir: str | os.PathLike[str] | None = None,
             timeout: float | None = None,
+            format_cache: FormatCache | None = None,
+            worker_pool: WarmWorkerPool | None = None,
+            cancel_token: CancellationToken | None = None,
+            deadline: float | None = None,
     ):
-        super().__init__(api_url=api_url, compile_dir=compile_dir, timeout=timeout)
+        super().__init__(
+            api_url=api_url,
+            compile_dir=compile_dir,
+            timeout=timeout,
+            format_cache=format_cache,
+            worker_pool=worker_pool,
+            cancel_token=cancel_token,
+            deadline=deadline,
+        )
 
     def compile(
             self,
@@ -278,14 +655,23 @@ class AsyncLatexCompiler(LatexCompiler):
             images: Optional[list[tuple[str, str]]] = None,
             compiler="pdflatex",
     ):
-        """Asynchronous version of the local compile method."""
-        return await asyncio.to_thread(
-            super().compile,
-            latex_code,
-            images,
-            compiler,
+        """Asynchronous version of the local compile method.
+
+        The compiler runs as an asyncio subprocess, so no executor thread is
+        held while it works and cancelling the caller kills it.
+        """
+        compiler = compiler or _DEFAULT_COMPILER
+        working_dir = Path(
+            tempfile.mkdtemp(prefix="latex-", dir=self._ensure_compile_dir())
         )
 
+        try:
+            self._write_resources(working_dir, images or [])
+            await self._acompile_source(latex_code, working_dir, compiler)
+            return self._check_pdf_output(working_dir).read_bytes()
+        finally:
+            self._cleanup_working_dir(working_dir)
+
 
 def _resolve_compile_dir() -> Path:
     for env_var in _COMPILE_DIR_ENV_VARS:
@@ -308,6 +694,69 @@ def _resolve_timeout() -> float:
     return timeout if timeout > 0 else _DEFAULT_TIMEOUT_SECONDS
 
 
+def _kill_process_group_nowait(process: subprocess.Popen) -> None:
+    # Runs on the cancelling (event loop) thread, so it must not wait for exit.
+    if process.poll() is not None:
+        return
+    try:
+        if os.name == "nt":
+            process.kill()
+        else:
+            os.killpg(process.pid, signal.SIGKILL)
+    except (ProcessLookupError, OSError):
+        pass
+
+
+def _compiler_command(
+        compiler: str,
+        working_dir: Path,
+        format_path: Path | None = None,
+) -> tuple[list[str], dict[str, str] | None]:
+    command = [compiler]
+    env = None
+    if format_path is not None:
+        command.append(f"-fmt={format_path.stem}")
+        env = _format_search_env(format_path.parent)
+    command.extend(
+        [
+            "-interaction=nonstopmode",
+            "-halt-on-error",
+            "-file-line-error",
+            "-no-shell-escape",
+            f"-output-directory={working_dir}",
+            _MAIN_TEX_FILENAME,
+        ]
+    )
+    return command, env
+
+
+def _popen_kwargs(working_dir: Path, env: dict[str, str] | None) -> dict:
+    popen_kwargs = {
+        "cwd": str(working_dir),
+        "stdout": subprocess.PIPE,
+        "stderr": subprocess.PIPE,
+        "text": True,
+    }
+    if env is not None:
+        popen_kwargs["env"] = env
+    if sys.platform == "win32":
+        popen_kwargs["creationflags"] = getattr(
+            subprocess,
+            "CREATE_NEW_PROCESS_GROUP",
+            0,
+        )
+    else:
+        popen_kwargs["start_new_session"] = True
+    return popen_kwargs
+
+
+def _format_search_env(format_dir: Path) -> dict[str, str]:
+    # The trailing separator keeps kpathsea's default format path after ours.
+    env = os.environ.copy()
+    env["TEXFORMATS"] = f"{format_dir}{os.pathsep}"
+    return env
+
+
 def _resolve_resource_path(working_dir: Path, relative_path: str) -> Path:
     output_path = (working_dir / relative_path).resolve()
     try:
@@ -2,56 +2,45 @@
     pdf2image custom buffer parsers
 """
 
+import zlib
 from io import BytesIO
-from typing import List
+from typing import List, Tuple, Union
 
 from PIL import Image
 
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+_NETPBM_HEADER_MAX = 64
 
-def parse_buffer_to_ppm(data: bytes) -> List[Image.Image]:
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def parse_buffer_to_ppm(data: Buffer) -> List[Image.Image]:
     """Parse PPM file bytes to Pillow Image
 
+    Pages are sliced out of `data` without copying; Pillow unpacks the RGB
+    pixels into its own layout once.
+
     :param data: pdftoppm/pdftocairo output bytes
     :type data: bytes
     :return: List of PPM images parsed from the output
     :rtype: List[Image.Image]
     """
 
-    images = []
+    return _parse_netpbm_buffer(data, b"P6", "RGB", 3)
 
-    index = 0
-
-    while index < len(data):
-        code, size, rgb = tuple(data[index : index + 40].split(b"\n")[0:3])
-        size_x, size_y = tuple(size.split(b" "))
-        file_size = len(code) + len(size) + len(rgb) + 3 + int(size_x) * int(size_y) * 3
-        images.append(Image.open(BytesIO(data[index : index + file_size])))
-        index += file_size
 
-    return images
-
-
-def parse_buffer_to_pgm(data: bytes) -> List[Image.Image]:
+def parse_buffer_to_pgm(data: Buffer) -> List[Image.Image]:
     """Parse PGM file bytes to Pillow Image
 
+    The images are mapped onto `data` instead of copying the pixels.
+
     :param data: pdftoppm/pdftocairo output bytes
     :type data: bytes
     :return: List of PGM images parsed from the output
     :rtype: List[Image.Image]
     """
 
-    images = []
-
-    index = 0
-
-    while index < len(data):
-        code, size, maxval = tuple(data[index : index + 40].split(b"\n")[0:3])
-        size_x, size_y = tuple(size.split(b" "))
-        file_size = len(code) + len(size) + len(maxval) + 3 + int(size_x) * int(size_y)
-        images.append(Image.open(BytesIO(data[index : index + file_size])))
-        index += file_size
-
-    return images
+    return _parse_netpbm_buffer(data, b"P5", "L", 1)
 
 
 def parse_buffer_to_jpeg(data: bytes) -> List[Image.Image]:
@@ -71,28 +60,96 @@ def parse_buffer_to_jpeg(data: bytes) -> List[Image.Image]:
     ]
 
 
-def parse_buffer_to_png(data: bytes) -> List[Image.Image]:
+def parse_buffer_to_png(data: Buffer, validate_crc: bool = False) -> List[Image.Image]:
     """Parse PNG file bytes to Pillow Image
 
     :param data: pdftoppm/pdftocairo output bytes
     :type data: bytes
+    :param validate_crc: Check every chunk's CRC while splitting, defaults to False
+    :type validate_crc: bool, optional
     :return: List of PNG images parsed from the output
     :rtype: List[Image.Image]
     """
 
+    return [Image.open(BytesIO(page)) for page in split_png_buffer(data, validate_crc)]
+
+
+def split_png_buffer(data: Buffer, validate_crc: bool = False) -> List[memoryview]:
+    """Split concatenated PNG files by walking their chunk headers.
+
+    Only the 8-byte chunk headers are read, so the cost grows with the number
+    of chunks rather than the number of bytes. The returned pages are
+    `memoryview` slices of `data`; nothing is copied.
+
+    :param data: One or more PNG files back to back
+    :type data: bytes
+    :param validate_crc: Check every chunk's CRC, defaults to False
+    :type validate_crc: bool, optional
+    :raises ValueError: Raised on a missing signature, a truncated chunk or a CRC mismatch
+    :return: One view per PNG file
+    :rtype: List[memoryview]
+    """
+
+    view = memoryview(data).cast("B")
+    data_len = len(view)
+    pages = []
+    start = 0
+    while start < data_len:
+        if view[start:start + 8] != PNG_SIGNATURE:
+            raise ValueError(f"PNG signature missing at offset {start}")
+        index = start + 8
+        while True:
+            if index + 12 > data_len:
+                raise ValueError(f"Truncated PNG chunk at offset {index}")
+            length = int.from_bytes(view[index:index + 4], "big")
+            chunk_end = index + 12 + length
+            if chunk_end > data_len:
+                raise ValueError(f"Truncated PNG chunk at offset {index}")
+            chunk_type = view[index + 4:index + 8]
+            if validate_crc:
+                expected = int.from_bytes(view[chunk_end - 4:chunk_end], "big")
+                if zlib.crc32(view[index + 4:chunk_end - 4]) != expected:
+                    raise ValueError(
+                        f"CRC mismatch in {bytes(chunk_type)!r} chunk at offset {index}"
+                    )
+            index = chunk_end
+            if chunk_type == b"IEND":
+                break
+        pages.append(view[start:index])
+        start = index
+    return pages
+
+
+def _parse_netpbm_buffer(
+        data: Buffer,
+        magic: bytes,
+        mode: str,
+        channels: int,
+) -> List[Image.Image]:
+    view = memoryview(data).cast("B")
     images = []
+    index = 0
+    while index < len(view):
+        (width, height), header_len = _read_netpbm_header(view, index, magic)
+        pixels_start = index + header_len
+        pixels_end = pixels_start + width * height * channels
+        if pixels_end > len(view):
+            raise ValueError(f"Truncated {magic.decode()} image at offset {index}")
+        images.append(
+            Image.frombuffer(
+                mode, (width, height), view[pixels_start:pixels_end], "raw", mode, 0, 1
+            )
+        )
+        index = pixels_end
+    return images
+
 
-    c1 = 0
-    c2 = 0
-    data_len = len(data)
-    while c1 < data_len:
-        # IEND can appear in a PNG without being the actual end
-        if data[c2 : c2 + 4] == b"IEND" and (
-                c2 + 8 == data_len or data[c2 + 9 : c2 + 12] == b"PNG"
-        ):
-            images.append(Image.open(BytesIO(data[c1 : c2 + 8])))
-            c1 = c2 + 8
-            c2 = c1
-        c2 += 1
-
-    return images
\ No newline at end of file
+def _read_netpbm_header(view: memoryview, index: int, magic: bytes) -> Tuple[Tuple[int, int], int]:
+    # poppler writes "P6\n<width> <height>\n255\n"; only the header is copied.
+    header = bytes(view[index:index + _NETPBM_HEADER_MAX])
+    code, size, maxval = header.split(b"\n")[0:3]
+    if code != magic:
+        raise ValueError(f"Expected {magic.decode()} image at offset {index}")
+    size_x, size_y = size.split(b" ")
+    header_len = len(code) + len(size) + len(maxval) + 3
+    return (int(size_x), int(size_y)), header_len
@@ -3,6 +3,7 @@
     PDFs into Pillow images.
 """
 
+import asyncio
 import os
 import platform
 import tempfile
@@ -386,6 +387,229 @@ def convert_from_bytes(
         os.remove(temp_filename)
 
 
+def convert_to_png_bytes(
+        pdf_file: bytes,
+        dpi: int = 300,
+        first_page: int = None,
+        last_page: int = None,
+        transparent: bool = False,
+        single_file: bool = False,
+        strict: bool = False,
+        poppler_path: Union[str, PurePath] = None,
+        use_pdftocairo: bool = False,
+        timeout: float = None,
+) -> List[bytes]:
+    """Rasterize a PDF to PNG and return poppler's encoded output untouched.
+
+    Unlike `convert_from_bytes(fmt="png")` no page is decoded into a Pillow
+    image, so the uncompressed bitmap never exists in this process. The PDF
+    is piped to poppler on stdin instead of being written to a temp file.
+
+    :param pdf_file: Bytes of the PDF that you want to convert
+    :type pdf_file: bytes
+    :param dpi: Image quality in DPI, defaults to 300
+    :type dpi: int, optional
+    :param first_page: First page to process, defaults to None
+    :type first_page: int, optional
+    :param last_page: Last page to process before stopping, defaults to None
+    :type last_page: int, optional
+    :param transparent: Output with a transparent background (always uses pdftocairo), defaults to False
+    :type transparent: bool, optional
+    :param single_file: Only render `first_page` (page 1 by default) with -singlefile and read it from stdout,
+        defaults to False
+    :type single_file: bool, optional
+    :param strict: When a Syntax Error is thrown, it will be raised as an Exception, defaults to False
+    :type strict: bool, optional
+    :param poppler_path: Path to look for poppler binaries, defaults to None
+    :type poppler_path: Union[str, PurePath], optional
+    :param use_pdftocairo: Use pdftocairo instead of pdftoppm, defaults to False
+    :type use_pdftocairo: bool, optional
+    :param timeout: Raise PDFPopplerTimeoutError after the given time, defaults to None
+    :type timeout: float, optional
+    :raises PDFPopplerTimeoutError: Raised after the timeout for the image processing is exceeded
+    :raises PDFSyntaxError: Raised if poppler produced no page, or on a syntax error with strict=True
+    :return: One PNG file per page between first_page and last_page
+    :rtype: List[bytes]
+    """
+
+    # A single page is streamed through stdout; several pages are written as
+    # files because pdftocairo cannot stream more than one.
+    work_dir = None if single_file else tempfile.mkdtemp()
+    try:
+        output_root = None if work_dir is None else os.path.join(work_dir, "page")
+        args = build_png_command(
+            "-", output_root, dpi, first_page, last_page, transparent, single_file,
+            use_pdftocairo, poppler_path,
+        )
+        startupinfo = None
+        if platform.system() == "Windows":
+            startupinfo = subprocess.STARTUPINFO()
+            startupinfo.dwFlags |= subprocess.STARTF_USESHOWWINDOW
+        proc = Popen(
+            args,
+            env=_poppler_env(poppler_path),
+            stdin=PIPE,
+            stdout=PIPE,
+            stderr=PIPE,
+            startupinfo=startupinfo,
+        )
+        try:
+            data, err = proc.communicate(input=pdf_file, timeout=timeout)
+        except TimeoutExpired:
+            proc.kill()
+            proc.communicate()
+            raise PDFPopplerTimeoutError("Run poppler timeout.")
+
+        return _collect_png_output(data, err, output_root, strict)
+    finally:
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+async def aconvert_to_png_bytes(
+        pdf_file: bytes,
+        dpi: int = 300,
+        first_page: int = None,
+        last_page: int = None,
+        transparent: bool = False,
+        single_file: bool = False,
+        strict: bool = False,
+        poppler_path: Union[str, PurePath] = None,
+        use_pdftocairo: bool = False,
+        timeout: float = None,
+) -> List[bytes]:
+    """Asynchronous variant of `convert_to_png_bytes`.
+
+    poppler is killed when the timeout expires or the awaiting task is cancelled.
+    """
+
+    work_dir = None if single_file else tempfile.mkdtemp()
+    try:
+        output_root = None if work_dir is None else os.path.join(work_dir, "page")
+        args = build_png_command(
+            "-", output_root, dpi, first_page, last_page, transparent, single_file,
+            use_pdftocairo, poppler_path,
+        )
+        proc = await asyncio.create_subprocess_exec(
+            *args, env=_poppler_env(poppler_path), stdin=PIPE, stdout=PIPE, stderr=PIPE
+        )
+        try:
+            data, err = await asyncio.wait_for(proc.communicate(pdf_file), timeout=timeout)
+        except asyncio.TimeoutError:
+            raise PDFPopplerTimeoutError("Run poppler timeout.")
+        finally:
+            if proc.returncode is None:
+                proc.kill()
+                await proc.wait()
+
+        return _collect_png_output(data, err, output_root, strict)
+    finally:
+        if work_dir is not None:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+
+def build_png_command(
+        pdf_path: Union[str, PurePath],
+        output_root: Union[str, PurePath, None],
+        dpi: int = 300,
+        first_page: int = None,
+        last_page: int = None,
+        transparent: bool = False,
+        single_file: bool = False,
+        use_pdftocairo: bool = False,
+        poppler_path: Union[str, PurePath] = None,
+) -> List[str]:
+    """Build a pdftoppm/pdftocairo command line that writes PNG pages directly.
+
+    Pages go to `<output_root>-<n>.png`, or `<output_root>.png` with
+    `single_file`. With `single_file` and no `output_root` the page is
+    written to stdout. A `pdf_path` of "-" reads the PDF from stdin.
+
+    :param pdf_path: PDF to rasterize, or "-" for stdin
+    :type pdf_path: Union[str, PurePath]
+    :param output_root: Output file prefix, or None for stdout (requires single_file)
+    :type output_root: Union[str, PurePath, None]
+    :return: The command line, executable first
+    :rtype: List[str]
+    """
+
+    if isinstance(pdf_path, PurePath):
+        pdf_path = pdf_path.as_posix()
+    if isinstance(output_root, PurePath):
+        output_root = output_root.as_posix()
+    if isinstance(poppler_path, PurePath):
+        poppler_path = poppler_path.as_posix()
+
+    # Only pdftocairo can write an alpha channel.
+    use_pdfcairo = use_pdftocairo or transparent
+    if single_file:
+        first_page = first_page or 1
+        last_page = first_page
+    args = _build_command(
+        ["-r", str(dpi), pdf_path],
+        None,
+        first_page,
+        last_page,
+        "png",
+        None,
+        None,
+        None,
+        None,
+        False,
+        transparent,
+        single_file,
+        False,
+        None,
+        False,
+    )
+    if output_root is not None:
+        args.append(output_root)
+    elif use_pdfcairo:
+        args.append("-")
+    command = "pdftocairo" if use_pdfcairo else "pdftoppm"
+    return [_get_command_path(command, poppler_path)] + args
+
+
+def read_png_pages(output_root: Union[str, PurePath]) -> List[bytes]:
+    """Read back the pages written for `output_root` by a `build_png_command` command, in page order."""
+    folder, prefix = os.path.split(os.fspath(output_root))
+    pages = []
+    for f in sorted(os.listdir(folder or ".")):
+        if f.startswith(prefix) and f.endswith(".png"):
+            with open(os.path.join(folder, f), "rb") as page_file:
+                pages.append(page_file.read())
+    return pages
+
+
+def _poppler_env(poppler_path: Union[str, PurePath, None]) -> Dict:
+    env = os.environ.copy()
+    if poppler_path is not None:
+        poppler_path = os.fspath(poppler_path)
+        env["LD_LIBRARY_PATH"] = poppler_path + ":" + env.get("LD_LIBRARY_PATH", "")
+    return env
+
+
+def _collect_png_output(
+        data: bytes,
+        err: bytes,
+        output_root: Union[str, None],
+        strict: bool,
+) -> List[bytes]:
+    if b"Syntax Error" in err and strict:
+        raise PDFSyntaxError(err.decode("utf8", "ignore"))
+
+    if output_root is None:
+        pages = [data] if data else []
+    else:
+        pages = read_png_pages(output_root)
+
+    if not pages:
+        raise PDFSyntaxError(
+            "Poppler produced no PNG output.\n" + err.decode("utf8", "ignore")
+        )
+    return pages
+
+
 def _build_command(
         args: List,
         output_folder: str,
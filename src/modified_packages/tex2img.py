@@ -23,16 +23,26 @@ Example usage:
         f.write(png_data)
 """
 
-from io import BytesIO
+import tempfile
+from pathlib import Path
 
 from . import pdf2image
 
-from .latex_compiler import LatexCompiler, AsyncLatexCompiler
+from .exceptions import CompilationError
+from .latex_compiler import (
+    AsyncLatexCompiler,
+    LatexCompiler,
+    _DEFAULT_COMPILER,
+    _format_compilation_error,
+)
+
+# Pages are written next to main.pdf as _raster-<n>.png.
+_RASTER_ROOT = "_raster"
 
 
 class Latex2PNG(LatexCompiler):
     """ Class to compile LaTeX code to PNG file.
-    Only first page of the PDF file is converted to PNG.
+    Pages between `first_page` and `last_page` are converted to PNG.
 
     Attributes
     ----------
@@ -41,12 +51,12 @@ class Latex2PNG(LatexCompiler):
 
     Methods
     -------
-    compile(latex_code, images=None, compiler='pdflatex')
+    compile(latex_code, images=None, compiler='pdflatex', transparent=False, dpi=300, first_page=None, last_page=None)
         Compile LaTeX code to PNG file.
     """
 
     def compile(self, latex_code, images: list[tuple[str, str]] | None = None, compiler='pdflatex', transparent=False,
-                dpi=300):
+                dpi=300, first_page=None, last_page=None):
         """ Compile LaTeX code to PNG file.
 
         Parameters
@@ -61,6 +71,11 @@ class Latex2PNG(LatexCompiler):
             LaTeX transparency to use, by default False
         dpi : int, optional
             LaTeX quality to use, by default 300
+        first_page : int, optional
+            First page to rasterize, by default None (page 1)
+        last_page : int, optional
+            Last page to rasterize, by default None (the last page); later
+            pages are never rendered
 
         Returns
         -------
@@ -72,14 +87,24 @@ class Latex2PNG(LatexCompiler):
         CompilationError
             If the compilation failed.
         """
-        png_results = []
-        pdf = super().compile(latex_code, images, compiler)
-        with BytesIO(pdf) as pdf_file:
-            for i in pdf2image.convert_from_bytes(pdf_file.read(), dpi=dpi, thread_count=1, transparent=transparent):
-                with BytesIO() as png_bytes:
-                    i.save(png_bytes, 'PNG')
-                    png_results.append(png_bytes.getvalue())
-        return png_results
+        compiler = compiler or _DEFAULT_COMPILER
+        working_dir = Path(
+            tempfile.mkdtemp(prefix="latex-", dir=self._ensure_compile_dir())
+        )
+
+        try:
+            self._write_resources(working_dir, images or [])
+            self._compile_source(latex_code, working_dir, compiler, allow_worker=not images)
+            pdf_path = self._check_pdf_output(working_dir)
+            # Rasterize main.pdf in place; poppler's PNG output is returned as-is.
+            self._run_process(
+                _rasterizer_command(pdf_path, transparent, dpi, first_page, last_page),
+                working_dir,
+                role="Rasterizer",
+            )
+            return _read_raster_output(working_dir)
+        finally:
+            self._cleanup_working_dir(working_dir)
 
 
 class AsyncLatex2PNG(AsyncLatexCompiler):
@@ -87,7 +112,7 @@ class AsyncLatex2PNG(AsyncLatexCompiler):
 
     Methods
     -------
-    acompile(latex_code, images=None, compiler='pdflatex')
+    acompile(latex_code, images=None, compiler='pdflatex', transparent=False, dpi=300, first_page=None, last_page=None)
         Compile LaTeX code to PNG file.
     """
 
@@ -98,9 +123,12 @@ class AsyncLatex2PNG(AsyncLatexCompiler):
 
     async def acompile(self, latex_code,
                        images: list[tuple[str, str]] | None = None,
-                       compiler='pdflatex'):
+                       compiler='pdflatex', transparent=False, dpi=300, first_page=None, last_page=None):
         """ Compile LaTeX code to PNG file asynchronously.
 
+        Both the TeX run and the PDF rasterization are asyncio subprocesses,
+        so cancelling the awaiting task stops them.
+
         Parameters
         ----------
         latex_code : str
@@ -109,6 +137,15 @@ class AsyncLatex2PNG(AsyncLatexCompiler):
             List of images to include in the PDF file, by default None
         compiler : str, optional
             LaTeX compiler to use, by default 'pdflatex'
+        transparent : bool, optional
+            LaTeX transparency to use, by default False
+        dpi : int, optional
+            LaTeX quality to use, by default 300
+        first_page : int, optional
+            First page to rasterize, by default None (page 1)
+        last_page : int, optional
+            Last page to rasterize, by default None (the last page); later
+            pages are never rendered
 
         Returns
         -------
@@ -120,11 +157,52 @@ class AsyncLatex2PNG(AsyncLatexCompiler):
         CompilationError
             If the compilation failed.
         """
-        png_results = []
-        pdf = await super().acompile(latex_code, images, compiler)
-        with BytesIO(pdf) as pdf_file:
-            for i in pdf2image.convert_from_bytes(pdf_file.read(), 300):
-                with BytesIO() as png_bytes:
-                    i.save(png_bytes, 'PNG')
-                    png_results.append(png_bytes.getvalue())
-        return png_results
+        compiler = compiler or _DEFAULT_COMPILER
+        working_dir = Path(
+            tempfile.mkdtemp(prefix="latex-", dir=self._ensure_compile_dir())
+        )
+
+        try:
+            self._write_resources(working_dir, images or [])
+            await self._acompile_source(latex_code, working_dir, compiler)
+            pdf_path = self._check_pdf_output(working_dir)
+            await self._arun_process(
+                _rasterizer_command(pdf_path, transparent, dpi, first_page, last_page),
+                working_dir,
+                role="Rasterizer",
+            )
+            return _read_raster_output(working_dir)
+        finally:
+            self._cleanup_working_dir(working_dir)
+
+
+def _rasterizer_command(
+        pdf_path: Path,
+        transparent: bool,
+        dpi: int,
+        first_page: int | None,
+        last_page: int | None,
+) -> list[str]:
+    # A single page is written with -singlefile, so poppler skips page numbering.
+    single_file = first_page is not None and first_page == last_page
+    return pdf2image.build_png_command(
+        pdf_path.name,
+        _RASTER_ROOT,
+        dpi=dpi,
+        first_page=first_page,
+        last_page=last_page,
+        transparent=transparent,
+        single_file=single_file,
+    )
+
+
+def _read_raster_output(working_dir: Path) -> list[bytes]:
+    pages = pdf2image.read_png_pages(working_dir / _RASTER_ROOT)
+    if not pages:
+        raise CompilationError(
+            _format_compilation_error(
+                summary="Rasterizer completed without producing a PNG.",
+                working_dir=working_dir,
+            )
+        )
+    return pages
@@ -0,0 +1,148 @@
+"""Pre-spawned TeX processes that are already past startup when a job arrives."""
+
+import logging
+import os
+import shutil
+import signal
+import subprocess
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Callable, Hashable
+
+_LOGGER = logging.getLogger(__name__)
+_DEFAULT_MAX_IDLE_SECONDS = 300.0
+_DEFAULT_MAX_KEYS = 2
+
+
+@dataclass
+class WarmTexWorker:
+    """A TeX process blocked on stdin, waiting for the path of the file to typeset."""
+
+    process: subprocess.Popen
+    working_dir: Path
+    started_at: float
+
+    def is_healthy(self, max_idle_seconds: float) -> bool:
+        if self.process.poll() is not None:
+            return False
+        return time.monotonic() - self.started_at <= max_idle_seconds
+
+
+class WarmWorkerPool:
+    """Keep `size` idle TeX workers per (engine, format) key.
+
+    TeX cannot reset its state between documents, so every worker serves a
+    single job; `acquire` hands one out and immediately spawns its
+    replacement, which loads the format and font maps while the current job
+    runs. Workers that exited or sat idle longer than `max_idle_seconds`
+    (for example across a TeX Live update) are discarded instead of used.
+    """
+
+    def __init__(
+            self,
+            size: int = 1,
+            max_idle_seconds: float = _DEFAULT_MAX_IDLE_SECONDS,
+            max_keys: int = _DEFAULT_MAX_KEYS,
+    ):
+        self.size = max(1, size)
+        self.max_idle_seconds = max_idle_seconds
+        self.max_keys = max(1, max_keys)
+        self._lock = threading.Lock()
+        self._idle: OrderedDict[Hashable, list[WarmTexWorker]] = OrderedDict()
+        self._closed = False
+
+    def acquire(
+            self,
+            key: Hashable,
+            spawn: Callable[[], WarmTexWorker],
+    ) -> WarmTexWorker | None:
+        """Return a warm worker for `key`, or None when the caller should run a cold process.
+
+        Either way the pool is topped back up to `size` idle workers with `spawn()`.
+        """
+        return self._take_and_top_up(key, spawn, take=True)
+
+    def prime(self, key: Hashable, spawn: Callable[[], WarmTexWorker]) -> None:
+        """Spawn idle workers for `key` ahead of the first job."""
+        self._take_and_top_up(key, spawn, take=False)
+
+    def _take_and_top_up(
+            self,
+            key: Hashable,
+            spawn: Callable[[], WarmTexWorker],
+            take: bool,
+    ) -> WarmTexWorker | None:
+        stale: list[WarmTexWorker] = []
+        worker = None
+        with self._lock:
+            if self._closed:
+                return None
+            workers = self._idle.setdefault(key, [])
+            self._idle.move_to_end(key)
+            healthy = [
+                candidate
+                for candidate in workers
+                if candidate.is_healthy(self.max_idle_seconds)
+            ]
+            stale.extend(candidate for candidate in workers if candidate not in healthy)
+            if take and healthy:
+                worker = healthy.pop(0)
+            workers[:] = healthy
+            while len(self._idle) > self.max_keys:
+                _evicted_key, evicted_workers = self._idle.popitem(last=False)
+                stale.extend(evicted_workers)
+            missing = self.size - len(workers)
+
+        for stale_worker in stale:
+            discard_worker(stale_worker)
+        for _ in range(missing):
+            self._spawn_idle(key, spawn)
+        return worker
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            workers = [worker for idle in self._idle.values() for worker in idle]
+            self._idle.clear()
+        for worker in workers:
+            discard_worker(worker)
+
+    def _spawn_idle(self, key: Hashable, spawn: Callable[[], WarmTexWorker]) -> None:
+        try:
+            worker = spawn()
+        except Exception:
+            _LOGGER.warning("Warm TeX worker spawn failed key=%s", key, exc_info=True)
+            return
+
+        with self._lock:
+            idle = self._idle.get(key)
+            if not self._closed and idle is not None and len(idle) < self.size:
+                idle.append(worker)
+                return
+        discard_worker(worker)
+
+
+def discard_worker(worker: WarmTexWorker) -> None:
+    """Kill the worker's process group and remove its scratch directory."""
+    if worker.process.poll() is None:
+        try:
+            if os.name == "nt":
+                worker.process.kill()
+            else:
+                os.killpg(worker.process.pid, signal.SIGKILL)
+        except (ProcessLookupError, OSError):
+            pass
+        try:
+            worker.process.wait(timeout=1.0)
+        except subprocess.TimeoutExpired:
+            pass
+    for stream in (worker.process.stdin, worker.process.stdout, worker.process.stderr):
+        if stream is not None:
+            try:
+                stream.close()
+            except OSError:
+                pass
+    shutil.rmtree(worker.working_dir, ignore_errors=True)
@@ -0,0 +1,226 @@
+"""Two-tier content-addressed cache for rendered LaTeX PNGs."""
+
+import hashlib
+import logging
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from pathlib import Path
+
+from env_settings import read_non_negative_int_env
+from modified_packages.latex_compiler import _resolve_compile_dir
+from runtime_counters import increment_counter
+
+_LOGGER = logging.getLogger(__name__)
+# Bump when renderer output changes so stale disk entries stop matching.
+_CACHE_KEY_VERSION = "1"
+_CACHE_DIR_NAME = "render-cache"
+_CACHE_FILE_SUFFIX = ".png"
+_DEFAULT_MEMORY_ENTRIES = 256
+_DEFAULT_MEMORY_MAX_BYTES = 32 * 1024 * 1024
+_DEFAULT_DISK_MAX_BYTES = 64 * 1024 * 1024
+
+
+def render_cache_key(latex_code: str, render_dpi: int, transparent: bool, variant: str = "") -> str:
+    """Hash the canonical render inputs that fully determine the PNG output.
+
+    `variant` covers output settings outside the source, such as the multi-page policy.
+    """
+    digest = hashlib.sha256()
+    for part in (_CACHE_KEY_VERSION, latex_code, str(int(render_dpi)), "1" if transparent else "0", variant):
+        digest.update(part.encode("utf-8"))
+        digest.update(b"\0")
+    return digest.hexdigest()
+
+
+class RenderCache:
+    """Bounded in-memory LRU backed by a size-capped directory of PNG files.
+
+    Counters are published through `runtime_counters` under the `render_cache.`
+    prefix so the bot can snapshot them into the metrics store.
+    """
+
+    def __init__(
+            self,
+            max_entries: int = _DEFAULT_MEMORY_ENTRIES,
+            max_memory_bytes: int = _DEFAULT_MEMORY_MAX_BYTES,
+            disk_dir: str | os.PathLike[str] | None = None,
+            max_disk_bytes: int = _DEFAULT_DISK_MAX_BYTES,
+    ):
+        self.max_entries = max(0, max_entries)
+        self.max_memory_bytes = max(0, max_memory_bytes)
+        self.disk_dir = Path(disk_dir) if disk_dir and max_disk_bytes > 0 else None
+        self.max_disk_bytes = max(0, max_disk_bytes)
+        self._lock = threading.Lock()
+        self._memory: OrderedDict[str, bytes] = OrderedDict()
+        self._memory_bytes = 0
+        self._disk_index: OrderedDict[str, int] | None = None
+        self._disk_bytes = 0
+
+    @classmethod
+    def from_env(cls) -> "RenderCache":
+        return cls(
+            max_entries=read_non_negative_int_env(
+                "LATEX_RENDER_CACHE_ENTRIES",
+                _DEFAULT_MEMORY_ENTRIES,
+            ),
+            max_memory_bytes=read_non_negative_int_env(
+                "LATEX_RENDER_CACHE_MEMORY_BYTES",
+                _DEFAULT_MEMORY_MAX_BYTES,
+            ),
+            disk_dir=_resolve_compile_dir() / _CACHE_DIR_NAME,
+            max_disk_bytes=read_non_negative_int_env(
+                "LATEX_RENDER_CACHE_DISK_BYTES",
+                _DEFAULT_DISK_MAX_BYTES,
+            ),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        return self._memory_enabled or self.disk_dir is not None
+
+    @property
+    def _memory_enabled(self) -> bool:
+        return self.max_entries > 0 and self.max_memory_bytes > 0
+
+    def get(self, key: str) -> bytes | None:
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            png_bytes = self._memory.get(key)
+            if png_bytes is not None:
+                self._memory.move_to_end(key)
+        if png_bytes is not None:
+            increment_counter("render_cache.memory_hits")
+            return png_bytes
+
+        png_bytes = self._read_disk_entry(key)
+        if png_bytes is not None:
+            increment_counter("render_cache.disk_hits")
+            self._put_memory(key, png_bytes)
+            return png_bytes
+
+        increment_counter("render_cache.misses")
+        return None
+
+    def put(self, key: str, png_bytes: bytes) -> None:
+        if not self.enabled or not png_bytes:
+            return
+        self._put_memory(key, png_bytes)
+        self._write_disk_entry(key, png_bytes)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+            disk_keys = list(self._disk_index or ())
+            self._disk_index = OrderedDict()
+            self._disk_bytes = 0
+        for key in disk_keys:
+            self._entry_path(key).unlink(missing_ok=True)
+
+    def _put_memory(self, key: str, png_bytes: bytes) -> None:
+        if not self._memory_enabled or len(png_bytes) > self.max_memory_bytes:
+            return
+
+        evicted = 0
+        with self._lock:
+            previous = self._memory.pop(key, None)
+            if previous is not None:
+                self._memory_bytes -= len(previous)
+            self._memory[key] = png_bytes
+            self._memory_bytes += len(png_bytes)
+            while (
+                len(self._memory) > self.max_entries
+                or self._memory_bytes > self.max_memory_bytes
+            ):
+                _evicted_key, evicted_bytes = self._memory.popitem(last=False)
+                self._memory_bytes -= len(evicted_bytes)
+                evicted += 1
+        if evicted:
+            increment_counter("render_cache.memory_evictions", evicted)
+
+    def _entry_path(self, key: str) -> Path:
+        return self.disk_dir / f"{key}{_CACHE_FILE_SUFFIX}"
+
+    def _load_disk_index_locked(self) -> OrderedDict[str, int]:
+        if self._disk_index is not None:
+            return self._disk_index
+
+        entries: list[tuple[float, str, int]] = []
+        try:
+            for path in self.disk_dir.glob(f"*{_CACHE_FILE_SUFFIX}"):
+                try:
+                    stat = path.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, path.stem, stat.st_size))
+        except OSError:
+            _LOGGER.warning("Render cache directory unreadable path=%s", self.disk_dir)
+
+        self._disk_index = OrderedDict(
+            (key, size) for _mtime, key, size in sorted(entries)
+        )
+        self._disk_bytes = sum(self._disk_index.values())
+        return self._disk_index
+
+    def _read_disk_entry(self, key: str) -> bytes | None:
+        if self.disk_dir is None:
+            return None
+
+        with self._lock:
+            disk_index = self._load_disk_index_locked()
+            if key not in disk_index:
+                return None
+            disk_index.move_to_end(key)
+
+        path = self._entry_path(key)
+        try:
+            png_bytes = path.read_bytes()
+            # Persist recency so the LRU order survives restarts.
+            os.utime(path)
+        except OSError:
+            with self._lock:
+                size = self._disk_index.pop(key, None)
+                if size is not None:
+                    self._disk_bytes -= size
+            return None
+        return png_bytes
+
+    def _write_disk_entry(self, key: str, png_bytes: bytes) -> None:
+        if self.disk_dir is None or len(png_bytes) > self.max_disk_bytes:
+            return
+
+        try:
+            self.disk_dir.mkdir(parents=True, exist_ok=True)
+            fd, temp_name = tempfile.mkstemp(dir=self.disk_dir, suffix=".tmp")
+            try:
+                with os.fdopen(fd, "wb") as temp_file:
+                    temp_file.write(png_bytes)
+                os.replace(temp_name, self._entry_path(key))
+            except BaseException:
+                Path(temp_name).unlink(missing_ok=True)
+                raise
+        except OSError:
+            _LOGGER.warning("Render cache disk write failed key=%s", key, exc_info=True)
+            return
+
+        evicted_keys: list[str] = []
+        with self._lock:
+            disk_index = self._load_disk_index_locked()
+            previous = disk_index.pop(key, None)
+            if previous is not None:
+                self._disk_bytes -= previous
+            disk_index[key] = len(png_bytes)
+            self._disk_bytes += len(png_bytes)
+            while self._disk_bytes > self.max_disk_bytes and len(disk_index) > 1:
+                evicted_key, evicted_size = disk_index.popitem(last=False)
+                self._disk_bytes -= evicted_size
+                evicted_keys.append(evicted_key)
+
+        for evicted_key in evicted_keys:
+            self._entry_path(evicted_key).unlink(missing_ok=True)
+        if evicted_keys:
+            increment_counter("render_cache.disk_evictions", len(evicted_keys))
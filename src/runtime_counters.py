@@ -0,0 +1,22 @@
+import threading
+
+
+_COUNTERS_LOCK = threading.Lock()
+_COUNTERS: dict[str, int] = {}
+
+
+def increment_counter(name: str, amount: int = 1) -> None:
+    """Add `amount` to a process-wide counter; safe to call from executor threads."""
+    with _COUNTERS_LOCK:
+        _COUNTERS[name] = _COUNTERS.get(name, 0) + amount
+
+
+def snapshot_counters() -> dict[str, int]:
+    """Return a copy of every counter recorded since process start."""
+    with _COUNTERS_LOCK:
+        return dict(_COUNTERS)
+
+
+def reset_counters() -> None:
+    with _COUNTERS_LOCK:
+        _COUNTERS.clear()
@@ -1,4 +1,5 @@
 import argparse
+import io
 import statistics
 import sys
 import tempfile
@@ -8,7 +9,19 @@ from pathlib import Path
 sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
 
 import latex_module
-from modified_packages import InlineDviPngRenderer, Latex2PNG
+from modified_packages import (
+    FormatCache,
+    InlineDviPngRenderer,
+    Latex2PNG,
+    LatexCompiler,
+    WarmWorkerPool,
+    convert_from_bytes,
+    convert_to_png_bytes,
+)
+from render_cache import RenderCache
+
+# Measure real renders; repeated formulas would otherwise be served from cache.
+latex_module._RENDER_CACHE = RenderCache(max_entries=0, disk_dir=None)
 
 BENCHMARK_CASES = [
     ("fraction", r"\frac{1}{2}"),
@@ -17,25 +30,52 @@ BENCHMARK_CASES = [
 ]
 
 
+_BENCHMARK_FORMAT_DIR = tempfile.TemporaryDirectory(prefix="latex-bench-formats-")
+_BENCHMARK_FORMAT_CACHE = FormatCache(_BENCHMARK_FORMAT_DIR.name, max_formats=1)
+_BENCHMARK_WORKER_POOL = WarmWorkerPool(size=1)
+
+
 def _render_pdf(expr: str, dpi: int) -> None:
-    latex_code, transparent, render_dpi = latex_module._prepare_render_request(expr, dpi)
+    request = latex_module._prepare_render_request(expr, dpi)
     Latex2PNG().compile(
-        latex_code,
-        transparent=transparent,
+        request.latex_code,
+        transparent=request.transparent,
         compiler="pdflatex",
-        dpi=render_dpi,
+        dpi=request.render_dpi,
     )
 
 
-def _render_dvipng(expr: str, dpi: int) -> None:
+def _render_inline(
+        expr: str,
+        dpi: int,
+        format_cache: FormatCache | None,
+        worker_pool: WarmWorkerPool | None = None,
+) -> None:
     if not latex_module._is_dvipng_fast_path_eligible(expr):
         raise RuntimeError(f"Expression is not fast-path eligible: {expr}")
 
-    latex_code, transparent, render_dpi = latex_module._prepare_render_request(expr, dpi)
-    InlineDviPngRenderer().compile(
-        latex_code,
-        transparent=transparent,
-        dpi=render_dpi,
+    request = latex_module._prepare_render_request(expr, dpi)
+    InlineDviPngRenderer(format_cache=format_cache, worker_pool=worker_pool).compile(
+        request.latex_code,
+        transparent=request.transparent,
+        dpi=request.render_dpi,
+    )
+
+
+def _render_dvipng(expr: str, dpi: int) -> None:
+    _render_inline(expr, dpi, format_cache=None)
+
+
+def _render_dvipng_format(expr: str, dpi: int) -> None:
+    _render_inline(expr, dpi, format_cache=_BENCHMARK_FORMAT_CACHE)
+
+
+def _render_dvipng_warm(expr: str, dpi: int) -> None:
+    _render_inline(
+        expr,
+        dpi,
+        format_cache=_BENCHMARK_FORMAT_CACHE,
+        worker_pool=_BENCHMARK_WORKER_POOL,
     )
 
 
@@ -47,10 +87,60 @@ def _render_auto(expr: str, dpi: int) -> None:
             raise RuntimeError(result)
 
 
+def _rasterize_pil(pdf: bytes, dpi: int, transparent: bool) -> None:
+    # The pre-pass-through path: decode every page into Pillow, then re-encode.
+    for image in convert_from_bytes(pdf, dpi=dpi, thread_count=1, transparent=transparent):
+        with io.BytesIO() as png_bytes:
+            image.save(png_bytes, "PNG")
+
+
+def _rasterize_pdftoppm(pdf: bytes, dpi: int, transparent: bool) -> None:
+    # pdftoppm cannot write alpha, so this measures the opaque variant.
+    convert_to_png_bytes(pdf, dpi=dpi, single_file=True)
+
+
+def _rasterize_pdftocairo(pdf: bytes, dpi: int, transparent: bool) -> None:
+    convert_to_png_bytes(
+        pdf,
+        dpi=dpi,
+        transparent=transparent,
+        single_file=True,
+        use_pdftocairo=True,
+    )
+
+
+_RASTERIZERS = {
+    "pil": _rasterize_pil,
+    "pdftoppm": _rasterize_pdftoppm,
+    "pdftocairo": _rasterize_pdftocairo,
+}
+
+
+def _run_poppler_compare(dpis: list[int], runs: int) -> None:
+    """Compile each case to PDF once, then time only the PDF->PNG stage."""
+    for name, expr in BENCHMARK_CASES:
+        request = latex_module._prepare_render_request(expr, dpis[0])
+        pdf = LatexCompiler().compile(request.latex_code)
+        for dpi in dpis:
+            for rasterizer_name, rasterizer in _RASTERIZERS.items():
+                samples = []
+                for _ in range(runs):
+                    start = time.perf_counter()
+                    rasterizer(pdf, dpi, request.transparent)
+                    samples.append((time.perf_counter() - start) * 1000)
+                print(
+                    f"{name}: rasterizer={rasterizer_name} dpi={dpi} "
+                    f"mean_ms={round(statistics.mean(samples), 2)} "
+                    f"min_ms={round(min(samples), 2)} max_ms={round(max(samples), 2)}"
+                )
+
+
 def _time_case(mode: str, expr: str, dpi: int, runs: int) -> list[float]:
     renderer = {
         "pdf": _render_pdf,
         "dvipng": _render_dvipng,
+        "dvipng-format": _render_dvipng_format,
+        "dvipng-warm": _render_dvipng_warm,
         "auto": _render_auto,
     }[mode]
 
@@ -68,23 +158,48 @@ def main() -> None:
     )
     parser.add_argument(
         "--mode",
-        choices=("pdf", "dvipng", "auto"),
+        choices=(
+            "pdf",
+            "dvipng",
+            "dvipng-format",
+            "dvipng-warm",
+            "auto",
+            "format-compare",
+            "poppler-compare",
+        ),
         default="pdf",
-        help="pdf benchmarks the legacy pdflatex->PDF->PNG path.",
+        help=(
+            "pdf benchmarks the legacy pdflatex->PDF->PNG path; "
+            "format-compare runs dvipng with and without the dumped preamble format; "
+            "poppler-compare times Pillow re-encoding against pdftoppm and pdftocairo "
+            "PNG pass-through at 300, 500 and 800 DPI."
+        ),
     )
     parser.add_argument("--runs", type=int, default=3)
     parser.add_argument("--dpi", type=int, default=300)
     args = parser.parse_args()
 
-    print(f"mode={args.mode} dpi={args.dpi} runs={args.runs}")
-    for name, expr in BENCHMARK_CASES:
-        samples = _time_case(args.mode, expr, args.dpi, args.runs)
-        rounded = [round(sample, 2) for sample in samples]
-        print(
-            f"{name}: expr={expr} samples_ms={rounded} "
-            f"mean_ms={round(statistics.mean(samples), 2)} "
-            f"min_ms={round(min(samples), 2)} max_ms={round(max(samples), 2)}"
-        )
+    if args.mode == "poppler-compare":
+        _run_poppler_compare([300, 500, 800], args.runs)
+        return
+
+    modes = ("dvipng", "dvipng-format") if args.mode == "format-compare" else (args.mode,)
+    if "dvipng-format" in modes or "dvipng-warm" in modes:
+        # Dump (and spawn the first worker) outside the timed loop so samples
+        # reflect steady-state renders.
+        _render_dvipng_warm(BENCHMARK_CASES[0][1], args.dpi)
+
+    for mode in modes:
+        print(f"mode={mode} dpi={args.dpi} runs={args.runs}")
+        for name, expr in BENCHMARK_CASES:
+            samples = _time_case(mode, expr, args.dpi, args.runs)
+            rounded = [round(sample, 2) for sample in samples]
+            print(
+                f"{name}: expr={expr} samples_ms={rounded} "
+                f"mean_ms={round(statistics.mean(samples), 2)} "
+                f"min_ms={round(min(samples), 2)} max_ms={round(max(samples), 2)}"
+            )
+    _BENCHMARK_WORKER_POOL.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,111 @@
+import argparse
+import io
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from PIL import Image
+
+from modified_packages.parsers import parse_buffer_to_ppm, split_png_buffer
+
+
+def _legacy_split_png(data: bytes) -> list[bytes]:
+    """The byte-at-a-time IEND scan the chunk walker replaced, kept for comparison."""
+    pages = []
+    c1 = 0
+    c2 = 0
+    data_len = len(data)
+    while c1 < data_len:
+        if data[c2: c2 + 4] == b"IEND" and (
+                c2 + 8 == data_len or data[c2 + 9: c2 + 12] == b"PNG"
+        ):
+            pages.append(data[c1: c2 + 8])
+            c1 = c2 + 8
+            c2 = c1
+        c2 += 1
+    return pages
+
+
+def _legacy_parse_ppm(data: bytes) -> list[Image.Image]:
+    images = []
+    index = 0
+    while index < len(data):
+        code, size, rgb = tuple(data[index: index + 40].split(b"\n")[0:3])
+        size_x, size_y = tuple(size.split(b" "))
+        file_size = len(code) + len(size) + len(rgb) + 3 + int(size_x) * int(size_y) * 3
+        images.append(Image.open(io.BytesIO(data[index: index + file_size])))
+        index += file_size
+    return images
+
+
+def _loaded(parse):
+    # Image.open is lazy; force the pixel copy so both parsers do the same work.
+    def run(data):
+        for image in parse(data):
+            image.load()
+
+    return run
+
+
+def _synthetic_png_pages(pages: int, side: int) -> bytes:
+    """Noisy pages compress poorly, so the buffer is several megabytes like real high-DPI output."""
+    buffers = []
+    for _ in range(pages):
+        image = Image.frombytes("RGB", (side, side), os.urandom(side * side * 3))
+        with io.BytesIO() as buffer:
+            image.save(buffer, "PNG", compress_level=1)
+            buffers.append(buffer.getvalue())
+    return b"".join(buffers)
+
+
+def _synthetic_ppm_pages(pages: int, side: int) -> bytes:
+    header = f"P6\n{side} {side}\n255\n".encode()
+    return b"".join(header + bytes(side * side * 3) for _ in range(pages))
+
+
+def _time(func, data, runs: int) -> list[float]:
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func(data)
+        samples.append((time.perf_counter() - start) * 1000)
+    return samples
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Microbenchmark the pdf2image buffer parsers on multi-megabyte buffers.",
+    )
+    parser.add_argument("--pages", type=int, default=8)
+    parser.add_argument("--side", type=int, default=600)
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    png_data = _synthetic_png_pages(args.pages, args.side)
+    ppm_data = _synthetic_ppm_pages(args.pages, args.side)
+    cases = [
+        ("png-legacy-scan", _legacy_split_png, png_data),
+        ("png-chunk-walk", split_png_buffer, png_data),
+        ("png-chunk-walk-crc", lambda data: split_png_buffer(data, validate_crc=True), png_data),
+        ("ppm-legacy-open", _loaded(_legacy_parse_ppm), ppm_data),
+        ("ppm-memoryview", _loaded(parse_buffer_to_ppm), ppm_data),
+    ]
+
+    print(
+        f"pages={args.pages} side={args.side} runs={args.runs} "
+        f"png_bytes={len(png_data)} ppm_bytes={len(ppm_data)}"
+    )
+    for name, func, data in cases:
+        samples = _time(func, data, args.runs)
+        print(
+            f"{name}: mean_ms={round(statistics.mean(samples), 2)} "
+            f"min_ms={round(min(samples), 2)} max_ms={round(max(samples), 2)}"
+        )
+
+
+if __name__ == "__main__":
+    main()
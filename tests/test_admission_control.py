@@ -0,0 +1,82 @@
+import os
+import sys
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from admission_control import AdmissionController, AdmissionLimit
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _controller(clock, user=(60, 2, 0), guild=(0, 1, 0)) -> AdmissionController:
+    return AdmissionController(
+        user_limit=AdmissionLimit(*user, clock=clock),
+        guild_limit=AdmissionLimit(*guild, clock=clock),
+    )
+
+
+class AdmissionControlTestCase(unittest.TestCase):
+    def test_user_bucket_allows_burst_then_refills_at_rate(self):
+        clock = FakeClock()
+        controller = _controller(clock, user=(60, 2, 0))
+
+        self.assertIsNone(controller.try_admit(1, None))
+        self.assertIsNone(controller.try_admit(1, None))
+        self.assertEqual(controller.try_admit(1, None), "user_rate")
+        # Other users have their own bucket.
+        self.assertIsNone(controller.try_admit(2, None))
+
+        clock.now = 1.0
+        self.assertIsNone(controller.try_admit(1, None))
+
+    def test_in_flight_cap_is_freed_by_release(self):
+        controller = _controller(FakeClock(), user=(0, 1, 1))
+
+        self.assertIsNone(controller.try_admit(1, None))
+        self.assertEqual(controller.try_admit(1, None), "user_in_flight")
+
+        controller.release(1, None)
+        self.assertIsNone(controller.try_admit(1, None))
+
+    def test_guild_refusal_takes_no_user_tokens(self):
+        clock = FakeClock()
+        controller = _controller(clock, user=(60, 1, 0), guild=(0, 1, 1))
+
+        self.assertIsNone(controller.try_admit(1, "guild"))
+        self.assertEqual(controller.try_admit(2, "guild"), "guild_in_flight")
+        # User 2 was refused by the guild, so its own bucket is still full.
+        self.assertIsNone(controller.try_admit(2, None))
+        # Direct messages have no guild and skip the guild limit.
+        self.assertIsNone(controller.try_admit(3, None))
+
+    def test_from_env_reads_limits_and_zero_disables(self):
+        with patch.dict(
+            os.environ,
+            {
+                "LATEX_USER_RATE_PER_MINUTE": "0",
+                "LATEX_USER_MAX_IN_FLIGHT": "3",
+                "LATEX_GUILD_BURST": "not-a-number",
+            },
+        ):
+            controller = AdmissionController.from_env()
+
+        self.assertEqual(controller.user_limit.rate_per_second, 0)
+        self.assertEqual(controller.user_limit.max_in_flight, 3)
+        self.assertEqual(controller.guild_limit.burst, 20)
+        for _ in range(10):
+            controller.user_limit.acquire(1)
+            controller.user_limit.release(1)
+        self.assertIsNone(controller.user_limit.check(1))
+
+
+if __name__ == "__main__":
+    unittest.main()
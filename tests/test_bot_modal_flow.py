@@ -2,6 +2,8 @@ import asyncio
 import importlib
 import os
 import sys
+import threading
+import time
 import types
 import unittest
 import json
@@ -12,6 +14,8 @@ from unittest.mock import AsyncMock, Mock, patch
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
 
+from runtime_counters import increment_counter, reset_counters, snapshot_counters
+
 
 def _install_bot_import_stubs() -> None:
     google_module = types.ModuleType("google")
@@ -29,12 +33,71 @@ def _install_bot_import_stubs() -> None:
     logging_config_module.configure_logging = lambda: None
 
     latex_module_stub = types.ModuleType("latex_module")
-    latex_module_stub.text_to_latex = lambda *args, **kwargs: True
+    latex_module_stub.text_to_png_bytes = lambda *args, **kwargs: b"png"
+
+    async def _atext_to_png_bytes_stub(*args, **kwargs):
+        return b"png"
+
+    latex_module_stub.atext_to_png_bytes = _atext_to_png_bytes_stub
+    latex_module_stub.text_to_png_pages = lambda *args, **kwargs: [b"png"]
+
+    async def _atext_to_png_pages_stub(*args, **kwargs):
+        return [b"png"]
+
+    latex_module_stub.atext_to_png_pages = _atext_to_png_pages_stub
+
+    def _prepare_render_request_stub(expr, *args, **kwargs):
+        if expr.startswith("\\invalid"):
+            return "LaTeX syntax error (line 1): stub"
+        return types.SimpleNamespace(source_expr=expr)
+
+    async def _arender_prepared_pages_stub(*args, **kwargs):
+        return [b"png"]
+
+    latex_module_stub.prepare_render_request = _prepare_render_request_stub
+    latex_module_stub.render_prepared_pages = lambda *args, **kwargs: [b"png"]
+    latex_module_stub.arender_prepared_pages = _arender_prepared_pages_stub
+
+    class _CancellationTokenStub:
+        def __init__(self):
+            self.cancelled = False
+
+        def cancel(self):
+            self.cancelled = True
+
+    latex_module_stub.CancellationToken = _CancellationTokenStub
+    latex_module_stub.set_spare_capacity_probe = lambda probe: None
+    latex_module_stub.render_prepared_many = lambda prepared, *args, **kwargs: [b"png" for _ in prepared]
+    latex_module_stub.render_request_key = lambda *args, **kwargs: None
+    latex_module_stub.render_lane = lambda *args, **kwargs: "inline"
     latex_module_stub.MAX_LATEX_INPUT_CHARS = 3000
+    latex_module_stub.warm_render_formats = lambda: True
 
     metrics_store_module = types.ModuleType("metrics_store")
     metrics_store_module.init_metrics_db = lambda *args, **kwargs: None
-    metrics_store_module.record_latex_event = lambda *args, **kwargs: None
+    metrics_store_module.run_metrics_maintenance = lambda *args, **kwargs: None
+
+    class _MetricsWriterStub:
+        def __init__(self, db_path):
+            self.db_path = db_path
+
+        @classmethod
+        def from_env(cls, db_path):
+            return cls(db_path)
+
+        def start(self):
+            return None
+
+        def close(self):
+            return None
+
+        def record_latex_event(self, *args, **kwargs):
+            return None
+
+        def record_counter_snapshot(self, *args, **kwargs):
+            return None
+
+    metrics_store_module.MetricsWriter = _MetricsWriterStub
 
     aiapi_module = types.ModuleType("AIAPI")
     aiapi_module.create_chat_session = lambda *args, **kwargs: "stub"
@@ -322,6 +385,127 @@ class BotModalFlowTestCase(unittest.TestCase):
             interaction, r"\frac{1}{2}", 300, source="modal"
         )
 
+    def test_successful_compile_uploads_png_from_memory(self):
+        interaction = SimpleNamespace(
+            response=SimpleNamespace(is_done=lambda: True),
+            followup=SimpleNamespace(send=AsyncMock()),
+            user=SimpleNamespace(id=42),
+        )
+
+        with patch.object(
+            self.bot.compile_queue, "execute", new=AsyncMock(return_value=([b"png-bytes"], 12))
+        ) as mock_execute, patch.object(self.bot.os, "remove") as mock_remove:
+            asyncio.run(self.bot.handle_latex_compilation(interaction, "x^2", 300))
+
+        self.assertIs(mock_execute.await_args.args[1], self.bot.render_prepared_pages)
+        self.assertEqual(mock_execute.await_args.args[2].source_expr, "x^2")
+        (sent_file,) = interaction.followup.send.await_args.kwargs["files"]
+        self.assertEqual(sent_file.args[0].getvalue(), b"png-bytes")
+        self.assertTrue(sent_file.kwargs["filename"].endswith(".png"))
+        mock_remove.assert_not_called()
+
+    def test_invalid_input_is_rejected_without_taking_a_queue_slot(self):
+        interaction = SimpleNamespace(
+            response=SimpleNamespace(is_done=lambda: True),
+            followup=SimpleNamespace(send=AsyncMock()),
+            user=SimpleNamespace(id=42),
+        )
+
+        with patch.object(
+            self.bot.compile_queue, "execute", new=AsyncMock()
+        ) as mock_execute, patch.object(self.bot, "_safe_record_latex_event") as mock_record:
+            asyncio.run(self.bot.handle_latex_compilation(interaction, "\\invalid{", 300))
+
+        mock_execute.assert_not_awaited()
+        self.assertEqual(mock_record.call_args.kwargs["status"], "compile_error")
+        self.assertIsNone(mock_record.call_args.kwargs["duration_ms"])
+        embed = interaction.followup.send.await_args.kwargs["embed"]
+        self.assertEqual(embed.kwargs["title"], "Compilation Error")
+        self.assertTrue(interaction.followup.send.await_args.kwargs["ephemeral"])
+
+    def test_batch_sends_rendered_items_and_lists_failures(self):
+        interaction = SimpleNamespace(
+            response=SimpleNamespace(is_done=lambda: True),
+            followup=SimpleNamespace(send=AsyncMock()),
+            user=SimpleNamespace(id=42),
+        )
+        results = [b"first", "LaTeX syntax error (line 1): Missing `}`.", b"third"]
+
+        with patch.object(
+            self.bot.compile_queue, "execute", new=AsyncMock(return_value=(results, 30))
+        ) as mock_execute, patch.object(self.bot, "_safe_record_latex_event") as mock_record:
+            asyncio.run(
+                self.bot.handle_latex_batch(interaction, "x^2\n\n\\frac{1}{2\n  y  \n", 300)
+            )
+
+        self.assertIs(mock_execute.await_args.args[1], self.bot.render_prepared_many)
+        self.assertEqual(
+            [item.source_expr for item in mock_execute.await_args.args[2]],
+            ["x^2", "\\frac{1}{2", "y"],
+        )
+        sent = interaction.followup.send.await_args.kwargs
+        self.assertEqual([f.args[0].getvalue() for f in sent["files"]], [b"first", b"third"])
+        self.assertTrue(sent["files"][1].kwargs["filename"].endswith("-3.png"))
+        self.assertEqual(
+            [call.kwargs["status"] for call in mock_record.call_args_list],
+            ["success", "compile_error", "success"],
+        )
+
+    def test_batch_takes_the_heaviest_lane_among_its_items(self):
+        interaction = SimpleNamespace(
+            response=SimpleNamespace(is_done=lambda: True),
+            followup=SimpleNamespace(send=AsyncMock()),
+            user=SimpleNamespace(id=42),
+        )
+        lanes = {"x^2": "fast", "\\begin{tikzpicture}": "structured", "\\bm{x}": "inline"}
+
+        with patch.object(
+            self.bot.compile_queue, "execute", new=AsyncMock(return_value=([b"png"] * 3, 30))
+        ) as mock_execute, patch.object(
+            self.bot, "render_lane", side_effect=lambda request: lanes[request.source_expr]
+        ):
+            asyncio.run(self.bot.handle_latex_batch(interaction, "x^2\n\\bm{x}\n\\invalid", 300))
+            asyncio.run(
+                self.bot.handle_latex_batch(interaction, "x^2\n\\begin{tikzpicture}\n\\bm{x}", 300)
+            )
+
+        self.assertEqual(
+            [call.kwargs["lane"] for call in mock_execute.await_args_list],
+            ["inline", "structured"],
+        )
+
+    def test_batch_rejects_too_many_expressions_before_queueing(self):
+        interaction = SimpleNamespace(
+            response=SimpleNamespace(is_done=lambda: True),
+            followup=SimpleNamespace(send=AsyncMock()),
+            user=SimpleNamespace(id=42),
+        )
+        batch = "\n".join(f"x_{index}" for index in range(self.bot.LATEX_BATCH_MAX_ITEMS + 1))
+
+        with patch.object(self.bot.compile_queue, "execute", new=AsyncMock()) as mock_execute:
+            asyncio.run(self.bot.handle_latex_batch(interaction, batch, 300))
+
+        mock_execute.assert_not_awaited()
+        self.assertTrue(interaction.followup.send.await_args.kwargs["ephemeral"])
+
+    def test_multi_page_output_is_sent_as_numbered_attachments(self):
+        interaction = SimpleNamespace(
+            response=SimpleNamespace(is_done=lambda: True),
+            followup=SimpleNamespace(send=AsyncMock()),
+            user=SimpleNamespace(id=42),
+        )
+
+        with patch.object(
+            self.bot.compile_queue, "execute", new=AsyncMock(return_value=([b"p1", b"p2"], 12))
+        ):
+            asyncio.run(self.bot.handle_latex_compilation(interaction, "x^2", 300))
+
+        files = interaction.followup.send.await_args.kwargs["files"]
+        names = [sent_file.kwargs["filename"] for sent_file in files]
+        self.assertEqual([sent_file.args[0].getvalue() for sent_file in files], [b"p1", b"p2"])
+        self.assertTrue(names[1].endswith("-2.png"))
+        self.assertEqual(names[1], names[0][:-len(".png")] + "-2.png")
+
     def test_latex_inline_command_routes_to_compile_handler(self):
         interaction = SimpleNamespace()
 
@@ -401,6 +585,10 @@ class BotModalFlowTestCase(unittest.TestCase):
             is_running=Mock(side_effect=[False, True]),
             start=Mock(),
         )
+        maintenance_task_mock = SimpleNamespace(
+            is_running=Mock(side_effect=[False, True]),
+            start=Mock(),
+        )
 
         with patch.object(self.bot.bot.tree, "sync", sync_mock), patch.object(
             self.bot, "update_presence", update_presence_mock
@@ -408,12 +596,36 @@ class BotModalFlowTestCase(unittest.TestCase):
             self.bot, "update_gist_stats_task", gist_task_mock
         ), patch.object(
             self.bot, "betterstack_heartbeat_task", heartbeat_task_mock
+        ), patch.object(
+            self.bot, "metrics_maintenance_task", maintenance_task_mock
         ):
             asyncio.run(self.bot.on_ready())
             asyncio.run(self.bot.on_ready())
 
         gist_task_mock.start.assert_called_once()
         heartbeat_task_mock.start.assert_called_once()
+        maintenance_task_mock.start.assert_called_once()
+
+    def test_counter_snapshot_only_writes_changed_counters(self):
+        reset_counters()
+        self.bot._last_recorded_counters.clear()
+        increment_counter("render_cache.hits", 2)
+        increment_counter("render_cache.misses")
+        record_mock = Mock()
+
+        with patch.object(self.bot.metrics_writer, "record_counter_snapshot", record_mock):
+            self.bot._safe_record_counter_snapshot()
+            self.bot._safe_record_counter_snapshot()
+            increment_counter("render_cache.hits")
+            self.bot._safe_record_counter_snapshot()
+
+        self.assertEqual(
+            [written.args[0] for written in record_mock.call_args_list],
+            [
+                {"render_cache.hits": 2, "render_cache.misses": 1},
+                {"render_cache.hits": 3},
+            ],
+        )
 
     def test_health_endpoint_returns_awake_when_discord_is_ready(self):
         self.bot.bot._ready = True
@@ -625,6 +837,403 @@ class BotModalFlowTestCase(unittest.TestCase):
         finally:
             bot_module.executor.shutdown(wait=False, cancel_futures=True)
 
+    def test_compile_queue_reports_spare_capacity_only_with_idle_slots(self):
+        async def run(max_concurrent):
+            queue = self.bot.CompileQueue(max_concurrent=max_concurrent, max_queued=2)
+
+            async def render():
+                return queue.has_spare_capacity()
+
+            idle = queue.has_spare_capacity()
+            (during, _duration_ms) = await queue.execute(asyncio.get_running_loop(), render)
+            return idle, during
+
+        self.assertEqual(asyncio.run(run(1)), (True, False))
+        self.assertEqual(asyncio.run(run(2)), (True, True))
+
+    def test_bot_splits_compile_concurrency_across_lanes(self):
+        bot_module = _import_bot_module(
+            env_overrides={
+                "LATEX_COMPILE_CONCURRENCY": "4",
+                "LATEX_LANE_STRUCTURED_CONCURRENCY": "2",
+                "LATEX_LANE_FAST_WEIGHT": "9",
+            }
+        )
+
+        try:
+            self.assertEqual(bot_module.LATEX_LANE_SLOTS, {"fast": 2, "inline": 1, "structured": 2})
+            self.assertEqual(bot_module.LATEX_LANE_WEIGHTS["fast"], 9)
+            self.assertEqual(bot_module.compile_queue._max_concurrent, 5)
+            self.assertEqual(bot_module.executor._max_workers, 5)
+        finally:
+            bot_module.executor.shutdown(wait=False, cancel_futures=True)
+
+    def test_compile_queue_slow_lane_does_not_block_fast_lane(self):
+        order = []
+
+        def job(name, delay):
+            async def render():
+                await asyncio.sleep(delay)
+                order.append(name)
+
+            return render
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            queue = self.bot.CompileQueue(
+                lane_slots={"fast": 1, "inline": 0, "structured": 1}, max_queued=5
+            )
+            tasks = [asyncio.create_task(queue.execute(loop, job("inline-1", 0.02), lane="fast"))]
+            for name, delay, lane in (
+                ("tikz-1", 0.05, "structured"),
+                ("tikz-2", 0, "structured"),
+                ("inline-2", 0, "fast"),
+            ):
+                await asyncio.sleep(0)
+                tasks.append(asyncio.create_task(queue.execute(loop, job(name, delay), lane=lane)))
+            await asyncio.gather(*tasks)
+
+        reset_counters()
+        asyncio.run(run())
+
+        # inline-2 queued after tikz-2 but gets the fast slot back first; once
+        # the fast lane is idle, tikz-2 borrows it instead of waiting for tikz-1.
+        self.assertEqual(order, ["inline-1", "inline-2", "tikz-2", "tikz-1"])
+        counters = snapshot_counters()
+        self.assertEqual(counters["compile_queue.lane.structured.borrowed"], 1)
+        self.assertEqual(counters["compile_queue.lane.structured.admitted"], 2)
+        self.assertEqual(counters["compile_queue.lane.fast.admitted"], 2)
+        self.assertGreaterEqual(counters["compile_queue.lane.structured.wait_ms"], 15)
+
+    def test_compile_queue_borrows_idle_lane_slots_by_weight(self):
+        order = []
+
+        def job(name):
+            async def render():
+                order.append(name)
+
+            return render
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            queue = self.bot.CompileQueue(
+                lane_slots={"spare": 1, "light": 0, "heavy": 0},
+                lane_weights={"light": 3, "heavy": 1},
+                max_queued=10,
+            )
+            blocker = asyncio.create_task(queue.execute(loop, job("blocker"), lane="spare"))
+            tasks = [
+                asyncio.create_task(queue.execute(loop, job(lane), lane=lane))
+                for lane in ("light", "heavy") * 4
+            ]
+            await asyncio.gather(blocker, *tasks)
+            return queue.has_spare_capacity()
+
+        reset_counters()
+        idle = asyncio.run(run())
+
+        self.assertEqual(order[0], "blocker")
+        self.assertEqual(order[1:6], ["light", "heavy", "light", "light", "light"])
+        self.assertTrue(idle)
+        self.assertEqual(snapshot_counters()["compile_queue.lane.heavy.borrowed"], 4)
+
+    def test_compile_queue_rate_limits_before_queueing(self):
+        from admission_control import AdmissionController, AdmissionLimit
+
+        async def render():
+            await asyncio.sleep(0.02)
+            return "done"
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            queue = self.bot.CompileQueue(
+                max_concurrent=1,
+                max_queued=5,
+                admission=AdmissionController(
+                    user_limit=AdmissionLimit(rate_per_minute=0, burst=1, max_in_flight=1),
+                    guild_limit=AdmissionLimit(rate_per_minute=0, burst=1, max_in_flight=0),
+                ),
+            )
+            notify = AsyncMock()
+            first = asyncio.create_task(queue.execute(loop, render, user_id=7, guild_id=1))
+            await asyncio.sleep(0)
+            refused = await queue.execute(loop, render, user_id=7, guild_id=1, notify_coro=notify)
+            other_user = await queue.execute(loop, render, user_id=8, guild_id=1)
+            await first
+            again = await queue.execute(loop, render, user_id=7, guild_id=1)
+            return refused, other_user, again, notify, queue._waiting
+
+        reset_counters()
+        with patch.object(self.bot, "_safe_record_latex_event") as mock_record:
+            refused, other_user, again, notify, waiting = asyncio.run(run())
+
+        self.assertEqual(refused, ("REJECTED", None))
+        self.assertEqual((other_user[0], again[0]), ("done", "done"))
+        self.assertEqual(waiting, 0)
+        self.assertEqual(notify.await_args.kwargs["embed"].kwargs["title"], "Slow Down")
+        statuses = [call.kwargs["status"] for call in mock_record.call_args_list]
+        self.assertEqual(statuses.count("rate_limited"), 1)
+        self.assertEqual(snapshot_counters()["compile_queue.rate_limited.user_in_flight"], 1)
+
+    def test_compile_queue_coalesces_identical_in_flight_requests(self):
+        calls = []
+
+        async def render(expr):
+            calls.append(expr)
+            await asyncio.sleep(0.05)
+            return [f"png {expr}".encode()]
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            queue = self.bot.CompileQueue(max_concurrent=1, max_queued=2)
+            leader = asyncio.create_task(queue.execute_shared("key-a", loop, render, "x^2"))
+            await asyncio.sleep(0)
+            follower = asyncio.create_task(queue.execute_shared("key-a", loop, render, "x^2"))
+            other = asyncio.create_task(queue.execute_shared("key-b", loop, render, "y"))
+            await asyncio.sleep(0)
+            waiting = queue._waiting
+            results = await asyncio.gather(leader, follower, other)
+            return results, waiting, queue._in_flight
+
+        reset_counters()
+        (leader, follower, other), waiting, in_flight = asyncio.run(run())
+
+        self.assertEqual(calls, ["x^2", "y"])
+        self.assertEqual((leader[0], leader[2]), ([b"png x^2"], False))
+        self.assertEqual((follower[0], follower[2]), ([b"png x^2"], True))
+        self.assertFalse(other[2])
+        # Only the different snippet waited for the single slot.
+        self.assertEqual(waiting, 1)
+        self.assertEqual(in_flight, {})
+        self.assertEqual(snapshot_counters()["compile_queue.coalesced"], 1)
+
+    def test_compile_queue_rate_limits_coalesced_followers(self):
+        from admission_control import AdmissionController, AdmissionLimit
+
+        async def render(expr):
+            await asyncio.sleep(0.05)
+            return [f"png {expr}".encode()]
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            queue = self.bot.CompileQueue(
+                max_concurrent=2,
+                max_queued=5,
+                admission=AdmissionController(
+                    user_limit=AdmissionLimit(rate_per_minute=1, burst=1, max_in_flight=0),
+                    guild_limit=AdmissionLimit(rate_per_minute=0, burst=1, max_in_flight=0),
+                ),
+            )
+            await queue.execute_shared("key-b", loop, render, "y", user_id=8)
+            leader = asyncio.create_task(queue.execute_shared("key-a", loop, render, "x^2", user_id=7))
+            await asyncio.sleep(0)
+            notify = AsyncMock()
+            throttled = await queue.execute_shared(
+                "key-a", loop, render, "x^2", user_id=8, notify_coro=notify
+            )
+            follower = await queue.execute_shared("key-a", loop, render, "x^2", user_id=9)
+            await leader
+            return throttled, follower, notify, queue._admission.user_limit._in_flight
+
+        reset_counters()
+        with patch.object(self.bot, "_safe_record_latex_event") as mock_record:
+            throttled, follower, notify, in_flight = asyncio.run(run())
+
+        self.assertEqual(throttled, ("REJECTED", None, False))
+        self.assertEqual((follower[0], follower[2]), ([b"png x^2"], True))
+        self.assertEqual(in_flight, {})
+        self.assertEqual(notify.await_args.kwargs["embed"].kwargs["title"], "Slow Down")
+        statuses = [call.kwargs["status"] for call in mock_record.call_args_list]
+        self.assertEqual(statuses.count("rate_limited"), 1)
+        self.assertEqual(snapshot_counters()["compile_queue.rate_limited.user_rate"], 1)
+
+    def test_compile_queue_followers_share_leader_failure(self):
+        async def render():
+            await asyncio.sleep(0.05)
+            raise RuntimeError("boom")
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            queue = self.bot.CompileQueue(max_concurrent=1, max_queued=2)
+            tasks = [
+                asyncio.create_task(queue.execute_shared("key", loop, render))
+                for _ in range(2)
+            ]
+            return await asyncio.gather(*tasks, return_exceptions=True), queue.has_spare_capacity()
+
+        results, idle = asyncio.run(run())
+
+        self.assertTrue(all(isinstance(result, RuntimeError) for result in results))
+        self.assertTrue(idle)
+
+    def test_compile_queue_follower_of_cancelled_leader_compiles_itself(self):
+        calls = []
+
+        async def render():
+            calls.append(True)
+            await asyncio.sleep(0.05)
+            return "done"
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            queue = self.bot.CompileQueue(max_concurrent=1, max_queued=2)
+            leader = asyncio.create_task(queue.execute_shared("key", loop, render))
+            await asyncio.sleep(0)
+            follower = asyncio.create_task(queue.execute_shared("key", loop, render))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            return await follower
+
+        result = asyncio.run(run())
+
+        self.assertEqual(len(calls), 2)
+        self.assertEqual((result[0], result[2]), ("done", False))
+
+    def test_successful_coalesced_compile_records_coalesced_event(self):
+        interaction = SimpleNamespace(
+            response=SimpleNamespace(is_done=lambda: True),
+            followup=SimpleNamespace(send=AsyncMock()),
+            user=SimpleNamespace(id=42),
+        )
+
+        with patch.object(
+            self.bot.compile_queue,
+            "execute_shared",
+            new=AsyncMock(return_value=([b"png-bytes"], 3, True)),
+        ), patch.object(self.bot, "_safe_record_latex_event") as mock_record:
+            asyncio.run(self.bot.handle_latex_compilation(interaction, "x^2", 300))
+
+        self.assertTrue(mock_record.call_args.kwargs["coalesced"])
+        self.assertEqual(mock_record.call_args.kwargs["status"], "success")
+
+    def test_compile_queue_awaits_coroutine_renders_without_executor(self):
+        async def render(expr):
+            return f"rendered {expr}"
+
+        async def run():
+            queue = self.bot.CompileQueue(max_concurrent=1, max_queued=2)
+            with patch.object(self.bot, "executor") as mock_executor:
+                result = await queue.execute(asyncio.get_running_loop(), render, "x^2")
+            return result, mock_executor
+
+        (output, duration_ms), mock_executor = asyncio.run(run())
+
+        self.assertEqual(output, "rendered x^2")
+        self.assertGreaterEqual(duration_ms, 0)
+        mock_executor.submit.assert_not_called()
+
+    def test_compile_queue_timeout_cancels_coroutine_render(self):
+        cancelled = []
+
+        async def render():
+            try:
+                await asyncio.sleep(10)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        async def run():
+            queue = self.bot.CompileQueue(max_concurrent=1, max_queued=2)
+            with self.assertRaises(asyncio.TimeoutError):
+                await queue.execute(asyncio.get_running_loop(), render, timeout=0.01)
+            return queue
+
+        queue = asyncio.run(run())
+
+        self.assertEqual(cancelled, [True])
+        self.assertTrue(queue.has_spare_capacity())
+
+    def test_compile_queue_expired_deadline_skips_render_and_releases_slot(self):
+        started = []
+
+        async def render():
+            started.append(True)
+            return "late"
+
+        async def run():
+            queue = self.bot.CompileQueue(max_concurrent=1, max_queued=2)
+            with self.assertRaises(asyncio.TimeoutError):
+                await queue.execute(
+                    asyncio.get_running_loop(),
+                    render,
+                    timeout=15.0,
+                    deadline=time.monotonic() - 1,
+                )
+            return queue
+
+        queue = asyncio.run(run())
+
+        self.assertEqual(started, [])
+        self.assertTrue(queue.has_spare_capacity())
+
+    def test_compile_queue_timeout_cancels_thread_render_and_holds_slot(self):
+        release_thread = threading.Event()
+        token = self.bot.CancellationToken()
+
+        def render(token_arg):
+            release_thread.wait(5)
+            return "late"
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            queue = self.bot.CompileQueue(max_concurrent=1, max_queued=2)
+            with self.assertRaises(asyncio.TimeoutError):
+                await queue.execute(loop, render, token, timeout=0.01, cancel_token=token)
+            held_after_timeout = not queue.has_spare_capacity()
+            release_thread.set()
+            for _ in range(100):
+                if queue.has_spare_capacity():
+                    break
+                await asyncio.sleep(0.01)
+            return held_after_timeout, not queue.has_spare_capacity()
+
+        reset_counters()
+        held_after_timeout, held_at_end = asyncio.run(run())
+
+        self.assertTrue(token.cancelled)
+        self.assertTrue(held_after_timeout)
+        self.assertFalse(held_at_end)
+        self.assertEqual(snapshot_counters().get("compile_queue.orphaned_work"), 1)
+
+
+    def test_orphaned_thread_render_keeps_user_in_flight_until_it_exits(self):
+        from admission_control import AdmissionController, AdmissionLimit
+
+        release_thread = threading.Event()
+
+        def render():
+            release_thread.wait(5)
+            return "late"
+
+        async def quick():
+            return "done"
+
+        async def run():
+            loop = asyncio.get_running_loop()
+            queue = self.bot.CompileQueue(
+                max_concurrent=2,
+                max_queued=5,
+                admission=AdmissionController(
+                    user_limit=AdmissionLimit(rate_per_minute=0, burst=1, max_in_flight=1),
+                    guild_limit=AdmissionLimit(rate_per_minute=0, burst=1, max_in_flight=0),
+                ),
+            )
+            with self.assertRaises(asyncio.TimeoutError):
+                await queue.execute(loop, render, timeout=0.01, user_id=7)
+            while_orphaned = await queue.execute(loop, quick, user_id=7)
+            release_thread.set()
+            for _ in range(100):
+                if not queue._admission.user_limit._in_flight:
+                    break
+                await asyncio.sleep(0.01)
+            after_exit = await queue.execute(loop, quick, user_id=7)
+            return while_orphaned, after_exit
+
+        with patch.object(self.bot, "_safe_record_latex_event"):
+            while_orphaned, after_exit = asyncio.run(run())
+
+        self.assertEqual(while_orphaned, ("REJECTED", None))
+        self.assertEqual(after_exit[0], "done")
 
 if __name__ == "__main__":
     unittest.main()
@@ -10,8 +10,10 @@ from unittest.mock import patch
 
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "monitoring" / "dashboard"))
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
 
 import app as dashboard_app
+import metrics_store
 
 
 def _iso_hours_ago(hours_ago: int) -> str:
@@ -131,6 +133,37 @@ class DashboardApiTestCase(unittest.TestCase):
                 for values in data["by_source"].values():
                     self.assertEqual(len(values), bucket_count)
 
+    def test_timeseries_places_events_in_hour_buckets(self):
+        self._insert_rows(
+            [
+                (_iso_hours_ago(0), "slash", "success", 275, "1", None, 100),
+                (_iso_hours_ago(2), "modal", "timeout", 275, "2", "timed out", 200),
+                (_iso_hours_ago(2), "modal", "queued", 275, "2", None, None),
+            ]
+        )
+
+        data = dashboard_app._query_timeseries(self.db_path, "24h")
+
+        self.assertEqual(data["totals"]["successes"][-1], 1)
+        self.assertEqual(data["errors_by_status"]["timeout"][-3], 1)
+        self.assertEqual(data["totals"]["queued"][-3], 1)
+        self.assertEqual(data["by_source"]["modal"][-3], 2)
+
+    def test_rate_limited_events_are_reported_apart_from_queue_rejections(self):
+        rows = [
+            (_iso_hours_ago(1), "slash", "rejected", 275, "1", "Queue full", None),
+            (_iso_hours_ago(1), "slash", "rate_limited", 275, "2", "user_rate", None),
+            (_iso_hours_ago(1), "slash", "rate_limited", 275, "2", "user_in_flight", None),
+        ]
+        self._insert_rows(rows)
+
+        summary = dashboard_app._query_summary(self.db_path, "24h")
+        data = dashboard_app._query_timeseries(self.db_path, "24h")
+
+        self.assertEqual(summary["errors"], 3)
+        self.assertEqual(sum(data["errors_by_status"]["rejected"]), 1)
+        self.assertEqual(sum(data["errors_by_status"]["rate_limited"]), 2)
+
     def test_timeseries_empty_db_is_zero_filled(self):
         missing_db_path = str(Path(self.temp_dir.name) / "missing.db")
         data = dashboard_app._query_timeseries(missing_db_path, "90d")
@@ -231,5 +264,70 @@ class DashboardApiTestCase(unittest.TestCase):
         self.assertEqual(telemetry["core_temp_c"], 47.2)
 
 
+class CompactSchemaDashboardApiTestCase(DashboardApiTestCase):
+    """Same queries against the partitioned, integer-timestamp schema the bot writes."""
+
+    def _create_schema(self) -> None:
+        metrics_store.init_metrics_db(self.db_path)
+
+    def _insert_rows(self, rows: list[tuple]) -> None:
+        with sqlite3.connect(self.db_path) as conn:
+            metrics_store._insert_latex_event_rows(
+                conn,
+                [
+                    (
+                        int(datetime.fromisoformat(created_at).timestamp() * 1000),
+                        source,
+                        status,
+                        dpi,
+                        int(user_id),
+                        error_message,
+                        duration_ms,
+                        0,
+                    )
+                    for created_at, source, status, dpi, user_id, error_message, duration_ms in rows
+                ],
+            )
+            conn.commit()
+
+    def test_query_summary_includes_latency_percentiles(self):
+        rows = [
+            (_iso_hours_ago(hours), "slash", status, 275, str(hours), None, hours * 100)
+            for hours, status in ((1, "success"), (2, "success"), (3, "compile_error"), (4, "success"), (5, "timeout"))
+        ]
+        self._insert_rows(rows)
+
+        latency = dashboard_app._query_summary(self.db_path, "24h")["latency_ms"]
+
+        # Rollups keep a histogram with 25% wide buckets, so percentiles are estimates.
+        self.assertEqual(latency["samples"], 5)
+        for key, exact in (("p50", 300), ("p95", 480), ("p99", 496)):
+            self.assertAlmostEqual(latency[key], exact, delta=exact * 0.25)
+
+    def test_summary_and_timeseries_read_rollups_not_raw_events(self):
+        self._insert_rows([(_iso_hours_ago(1), "slash", "success", 275, "1", None, 100)])
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("DROP VIEW latex_events;")
+            conn.execute("CREATE VIEW latex_events AS SELECT 1 AS broken WHERE 0;")
+            conn.commit()
+
+        summary = dashboard_app._query_summary(self.db_path, "90d")
+        data = dashboard_app._query_timeseries(self.db_path, "24h")
+
+        self.assertEqual(summary["successes"], 1)
+        self.assertEqual(summary["latency_ms"]["samples"], 1)
+        self.assertEqual(sum(data["totals"]["successes"]), 1)
+
+    def test_events_keep_text_columns_for_existing_readers(self):
+        created_at = _iso_hours_ago(1)
+        self._insert_rows([(created_at, "slash", "success", 275, "123456789012345678", None, 90)])
+
+        events = dashboard_app._query_events(self.db_path, 10)
+
+        self.assertEqual(events[0]["user_id"], "123456789012345678")
+        self.assertEqual(events[0]["status"], "success")
+        self.assertEqual(events[0]["created_at"], created_at)
+
+
 if __name__ == "__main__":
     unittest.main()
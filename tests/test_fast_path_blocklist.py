@@ -0,0 +1,71 @@
+import sys
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import runtime_counters
+from fast_path_blocklist import FastPathBlocklist, fast_path_key
+
+
+class FastPathBlocklistTestCase(unittest.TestCase):
+    def setUp(self):
+        runtime_counters.reset_counters()
+
+    def tearDown(self):
+        runtime_counters.reset_counters()
+
+    def test_failed_input_is_skipped_by_hash(self):
+        blocklist = FastPathBlocklist()
+        key = fast_path_key("doc")
+
+        self.assertFalse(blocklist.should_skip(key, []))
+        blocklist.record_failure(key, [])
+
+        self.assertTrue(blocklist.should_skip(key, []))
+        self.assertFalse(blocklist.should_skip(fast_path_key("other"), []))
+        self.assertEqual(runtime_counters.snapshot_counters()["fast_path.skipped_input"], 1)
+
+    def test_negative_entries_are_bounded(self):
+        blocklist = FastPathBlocklist(max_entries=2)
+        for name in ("a", "b", "c"):
+            blocklist.record_failure(fast_path_key(name), [])
+
+        self.assertFalse(blocklist.should_skip(fast_path_key("a"), []))
+        self.assertTrue(blocklist.should_skip(fast_path_key("c"), []))
+
+    def test_token_is_learned_once_enough_inputs_blame_it(self):
+        blocklist = FastPathBlocklist(token_threshold=2)
+
+        blocklist.record_failure(fast_path_key("a"), [r"\foo"])
+        blocklist.record_failure(fast_path_key("a"), [r"\foo"])
+        self.assertFalse(blocklist.should_skip(fast_path_key("new"), [r"\foo"]))
+
+        blocklist.record_failure(fast_path_key("b"), [r"\foo"])
+
+        self.assertEqual(blocklist.learned_tokens, [r"\foo"])
+        self.assertTrue(blocklist.should_skip(fast_path_key("new"), [r"\frac", r"\foo"]))
+        counters = runtime_counters.snapshot_counters()
+        self.assertEqual(counters["fast_path.learned_tokens"], 1)
+        self.assertEqual(counters["fast_path.skipped_token"], 1)
+
+    def test_success_clears_pending_blame(self):
+        blocklist = FastPathBlocklist(token_threshold=2)
+
+        blocklist.record_failure(fast_path_key("a"), [r"\frac"])
+        blocklist.record_success([r"\frac"])
+        blocklist.record_failure(fast_path_key("b"), [r"\frac"])
+
+        self.assertEqual(blocklist.learned_tokens, [])
+
+    def test_learned_tokens_are_bounded(self):
+        blocklist = FastPathBlocklist(max_tokens=1, token_threshold=1)
+
+        blocklist.record_failure(fast_path_key("a"), [r"\foo"])
+        blocklist.record_failure(fast_path_key("b"), [r"\bar"])
+
+        self.assertEqual(blocklist.learned_tokens, [r"\bar"])
+
+
+if __name__ == "__main__":
+    unittest.main()
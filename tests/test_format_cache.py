@@ -0,0 +1,123 @@
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from modified_packages.format_cache import (
+    FormatCache,
+    is_format_load_error,
+    pad_body_lines,
+    split_preamble,
+)
+
+
+class FormatCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        self.cache_dir = Path(self.temp_dir.name)
+        self.build_calls = []
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+
+    def _build(self, engine: str, preamble: str, output_dir: Path) -> Path:
+        self.build_calls.append((engine, preamble))
+        format_path = output_dir / f"{FormatCache.format_name(engine, preamble)}.fmt"
+        format_path.write_bytes(b"FMT")
+        return format_path
+
+    def _failing_build(self, engine: str, preamble: str, output_dir: Path) -> Path:
+        self.build_calls.append((engine, preamble))
+        raise RuntimeError("dump failed")
+
+    def test_split_preamble_keeps_line_numbers_alignable(self):
+        latex_code = "\\documentclass{standalone}\n\\usepackage{amsmath}\n\\begin{document}\nx\n\\end{document}"
+
+        preamble, body = split_preamble(latex_code)
+        padded = pad_body_lines(preamble, body)
+
+        self.assertEqual(preamble, "\\documentclass{standalone}\n\\usepackage{amsmath}\n")
+        self.assertTrue(body.startswith("\\begin{document}"))
+        self.assertEqual(padded.splitlines()[2], "\\begin{document}")
+        self.assertEqual(len(padded.splitlines()), len(latex_code.splitlines()))
+
+    def test_split_preamble_ignores_commented_begin_document(self):
+        latex_code = "\\documentclass{article}\n% \\begin{document} later\n\\begin{document}x\\end{document}"
+
+        preamble, body = split_preamble(latex_code)
+
+        self.assertIn("% \\begin{document} later", preamble)
+        self.assertEqual(body, "\\begin{document}x\\end{document}")
+
+    def test_split_preamble_requires_documentclass(self):
+        self.assertIsNone(split_preamble("\\begin{document}x\\end{document}"))
+        self.assertIsNone(split_preamble("x^2"))
+
+    def test_get_or_build_dumps_each_preamble_once(self):
+        cache = FormatCache(self.cache_dir)
+
+        first = cache.get_or_build("latex", "preamble", self._build)
+        second = cache.get_or_build("latex", "preamble", self._build)
+
+        self.assertEqual(first, second)
+        self.assertEqual(self.build_calls, [("latex", "preamble")])
+        self.assertEqual(cache.lookup("latex", "preamble"), first)
+        self.assertIsNone(cache.lookup("pdflatex", "preamble"))
+
+    def test_preamble_is_dumped_only_after_min_uses(self):
+        cache = FormatCache(self.cache_dir, min_uses=3)
+
+        self.assertIsNone(cache.get_or_build("pdflatex", "tikz", self._build))
+        self.assertIsNone(cache.get_or_build("pdflatex", "tikz", self._build))
+        self.assertIsNotNone(cache.get_or_build("pdflatex", "tikz", self._build))
+        self.assertEqual(len(self.build_calls), 1)
+
+    def test_force_builds_before_min_uses(self):
+        cache = FormatCache(self.cache_dir, min_uses=5)
+
+        self.assertIsNotNone(cache.get_or_build("latex", "inline", self._build, force=True))
+
+    def test_first_build_removes_formats_left_by_previous_process(self):
+        stale_path = self.cache_dir / "latex-stale.fmt"
+        stale_path.write_bytes(b"OLD")
+        cache = FormatCache(self.cache_dir)
+
+        cache.get_or_build("latex", "preamble", self._build)
+
+        self.assertFalse(stale_path.exists())
+
+    def test_failed_dump_is_not_retried(self):
+        cache = FormatCache(self.cache_dir)
+
+        self.assertIsNone(cache.get_or_build("latex", "preamble", self._failing_build))
+        self.assertIsNone(cache.get_or_build("latex", "preamble", self._build))
+        self.assertEqual(len(self.build_calls), 1)
+
+    def test_lru_eviction_removes_format_file(self):
+        cache = FormatCache(self.cache_dir, max_formats=1)
+
+        first = cache.get_or_build("latex", "one", self._build)
+        cache.get_or_build("latex", "two", self._build)
+
+        self.assertFalse(first.exists())
+        self.assertIsNone(cache.lookup("latex", "one"))
+
+    def test_invalidate_deletes_format_and_disables_preamble(self):
+        cache = FormatCache(self.cache_dir)
+        format_path = cache.get_or_build("latex", "preamble", self._build)
+
+        cache.invalidate("latex", "preamble")
+
+        self.assertFalse(format_path.exists())
+        self.assertIsNone(cache.get_or_build("latex", "preamble", self._build))
+
+    def test_format_load_errors_are_recognized(self):
+        self.assertTrue(is_format_load_error("---! x.fmt was written by pdftex"))
+        self.assertTrue(is_format_load_error("Fatal format file error; I'm stymied"))
+        self.assertFalse(is_format_load_error("main.tex:9: Undefined control sequence."))
+
+
+if __name__ == "__main__":
+    unittest.main()
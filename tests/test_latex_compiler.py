@@ -1,19 +1,29 @@
+import asyncio
 import base64
 import os
 import signal
 import subprocess
 import sys
 import tempfile
+import threading
+import time
 import unittest
 from pathlib import Path
 from unittest.mock import patch
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
 
-from modified_packages.exceptions import CompilationError
-from modified_packages.dvipng_renderer import InlineDviPngRenderer
-from modified_packages.latex_compiler import LatexCompiler
-from modified_packages.tex2img import Latex2PNG
+from modified_packages.cancellation import CancellationToken
+from modified_packages.exceptions import CompilationCancelledError, CompilationError
+from modified_packages.format_cache import FormatCache
+from modified_packages.dvipng_renderer import (
+    AsyncInlineDviPngRenderer,
+    InlineDviPngRenderer,
+    _dvipng_command,
+)
+from modified_packages.latex_compiler import AsyncLatexCompiler, LatexCompiler
+from modified_packages.tex2img import AsyncLatex2PNG, Latex2PNG
+from modified_packages.warm_pool import WarmWorkerPool
 
 PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
 
@@ -124,11 +134,6 @@ class TimeoutProcess:
         self.returncode = -9
 
 
-class FakeImage:
-    def save(self, buffer, _format):
-        buffer.write(b"png-bytes")
-
-
 class SuccessfulDviPngProcess:
     instances = []
     timeouts = []
@@ -151,6 +156,66 @@ class SuccessfulDviPngProcess:
         if executable == "dvipng":
             (self.cwd / "output1.png").write_bytes(PNG_SIGNATURE + b"dvipng-fast-path")
             return ("dvipng ok", "")
+        if executable == "pdflatex":
+            (self.cwd / "main.pdf").write_bytes(b"%PDF-1.7\nunit-test\n")
+            (self.cwd / "main.log").write_text("pdflatex ok", encoding="utf-8")
+            return ("pdflatex ok", "")
+        if executable in ("pdftoppm", "pdftocairo"):
+            assert (self.cwd / self.command[3]).exists()
+            if "-singlefile" in self.command:
+                (self.cwd / f"{self.command[-1]}.png").write_bytes(PNG_SIGNATURE + b"page-1")
+                return ("", "")
+            for page in (1, 2):
+                (self.cwd / f"{self.command[-1]}-{page}.png").write_bytes(
+                    PNG_SIGNATURE + f"page-{page}".encode()
+                )
+            return ("", "")
+        raise AssertionError(f"Unexpected command: {self.command}")
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+    def kill(self):
+        self.returncode = -9
+
+    def send_signal(self, _signal):
+        self.returncode = -9
+
+
+class FormatAwareProcess:
+    instances = []
+    fail_format_load = False
+
+    def __init__(self, command, cwd=None, **kwargs):
+        self.command = command
+        self.cwd = Path(cwd)
+        self.kwargs = kwargs
+        self.pid = 56789
+        self.returncode = 0
+        type(self).instances.append(self)
+
+    def communicate(self, timeout=None):
+        executable = Path(self.command[0]).name.lower()
+        if "-ini" in self.command:
+            jobname = next(arg for arg in self.command if arg.startswith("-jobname="))
+            (self.cwd / f"{jobname.split('=', 1)[1]}.fmt").write_bytes(b"FMT")
+            return ("dumped", "")
+        if executable == "latex":
+            if type(self).fail_format_load and any(arg.startswith("-fmt=") for arg in self.command):
+                self.returncode = 1
+                return ("", "---! inline.fmt was written by pdftex-old")
+            self.returncode = 0
+            (self.cwd / "main.dvi").write_bytes(b"DVI")
+            return ("latex ok", "")
+        if executable == "pdflatex":
+            (self.cwd / "main.pdf").write_bytes(b"%PDF-format-path")
+            return ("pdflatex ok", "")
+        if executable == "dvipng":
+            (self.cwd / "output1.png").write_bytes(PNG_SIGNATURE + b"format-path")
+            return ("dvipng ok", "")
         raise AssertionError(f"Unexpected command: {self.command}")
 
     def poll(self):
@@ -166,6 +231,131 @@ class SuccessfulDviPngProcess:
         self.returncode = -9
 
 
+class WarmWorkerProcess:
+    instances = []
+    fail_job = False
+
+    def __init__(self, command, cwd=None, **kwargs):
+        self.command = command
+        self.cwd = Path(cwd)
+        self.kwargs = kwargs
+        self.pid = 67890
+        self.returncode = None
+        self.stdin = self.stdout = self.stderr = None
+        self.job_input = None
+        type(self).instances.append(self)
+
+    def communicate(self, input=None, timeout=None):
+        executable = Path(self.command[0]).name.lower()
+        if executable == "dvipng":
+            self.returncode = 0
+            (self.cwd / "output1.png").write_bytes(PNG_SIGNATURE + b"warm-path")
+            return ("dvipng ok", "")
+
+        self.job_input = input
+        if input is None:
+            self.returncode = 0
+        else:
+            job_path = Path(input.strip())
+            self.returncode = 1 if type(self).fail_job else 0
+            if not job_path.exists():
+                raise AssertionError(f"Warm worker got a missing job path: {job_path}")
+        if self.returncode == 0:
+            (self.cwd / "main.dvi").write_bytes(b"DVI")
+        (self.cwd / "main.log").write_text(
+            f"{input.strip() if input else 'main.tex'}:2: Undefined control sequence."
+            if self.returncode else "Transcript written",
+            encoding="utf-8",
+        )
+        return ("latex ok", "")
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        if self.returncode is None:
+            self.returncode = -9
+        return self.returncode
+
+    def kill(self):
+        self.returncode = -9
+
+    def send_signal(self, _signal):
+        self.returncode = -9
+
+
+class FakeAsyncProcess:
+    instances = []
+    hang = False
+    fail = False
+
+    def __init__(self, command, cwd=None, **kwargs):
+        self.command = command
+        self.cwd = Path(cwd)
+        self.kwargs = kwargs
+        self.pid = 78901
+        self.returncode = None
+        self._exited = asyncio.Event()
+        type(self).instances.append(self)
+
+    async def communicate(self):
+        if type(self).hang:
+            await self._exited.wait()
+            return (b"", b"")
+        executable = Path(self.command[0]).name.lower()
+        if executable == "dvipng":
+            (self.cwd / "output1.png").write_bytes(PNG_SIGNATURE + b"async-path")
+        elif executable in ("pdftoppm", "pdftocairo"):
+            (self.cwd / f"{self.command[-1]}-1.png").write_bytes(PNG_SIGNATURE + b"async-raster")
+        elif type(self).fail:
+            (self.cwd / "main.log").write_text("main.tex:3: Undefined control sequence.", encoding="utf-8")
+            self.returncode = 1
+            return (b"", b"")
+        else:
+            (self.cwd / "main.dvi").write_bytes(b"DVI")
+            (self.cwd / "main.pdf").write_bytes(b"%PDF-async")
+        self.returncode = 0
+        return (b"ok", b"")
+
+    async def wait(self):
+        await self._exited.wait()
+        return self.returncode
+
+    def kill(self):
+        self.returncode = -9
+        self._exited.set()
+
+    @classmethod
+    async def create(cls, *command, cwd=None, **kwargs):
+        return cls(list(command), cwd=cwd, **kwargs)
+
+
+class BlockingProcess:
+    instances = []
+
+    def __init__(self, command, cwd=None, **kwargs):
+        self.command = command
+        self.pid = 89012
+        self.returncode = None
+        self.killed = threading.Event()
+        type(self).instances.append(self)
+
+    def communicate(self, timeout=None):
+        if not self.killed.wait(timeout):
+            raise subprocess.TimeoutExpired(self.command, timeout)
+        return ("", "")
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+    def kill(self):
+        self.returncode = -9
+        self.killed.set()
+
+
 class LatexCompilerTestCase(unittest.TestCase):
     def setUp(self):
         SuccessfulProcess.instances = []
@@ -178,6 +368,14 @@ class LatexCompilerTestCase(unittest.TestCase):
         TimeoutProcess.wait_timeouts = []
         TimeoutProcess.kill_calls = 0
         TimeoutProcess.signal_calls = []
+        FormatAwareProcess.instances = []
+        WarmWorkerProcess.instances = []
+        FakeAsyncProcess.instances = []
+        BlockingProcess.instances = []
+        FakeAsyncProcess.hang = False
+        FakeAsyncProcess.fail = False
+        WarmWorkerProcess.fail_job = False
+        FormatAwareProcess.fail_format_load = False
 
     def test_compile_returns_pdf_bytes_and_cleans_up_workspace(self):
         latex_code = r"\documentclass{article}\begin{document}ok\end{document}"
@@ -253,26 +451,130 @@ class LatexCompilerTestCase(unittest.TestCase):
         self.assertIn("partial stdout", error_text)
         self.assertIn("partial stderr", error_text)
 
-    def test_latex2png_defaults_to_pdflatex(self):
-        renderer = Latex2PNG()
-
-        with patch(
-            "modified_packages.tex2img.LatexCompiler.compile",
-            return_value=b"%PDF-1.7\nunit-test\n",
-        ) as mock_compile, patch(
-            "modified_packages.tex2img.pdf2image.convert_from_bytes",
-            return_value=[FakeImage()],
-        ):
-            png_data = renderer.compile(
-                r"\documentclass{article}\begin{document}ok\end{document}"
+    def test_deadline_caps_stage_timeout_and_blocks_late_stages(self):
+        latex_code = r"\documentclass{article}\begin{document}ok\end{document}"
+        images = [("assets/resource.bin", base64.b64encode(b"resource").decode("ascii"))]
+
+        with tempfile.TemporaryDirectory() as compile_root:
+            compiler = LatexCompiler(
+                compile_dir=compile_root,
+                timeout=12,
+                deadline=time.monotonic() + 3,
+            )
+            with patch("modified_packages.latex_compiler.subprocess.Popen", SuccessfulProcess):
+                compiler.compile(latex_code, images=images)
+
+            expired = LatexCompiler(
+                compile_dir=compile_root,
+                timeout=12,
+                deadline=time.monotonic() - 1,
             )
+            with patch("modified_packages.latex_compiler.subprocess.Popen", SuccessfulProcess):
+                with self.assertRaises(CompilationError) as ctx:
+                    expired.compile(latex_code, images=images)
+
+        self.assertLessEqual(SuccessfulProcess.last_timeout, 3)
+        self.assertGreater(SuccessfulProcess.last_timeout, 2)
+        self.assertEqual(len(SuccessfulProcess.instances), 1)
+        self.assertIn("deadline has passed", str(ctx.exception))
+
+    def test_latex2png_defaults_to_pdflatex(self):
+        with tempfile.TemporaryDirectory() as compile_root:
+            renderer = Latex2PNG(compile_dir=compile_root)
+            with patch("modified_packages.latex_compiler.subprocess.Popen", SuccessfulDviPngProcess):
+                png_data = renderer.compile(
+                    r"\documentclass{article}\begin{document}ok\end{document}"
+                )
+            leftovers = list(Path(compile_root).iterdir())
+
+        self.assertEqual(png_data, [PNG_SIGNATURE + b"page-1", PNG_SIGNATURE + b"page-2"])
+        self.assertEqual(leftovers, [])
+        compile_command, raster_command = (process.command for process in SuccessfulDviPngProcess.instances)
+        self.assertEqual(compile_command[0], "pdflatex")
+        self.assertEqual(raster_command[0], "pdftoppm")
+        self.assertIn("-png", raster_command)
+        self.assertEqual(raster_command[raster_command.index("-r") + 1], "300")
+        # main.pdf is rasterized where the compiler left it, never read into Python.
+        self.assertEqual(raster_command[3], "main.pdf")
+
+    def test_transparent_latex2png_rasterizes_with_pdftocairo(self):
+        with tempfile.TemporaryDirectory() as compile_root:
+            renderer = Latex2PNG(compile_dir=compile_root)
+            with patch("modified_packages.latex_compiler.subprocess.Popen", SuccessfulDviPngProcess):
+                renderer.compile(
+                    r"\documentclass{article}\begin{document}ok\end{document}",
+                    transparent=True,
+                )
+
+        raster_command = SuccessfulDviPngProcess.instances[-1].command
+        self.assertEqual(raster_command[0], "pdftocairo")
+        self.assertIn("-transp", raster_command)
 
-        self.assertEqual(png_data, [b"png-bytes"])
-        mock_compile.assert_called_once_with(
-            r"\documentclass{article}\begin{document}ok\end{document}",
-            None,
-            "pdflatex",
+    def test_latex2png_single_page_range_uses_singlefile(self):
+        with tempfile.TemporaryDirectory() as compile_root:
+            renderer = Latex2PNG(compile_dir=compile_root)
+            with patch("modified_packages.latex_compiler.subprocess.Popen", SuccessfulDviPngProcess):
+                pages = renderer.compile(
+                    r"\documentclass{article}\begin{document}ok\end{document}",
+                    first_page=1,
+                    last_page=1,
+                )
+
+        raster_command = SuccessfulDviPngProcess.instances[-1].command
+        self.assertEqual(pages, [PNG_SIGNATURE + b"page-1"])
+        self.assertIn("-singlefile", raster_command)
+        self.assertEqual(raster_command[raster_command.index("-l") + 1], "1")
+
+    def test_latex2png_page_range_bounds_rasterizer(self):
+        with tempfile.TemporaryDirectory() as compile_root:
+            renderer = Latex2PNG(compile_dir=compile_root)
+            with patch("modified_packages.latex_compiler.subprocess.Popen", SuccessfulDviPngProcess):
+                renderer.compile(
+                    r"\documentclass{article}\begin{document}ok\end{document}",
+                    first_page=1,
+                    last_page=3,
+                )
+
+        raster_command = SuccessfulDviPngProcess.instances[-1].command
+        self.assertNotIn("-singlefile", raster_command)
+        self.assertEqual(raster_command[raster_command.index("-f") + 1], "1")
+        self.assertEqual(raster_command[raster_command.index("-l") + 1], "3")
+
+    def test_dvipng_compile_pages_limits_range_and_orders_pages_numerically(self):
+        class MultiPageDviPngProcess(SuccessfulDviPngProcess):
+            def communicate(self, timeout=None):
+                if Path(self.command[0]).name.lower() == "dvipng":
+                    for page in (1, 2, 10):
+                        (self.cwd / f"output{page}.png").write_bytes(PNG_SIGNATURE + str(page).encode())
+                    return ("dvipng ok", "")
+                return super().communicate(timeout)
+
+        with tempfile.TemporaryDirectory() as compile_root:
+            renderer = InlineDviPngRenderer(compile_dir=compile_root, timeout=5)
+            with patch("modified_packages.latex_compiler.subprocess.Popen", MultiPageDviPngProcess):
+                pages = renderer.compile_pages(
+                    r"\documentclass{standalone}\begin{document}x\end{document}",
+                    first_page=1,
+                    last_page=3,
+                )
+
+        dvipng_command = MultiPageDviPngProcess.instances[-1].command
+        self.assertEqual(pages, [PNG_SIGNATURE + b"1", PNG_SIGNATURE + b"2", PNG_SIGNATURE + b"10"])
+        self.assertEqual(dvipng_command[dvipng_command.index("-p") + 1], "=1")
+        self.assertEqual(dvipng_command[dvipng_command.index("-l") + 1], "=3")
+        self.assertIn("White", dvipng_command)
+
+    def test_dvipng_command_selects_physical_pages(self):
+        command = _dvipng_command(False, 300, first_page=2, last_page=4)
+
+        self.assertEqual(
+            command,
+            [
+                "dvipng", "-T", "tight", "-bg", "White", "-D", "300",
+                "-p", "=2", "-l", "=4", "-o", "output%d.png", "main.dvi",
+            ],
         )
+        self.assertNotIn("-p", _dvipng_command(True, 300))
 
     def test_inline_dvipng_renderer_runs_latex_then_dvipng(self):
         latex_code = r"\documentclass{standalone}\begin{document}$x^2$\end{document}"
@@ -280,7 +582,7 @@ class LatexCompilerTestCase(unittest.TestCase):
         with tempfile.TemporaryDirectory() as compile_root:
             renderer = InlineDviPngRenderer(compile_dir=compile_root, timeout=5)
 
-            with patch("modified_packages.dvipng_renderer.subprocess.Popen", SuccessfulDviPngProcess):
+            with patch("modified_packages.latex_compiler.subprocess.Popen", SuccessfulDviPngProcess):
                 png_data = renderer.compile(latex_code, transparent=True, dpi=275)
 
             self.assertEqual(list(Path(compile_root).iterdir()), [])
@@ -305,6 +607,243 @@ class LatexCompilerTestCase(unittest.TestCase):
         self.assertIn("main.dvi", dvipng_command)
         self.assertEqual(SuccessfulDviPngProcess.timeouts, [5, 5])
 
+    def test_inline_dvipng_renderer_dumps_preamble_format_once(self):
+        latex_code = (
+            "\\documentclass{standalone}\n"
+            "\\usepackage{amsmath}\n"
+            "\\begin{document}\n$x^2$\n\\end{document}"
+        )
+
+        with tempfile.TemporaryDirectory() as compile_root:
+            format_cache = FormatCache(Path(compile_root) / "formats")
+            renderer = InlineDviPngRenderer(
+                compile_dir=compile_root,
+                timeout=5,
+                format_cache=format_cache,
+            )
+
+            with patch("modified_packages.latex_compiler.subprocess.Popen", FormatAwareProcess):
+                first = renderer.compile(latex_code, transparent=True, dpi=275)
+                second = renderer.compile(latex_code, transparent=True, dpi=275)
+
+            format_files = list((Path(compile_root) / "formats").glob("*.fmt"))
+
+        self.assertEqual(first, PNG_SIGNATURE + b"format-path")
+        self.assertEqual(second, first)
+        self.assertEqual(len(format_files), 1)
+        commands = [process.command for process in FormatAwareProcess.instances]
+        self.assertEqual(sum("-ini" in command for command in commands), 1)
+        self.assertIn("&latex", commands[0])
+        latex_commands = [command for command in commands if command[0] == "latex" and "-ini" not in command]
+        self.assertEqual(len(latex_commands), 2)
+        for command in latex_commands:
+            self.assertIn(f"-fmt={format_files[0].stem}", command)
+        compile_env = FormatAwareProcess.instances[1].kwargs["env"]
+        self.assertTrue(compile_env["TEXFORMATS"].startswith(str(format_files[0].parent)))
+
+    def test_compile_uses_cached_format_once_preamble_repeats(self):
+        latex_code = (
+            "\\documentclass[tikz]{standalone}\n"
+            "\\usetikzlibrary{arrows.meta}\n"
+            "\\begin{document}\n\\tikz\\draw (0,0)--(1,1);\n\\end{document}"
+        )
+
+        with tempfile.TemporaryDirectory() as compile_root:
+            compiler = LatexCompiler(
+                compile_dir=compile_root,
+                timeout=5,
+                format_cache=FormatCache(Path(compile_root) / "formats", min_uses=2),
+            )
+
+            with patch("modified_packages.latex_compiler.subprocess.Popen", FormatAwareProcess):
+                pdf_bytes = [compiler.compile(latex_code) for _ in range(3)]
+
+        self.assertEqual(pdf_bytes, [b"%PDF-format-path"] * 3)
+        commands = [process.command for process in FormatAwareProcess.instances]
+        self.assertEqual([command[0] for command in commands], ["pdflatex"] * 4)
+        self.assertFalse(any(arg.startswith("-fmt=") for arg in commands[0]))
+        self.assertIn("-ini", commands[1])
+        self.assertIn("&pdflatex", commands[1])
+        self.assertTrue(any(arg.startswith("-fmt=pdflatex-") for arg in commands[2]))
+        self.assertTrue(any(arg.startswith("-fmt=pdflatex-") for arg in commands[3]))
+
+    def test_inline_dvipng_renderer_falls_back_when_format_fails_to_load(self):
+        latex_code = "\\documentclass{standalone}\n\\begin{document}\n$x$\n\\end{document}"
+        FormatAwareProcess.fail_format_load = True
+
+        with tempfile.TemporaryDirectory() as compile_root:
+            format_cache = FormatCache(Path(compile_root) / "formats")
+            renderer = InlineDviPngRenderer(
+                compile_dir=compile_root,
+                timeout=5,
+                format_cache=format_cache,
+            )
+
+            with patch("modified_packages.latex_compiler.subprocess.Popen", FormatAwareProcess):
+                png_data = renderer.compile(latex_code, transparent=True, dpi=275)
+
+            self.assertIsNone(format_cache.lookup("latex", "\\documentclass{standalone}\n"))
+
+        self.assertEqual(png_data, PNG_SIGNATURE + b"format-path")
+        latex_commands = [
+            process.command
+            for process in FormatAwareProcess.instances
+            if process.command[0] == "latex" and "-ini" not in process.command
+        ]
+        self.assertTrue(any(arg.startswith("-fmt=") for arg in latex_commands[0]))
+        self.assertFalse(any(arg.startswith("-fmt=") for arg in latex_commands[1]))
+
+    def _compile_with_warm_pool(self, compile_root: str, runs: int) -> list[bytes]:
+        pool = WarmWorkerPool(size=1)
+        self.addCleanup(pool.close)
+        renderer = InlineDviPngRenderer(compile_dir=compile_root, timeout=5, worker_pool=pool)
+        with patch("modified_packages.latex_compiler.subprocess.Popen", WarmWorkerProcess), patch(
+            "modified_packages.warm_pool.os.killpg",
+            lambda pid, _signal: None,
+        ):
+            results = [renderer.compile("$x$", transparent=True, dpi=275) for _ in range(runs)]
+            pool.close()
+        return results
+
+    def test_inline_renderer_runs_second_job_on_prespawned_worker(self):
+        with tempfile.TemporaryDirectory() as compile_root:
+            results = self._compile_with_warm_pool(compile_root, runs=2)
+            leftover_dirs = list(Path(compile_root).glob("latex-warm-*"))
+
+        self.assertEqual(results, [PNG_SIGNATURE + b"warm-path"] * 2)
+        self.assertEqual(leftover_dirs, [])
+        workers = [
+            process for process in WarmWorkerProcess.instances
+            if process.command[-1] == "\\scrollmode\\read16 to\\mainfile\\nonstopmode\\input\\mainfile"
+        ]
+        self.assertEqual(len(workers), 2)
+        self.assertIn("-jobname=main", workers[0].command)
+        self.assertIsNotNone(workers[0].kwargs.get("stdin"))
+        self.assertTrue(workers[0].job_input.strip().endswith("main.tex"))
+        self.assertIsNone(workers[1].job_input)
+
+    def test_warm_worker_failure_keeps_compilation_error_and_log(self):
+        WarmWorkerProcess.fail_job = True
+
+        with tempfile.TemporaryDirectory() as compile_root:
+            with self.assertRaises(CompilationError) as exc_info:
+                self._compile_with_warm_pool(compile_root, runs=2)
+
+        self.assertIn("exited with return code 1", str(exc_info.exception))
+        self.assertIn("main.tex:2: Undefined control sequence.", str(exc_info.exception))
+
+    def test_async_inline_renderer_runs_stages_as_asyncio_subprocesses(self):
+        with tempfile.TemporaryDirectory() as compile_root:
+            renderer = AsyncInlineDviPngRenderer(compile_dir=compile_root, timeout=5)
+            with patch(
+                "modified_packages.latex_compiler.asyncio.create_subprocess_exec",
+                FakeAsyncProcess.create,
+            ):
+                png_data = asyncio.run(renderer.acompile("$x$", transparent=True, dpi=275))
+
+        self.assertEqual(png_data, PNG_SIGNATURE + b"async-path")
+        self.assertEqual(
+            [process.command[0] for process in FakeAsyncProcess.instances],
+            ["latex", "dvipng"],
+        )
+        self.assertTrue(FakeAsyncProcess.instances[0].kwargs.get("start_new_session", os.name == "nt"))
+        with self.assertRaises(NotImplementedError):
+            renderer.compile("$x$")
+
+    def test_async_latex2png_rasterizes_pdf_in_working_dir(self):
+        with tempfile.TemporaryDirectory() as compile_root:
+            renderer = AsyncLatex2PNG(compile_dir=compile_root, timeout=5)
+            with patch(
+                "modified_packages.latex_compiler.asyncio.create_subprocess_exec",
+                FakeAsyncProcess.create,
+            ):
+                png_data = asyncio.run(renderer.acompile("\\documentclass{article}", dpi=400))
+            leftovers = list(Path(compile_root).iterdir())
+
+        self.assertEqual(png_data, [PNG_SIGNATURE + b"async-raster"])
+        self.assertEqual(leftovers, [])
+        raster = FakeAsyncProcess.instances[-1]
+        self.assertEqual(raster.command[0], "pdftoppm")
+        self.assertEqual(raster.command[3], "main.pdf")
+        self.assertEqual(raster.cwd, FakeAsyncProcess.instances[0].cwd)
+
+    def test_async_compiler_raises_compilation_error_with_log(self):
+        FakeAsyncProcess.fail = True
+
+        with tempfile.TemporaryDirectory() as compile_root:
+            compiler = AsyncLatexCompiler(compile_dir=compile_root, timeout=5)
+            with patch(
+                "modified_packages.latex_compiler.asyncio.create_subprocess_exec",
+                FakeAsyncProcess.create,
+            ):
+                with self.assertRaises(CompilationError) as exc_info:
+                    asyncio.run(compiler.acompile("\\documentclass{article}"))
+
+        self.assertIn("Compiler 'pdflatex' exited with return code 1.", str(exc_info.exception))
+        self.assertIn("main.tex:3: Undefined control sequence.", str(exc_info.exception))
+
+    def test_cancelling_async_compile_kills_process_group(self):
+        FakeAsyncProcess.hang = True
+        killed = []
+
+        def fake_killpg(pid, sig):
+            killed.append((pid, sig))
+            for process in FakeAsyncProcess.instances:
+                process.kill()
+
+        with tempfile.TemporaryDirectory() as compile_root:
+            compiler = AsyncLatexCompiler(compile_dir=compile_root, timeout=5)
+            with patch(
+                "modified_packages.latex_compiler.asyncio.create_subprocess_exec",
+                FakeAsyncProcess.create,
+            ), patch("modified_packages.latex_compiler.os.killpg", fake_killpg):
+                with self.assertRaises(asyncio.TimeoutError):
+                    asyncio.run(asyncio.wait_for(compiler.acompile("x"), timeout=0.05))
+            leftovers = list(Path(compile_root).glob("latex-*"))
+
+        self.assertEqual(killed, [(78901, signal.SIGKILL)])
+        self.assertEqual(leftovers, [])
+
+    def test_cancel_token_kills_running_compile(self):
+        token = CancellationToken()
+
+        def fake_killpg(pid, _signal):
+            for process in BlockingProcess.instances:
+                if process.pid == pid:
+                    process.kill()
+
+        with tempfile.TemporaryDirectory() as compile_root:
+            compiler = LatexCompiler(compile_dir=compile_root, timeout=5, cancel_token=token)
+            with patch("modified_packages.latex_compiler.subprocess.Popen", BlockingProcess), patch(
+                "modified_packages.latex_compiler.os.killpg",
+                fake_killpg,
+            ):
+                timer = threading.Timer(0.05, token.cancel)
+                timer.start()
+                started = time.monotonic()
+                with self.assertRaises(CompilationCancelledError):
+                    compiler.compile("\\documentclass{article}")
+                elapsed = time.monotonic() - started
+                timer.join()
+
+                with self.assertRaises(CompilationCancelledError):
+                    compiler.compile("\\documentclass{article}")
+
+        self.assertLess(elapsed, 2)
+        self.assertEqual(len(BlockingProcess.instances), 1)
+
+    def test_child_tokens_follow_parent_but_cancel_alone(self):
+        parent = CancellationToken()
+        first, second = parent.child(), parent.child()
+
+        first.cancel()
+        self.assertFalse(parent.cancelled)
+        self.assertFalse(second.cancelled)
+
+        parent.cancel()
+        self.assertTrue(second.cancelled)
+        self.assertTrue(parent.child().cancelled)
+
 
 if __name__ == "__main__":
     unittest.main()
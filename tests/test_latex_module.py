@@ -1,19 +1,53 @@
+import asyncio
+import io
+import os
 import sys
 import tempfile
+import threading
+import time
 import unittest
 from pathlib import Path
-from unittest.mock import patch
+from unittest.mock import ANY, AsyncMock, patch
+
+from PIL import Image
 
 sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
 
 import latex_module
+import runtime_counters
 
 
 PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
 FULL_DOCUMENT = r"\documentclass{article}\begin{document}x\end{document}"
 
 
+def _png(color, size) -> bytes:
+    with io.BytesIO() as buffer:
+        Image.new("RGB", size, color).save(buffer, "PNG")
+        return buffer.getvalue()
+
+
 class LatexModuleTestCase(unittest.TestCase):
+    def setUp(self):
+        cache_patcher = patch.object(
+            latex_module,
+            "_RENDER_CACHE",
+            latex_module.RenderCache(max_entries=0, disk_dir=None),
+        )
+        cache_patcher.start()
+        self.addCleanup(cache_patcher.stop)
+        # Document tests exercise the pdflatex path unless they opt into dvipng routing.
+        dvipng_documents_patcher = patch.object(latex_module, "_DVIPNG_DOCUMENTS_ENABLED", False)
+        dvipng_documents_patcher.start()
+        self.addCleanup(dvipng_documents_patcher.stop)
+        blocklist_patcher = patch.object(
+            latex_module,
+            "_FAST_PATH_BLOCKLIST",
+            latex_module.FastPathBlocklist(),
+        )
+        blocklist_patcher.start()
+        self.addCleanup(blocklist_patcher.stop)
+
     def test_find_latex_error_returns_human_readable_message(self):
         compiler_log = "\n \n\n\n\n\n\r\r \n\n\n\n\n\r\rCompilation failed with error logs:\n! Missing delimiter.\n \n\n\n\n\n\r\r\r\r\r\r\\"
 
@@ -505,6 +539,112 @@ class LatexModuleTestCase(unittest.TestCase):
         self.assertEqual(result, latex_module._UNKNOWN_COMPILE_ERROR)
         self.assertFalse(Path(f"{output_base}.png").exists())
 
+    def test_text_to_latex_compiles_documents_with_shared_format_cache(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_base = str(Path(temp_dir) / "document_render")
+            with patch.object(latex_module, "Latex2PNG") as mock_latex2png:
+                mock_latex2png.return_value.compile.return_value = [PNG_SIGNATURE + b"doc"]
+
+                result = latex_module.text_to_latex(FULL_DOCUMENT, output_base)
+
+        self.assertTrue(result)
+        mock_latex2png.assert_called_once_with(
+            format_cache=latex_module._DOCUMENT_FORMAT_CACHE,
+            cancel_token=None,
+            deadline=ANY,
+        )
+
+    def test_text_to_latex_cancelled_render_skips_pdflatex_fallback(self):
+        token = latex_module.CancellationToken()
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_base = str(Path(temp_dir) / "cancelled_render")
+            with patch.object(latex_module, "InlineDviPngRenderer") as mock_dvipng_renderer, patch.object(
+                latex_module,
+                "Latex2PNG",
+            ) as mock_latex2png:
+                mock_dvipng_renderer.return_value.compile.side_effect = (
+                    latex_module.CompilationCancelledError("cancelled")
+                )
+
+                result = latex_module.text_to_latex(r"x^2", output_base, cancel_token=token)
+
+        self.assertEqual(result, latex_module._CANCELLED_RENDER_ERROR)
+        self.assertEqual(mock_dvipng_renderer.call_args.kwargs["cancel_token"], token)
+        mock_latex2png.assert_not_called()
+
+    def test_text_to_latex_skips_pdflatex_fallback_when_deadline_is_spent(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_base = str(Path(temp_dir) / "late_render")
+            with patch.object(latex_module, "InlineDviPngRenderer") as mock_dvipng_renderer, patch.object(
+                latex_module,
+                "Latex2PNG",
+            ) as mock_latex2png:
+                mock_dvipng_renderer.return_value.compile.side_effect = Exception("dvipng failed")
+
+                result = latex_module.text_to_latex(
+                    r"x^2",
+                    output_base,
+                    deadline=time.monotonic() + 0.5,
+                )
+
+        self.assertEqual(result, latex_module._UNKNOWN_COMPILE_ERROR)
+        mock_latex2png.assert_not_called()
+
+    def test_text_to_latex_caps_deadline_at_input_class_budget(self):
+        budgets = {"inline": 2.0, "structured": 5.0, "tikz": 9.0}
+        cases = (
+            (FULL_DOCUMENT, "structured"),
+            (r"\begin{tikzpicture}\draw (0,0) -- (1,1);\end{tikzpicture}", "tikz"),
+        )
+
+        for expr, budget_class in cases:
+            with self.subTest(budget_class=budget_class), tempfile.TemporaryDirectory() as temp_dir:
+                output_base = str(Path(temp_dir) / "budget_render")
+                with patch.dict(latex_module._RENDER_BUDGET_SECONDS, budgets), patch.object(
+                    latex_module,
+                    "Latex2PNG",
+                ) as mock_latex2png:
+                    mock_latex2png.return_value.compile.return_value = [PNG_SIGNATURE + b"doc"]
+                    started = time.monotonic()
+
+                    latex_module.text_to_latex(expr, output_base, deadline=started + 60)
+
+                deadline = mock_latex2png.call_args.kwargs["deadline"]
+                self.assertGreater(deadline, started)
+                self.assertLessEqual(deadline, time.monotonic() + budgets[budget_class])
+                self.assertGreater(deadline, started + budgets[budget_class] - 1)
+
+    def test_atext_to_latex_falls_back_to_async_pdflatex(self):
+        png_payload = PNG_SIGNATURE + b"async-fallback"
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_base = str(Path(temp_dir) / "async_render")
+            with patch.object(latex_module, "AsyncInlineDviPngRenderer") as mock_dvipng_renderer, patch.object(
+                latex_module,
+                "AsyncLatex2PNG",
+            ) as mock_latex2png:
+                mock_dvipng_renderer.return_value.acompile = AsyncMock(side_effect=Exception("dvipng failed"))
+                mock_latex2png.return_value.acompile = AsyncMock(return_value=[png_payload])
+
+                result = asyncio.run(latex_module.atext_to_latex(r"x^2", output_base))
+                written = Path(f"{output_base}.png").read_bytes()
+
+        self.assertTrue(result)
+        self.assertEqual(written, png_payload)
+        mock_dvipng_renderer.return_value.acompile.assert_awaited_once()
+        mock_latex2png.return_value.acompile.assert_awaited_once()
+
+    def test_atext_to_latex_reports_compile_errors_like_sync_path(self):
+        with tempfile.TemporaryDirectory() as temp_dir:
+            output_base = str(Path(temp_dir) / "async_failed")
+            with patch.object(latex_module, "AsyncLatex2PNG") as mock_latex2png:
+                mock_latex2png.return_value.acompile = AsyncMock(side_effect=Exception("opaque failure"))
+
+                result = asyncio.run(latex_module.atext_to_latex(FULL_DOCUMENT, output_base))
+
+        self.assertEqual(result, latex_module._UNKNOWN_COMPILE_ERROR)
+
     def test_text_to_latex_routes_simple_math_through_dvipng_fast_path(self):
         png_payload = PNG_SIGNATURE + b"simple-math"
 
@@ -555,6 +695,389 @@ class LatexModuleTestCase(unittest.TestCase):
             "pdflatex",
         )
 
+    def test_failed_fast_path_input_and_blamed_commands_skip_dvipng_next_time(self):
+        runtime_counters.reset_counters()
+        self.addCleanup(runtime_counters.reset_counters)
+        failure_log = (
+            "Compilation failed with error logs:\n"
+            "! Undefined control sequence.\n"
+            "l.9 $\\displaystyle \\frac{1}{\\weird\n"
+        )
+
+        with patch.object(latex_module, "InlineDviPngRenderer") as mock_dvipng_renderer, patch.object(
+            latex_module, "Latex2PNG"
+        ) as mock_latex2png:
+            mock_dvipng_renderer.return_value.compile.side_effect = Exception(failure_log)
+            mock_latex2png.return_value.compile.return_value = [b"pdf-page"]
+
+            for expr in (r"\frac{1}{\weird}", r"\frac{1}{\weird}", r"\frac{2}{\weird}", r"\weird + 1"):
+                self.assertEqual(latex_module.text_to_png_pages(expr, "req-negative"), [b"pdf-page"])
+
+        # The repeat of the first input and the third input both reach dvipng only once;
+        # after two inputs blame \weird, any input using it skips dvipng.
+        self.assertEqual(mock_dvipng_renderer.return_value.compile.call_count, 2)
+        self.assertEqual(latex_module._FAST_PATH_BLOCKLIST.learned_tokens, [r"\weird"])
+        counters = runtime_counters.snapshot_counters()
+        self.assertEqual(counters["fast_path.attempts"], 2)
+        self.assertEqual(counters["fast_path.failures"], 2)
+        self.assertEqual(counters["fast_path.skipped_input"], 1)
+        self.assertEqual(counters["fast_path.skipped_token"], 1)
+
+    def test_fast_path_timeouts_are_not_remembered(self):
+        with patch.object(latex_module, "InlineDviPngRenderer") as mock_dvipng_renderer, patch.object(
+            latex_module, "Latex2PNG"
+        ) as mock_latex2png:
+            mock_dvipng_renderer.return_value.compile.side_effect = latex_module.CompilationTimeoutError(
+                "Compiler 'latex' timed out after 5.0s."
+            )
+            mock_latex2png.return_value.compile.return_value = [b"pdf-page"]
+
+            latex_module.text_to_png_pages(r"\frac{1}{2}", "req-timeout-1")
+            latex_module.text_to_png_pages(r"\frac{1}{2}", "req-timeout-2")
+
+        self.assertEqual(mock_dvipng_renderer.return_value.compile.call_count, 2)
+
+    def _enable_race(self, spare_capacity=True):
+        latex_module._FAST_PATH_BLOCKLIST.record_failure("earlier-input", [r"\weird"])
+        for name, value in (
+            ("_SPECULATIVE_RACE_ENABLED", True),
+            ("_spare_capacity_probe", lambda: spare_capacity),
+        ):
+            patcher = patch.object(latex_module, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        runtime_counters.reset_counters()
+        self.addCleanup(runtime_counters.reset_counters)
+
+    def test_race_returns_first_success_and_cancels_the_other_leg(self):
+        self._enable_race()
+        dvipng_tokens = []
+
+        class SlowDviPngRenderer:
+            def __init__(self, cancel_token=None, **kwargs):
+                self.cancel_token = cancel_token
+                dvipng_tokens.append(cancel_token)
+
+            def compile(self, *args, **kwargs):
+                give_up = time.monotonic() + 5
+                while not self.cancel_token.cancelled and time.monotonic() < give_up:
+                    time.sleep(0.005)
+                raise latex_module.CompilationCancelledError("cancelled")
+
+        with patch.object(latex_module, "InlineDviPngRenderer", SlowDviPngRenderer), patch.object(
+            latex_module, "Latex2PNG"
+        ) as mock_latex2png:
+            mock_latex2png.return_value.compile.return_value = [b"pdf-page"]
+
+            result = latex_module.text_to_png_pages(r"\frac{1}{\weird}", "req-race")
+
+        self.assertEqual(result, [b"pdf-page"])
+        self.assertTrue(dvipng_tokens[0].cancelled)
+        counters = runtime_counters.snapshot_counters()
+        self.assertEqual(counters["render.race.started"], 1)
+        self.assertEqual(counters["render.race.won.pdflatex"], 1)
+        self.assertNotIn("fast_path.failures", counters)
+
+    def test_race_returns_without_waiting_for_the_losing_leg(self):
+        self._enable_race()
+        release_loser = threading.Event()
+        loser_exited = threading.Event()
+
+        class StuckDviPngRenderer:
+            def __init__(self, **kwargs):
+                pass
+
+            def compile(self, *args, **kwargs):
+                release_loser.wait(5)
+                loser_exited.set()
+                raise latex_module.CompilationCancelledError("cancelled")
+
+        slots = threading.BoundedSemaphore(latex_module._MAX_CONCURRENT_RACES)
+        with patch.object(latex_module, "_RACE_SLOTS", slots), patch.object(
+            latex_module, "InlineDviPngRenderer", StuckDviPngRenderer
+        ), patch.object(latex_module, "Latex2PNG") as mock_latex2png:
+            mock_latex2png.return_value.compile.return_value = [b"pdf-page"]
+
+            result = latex_module.text_to_png_pages(r"\frac{1}{\weird}", "req-race-detached")
+            loser_running = not loser_exited.is_set()
+            slots_in_use = latex_module._MAX_CONCURRENT_RACES - slots._value
+            release_loser.set()
+            loser_exited.wait(5)
+
+        for _ in range(100):
+            if slots._value == latex_module._MAX_CONCURRENT_RACES:
+                break
+            time.sleep(0.01)
+        self.assertEqual(result, [b"pdf-page"])
+        self.assertTrue(loser_running)
+        self.assertEqual(slots_in_use, 1)
+        self.assertEqual(slots._value, latex_module._MAX_CONCURRENT_RACES)
+
+    def test_race_is_skipped_without_spare_queue_capacity(self):
+        self._enable_race(spare_capacity=False)
+
+        with patch.object(latex_module, "InlineDviPngRenderer") as mock_dvipng_renderer, patch.object(
+            latex_module, "Latex2PNG"
+        ) as mock_latex2png:
+            mock_dvipng_renderer.return_value.compile.return_value = b"dvipng-page"
+
+            result = latex_module.text_to_png_pages(r"\frac{1}{\weird}", "req-no-race")
+
+        self.assertEqual(result, [b"dvipng-page"])
+        mock_latex2png.assert_not_called()
+        self.assertNotIn("render.race.started", runtime_counters.snapshot_counters())
+
+    def test_async_race_cancels_slower_pdflatex(self):
+        self._enable_race()
+        cancelled = []
+
+        async def slow_pdflatex(*args, **kwargs):
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        with patch.object(latex_module, "AsyncInlineDviPngRenderer") as mock_dvipng_renderer, patch.object(
+            latex_module, "AsyncLatex2PNG"
+        ) as mock_latex2png:
+            mock_dvipng_renderer.return_value.acompile = AsyncMock(return_value=b"dvipng-page")
+            mock_latex2png.return_value.acompile = slow_pdflatex
+
+            result = asyncio.run(latex_module.atext_to_png_pages(r"\frac{1}{\weird}", "req-arace"))
+
+        self.assertEqual(result, [b"dvipng-page"])
+        self.assertEqual(cancelled, [True])
+        self.assertEqual(runtime_counters.snapshot_counters()["render.race.won.dvipng_inline"], 1)
+        self.assertFalse(latex_module._FAST_PATH_BLOCKLIST.is_suspect([r"\weird"]))
+
+    def test_render_request_key_identifies_equivalent_renders(self):
+        def key(expr, dpi=300):
+            return latex_module.render_request_key(latex_module.prepare_render_request(expr, dpi))
+
+        self.assertEqual(key("  x^2  "), key("x^2"))
+        self.assertNotEqual(key("x^2", 600), key("x^2"))
+        self.assertNotEqual(key("x^3"), key("x^2"))
+
+    def test_render_lane_classifies_requests_by_expected_cost(self):
+        def lane(expr):
+            return latex_module.render_lane(latex_module.prepare_render_request(expr, 300))
+
+        self.assertEqual(lane("x^2"), "fast")
+        self.assertEqual(lane("\\begin{itemize}\\item a\\end{itemize}"), "inline")
+        self.assertEqual(lane("\\begin{tikzpicture}\\draw (0,0) -- (1,1);\\end{tikzpicture}"), "structured")
+        self.assertEqual(
+            lane("\\documentclass{article}\\begin{document}Hi\\end{document}"),
+            "structured",
+        )
+
+    def test_prepare_render_request_rejects_invalid_input_without_rendering(self):
+        with patch.object(latex_module, "_render_png_request") as mock_render:
+            too_long = latex_module.prepare_render_request("x" * 4000, 300)
+            too_fine = latex_module.prepare_render_request("x", latex_module.MAX_RENDER_DPI + 1)
+            broken = latex_module.prepare_render_request("\\frac{1}{2", 300)
+
+        self.assertTrue(too_long.startswith("Input too long:"))
+        self.assertTrue(too_fine.startswith("DPI too large:"))
+        self.assertTrue(broken.startswith("LaTeX syntax error"))
+        mock_render.assert_not_called()
+
+    def test_render_prepared_pages_renders_without_repeating_preflight(self):
+        render_request = latex_module.prepare_render_request("x^2", 300)
+
+        with patch.object(latex_module, "_run_preflight_checks") as mock_preflight, patch.object(
+            latex_module, "_render_png_request", return_value=[PNG_SIGNATURE + b"page"]
+        ) as mock_render:
+            pages = latex_module.render_prepared_pages(render_request, "req")
+
+        self.assertEqual(pages, [PNG_SIGNATURE + b"page"])
+        mock_preflight.assert_not_called()
+        self.assertEqual(mock_render.call_args.kwargs["latex_code"], render_request.latex_code)
+
+    def test_render_prepared_many_does_not_repeat_preflight(self):
+        prepared = [
+            latex_module.prepare_render_request("x^2", 300),
+            latex_module.prepare_render_request(r"\frac{1}{2", 300),
+        ]
+
+        with patch.object(latex_module, "_run_preflight_checks") as mock_preflight, patch.object(
+            latex_module, "InlineDviPngRenderer"
+        ) as mock_dvipng_renderer:
+            mock_dvipng_renderer.return_value.compile_pages.return_value = [b"one"]
+
+            results = latex_module.render_prepared_many(prepared)
+
+        self.assertEqual(results, [b"one", prepared[1]])
+        mock_preflight.assert_not_called()
+
+    def test_render_many_compiles_inline_items_in_one_run(self):
+        with patch.object(latex_module, "InlineDviPngRenderer") as mock_dvipng_renderer, patch.object(
+            latex_module, "Latex2PNG"
+        ) as mock_latex2png:
+            mock_dvipng_renderer.return_value.compile_pages.return_value = [b"one", b"two"]
+            mock_latex2png.return_value.compile.return_value = [b"document"]
+
+            results = latex_module.render_many(
+                [r"\frac{1}{2}", FULL_DOCUMENT, r"\frac{1}{2", "x^2"],
+                dpi=250,
+            )
+
+        self.assertEqual(results[0], b"one")
+        self.assertEqual(results[1], b"document")
+        self.assertTrue(results[2].startswith("LaTeX syntax error"))
+        self.assertEqual(results[3], b"two")
+        mock_dvipng_renderer.return_value.compile_pages.assert_called_once()
+        batch_code = mock_dvipng_renderer.return_value.compile_pages.call_args.args[0]
+        self.assertIn("multi=batchpage", batch_code)
+        self.assertEqual(batch_code.count(r"\begin{batchpage}"), 2)
+        self.assertEqual(mock_dvipng_renderer.return_value.compile_pages.call_args.kwargs["dpi"], 250)
+
+    def test_expired_deadline_does_not_blocklist_the_input(self):
+        expr = r"\weird{x}"
+        expired = latex_module.text_to_png_bytes(expr, "expired", 300, None, time.monotonic() - 1)
+
+        with patch.object(latex_module, "InlineDviPngRenderer") as mock_dvipng_renderer:
+            mock_dvipng_renderer.return_value.compile.return_value = PNG_SIGNATURE + b"fast"
+            result = latex_module.text_to_png_bytes(expr, "later", 300)
+
+        self.assertIsInstance(expired, str)
+        self.assertEqual(result, PNG_SIGNATURE + b"fast")
+        mock_dvipng_renderer.return_value.compile.assert_called_once()
+        self.assertEqual(latex_module._FAST_PATH_BLOCKLIST.learned_tokens, [])
+
+    def test_batch_deadline_failure_does_not_blocklist_items(self):
+        timeout = latex_module.CompilationTimeoutError(
+            "Renderer 'dvipng' was not started: the render deadline has passed.\n"
+            "./main.tex:13: Undefined control sequence.\n"
+        )
+
+        with patch.object(latex_module, "InlineDviPngRenderer") as mock_dvipng_renderer, patch.object(
+            latex_module, "Latex2PNG"
+        ) as mock_latex2png:
+            mock_dvipng_renderer.return_value.compile_pages.side_effect = timeout
+            mock_latex2png.return_value.compile.return_value = [b"one", b"two"]
+            latex_module.render_many(["x", r"\weird"])
+
+        blamed = latex_module.prepare_render_request(r"\weird", 300)
+        self.assertFalse(
+            latex_module._FAST_PATH_BLOCKLIST.should_skip(
+                latex_module.fast_path_key(blamed.latex_code), set()
+            )
+        )
+
+    def test_render_many_gives_the_batch_its_largest_item_budget(self):
+        budgets = {"inline": 5.0, "tikz": 20.0}
+
+        def budget_class(render_request):
+            return "tikz" if "tikz" in render_request.source_expr else "inline"
+
+        with patch.dict(latex_module._RENDER_BUDGET_SECONDS, budgets), patch.object(
+            latex_module, "_render_budget_class", side_effect=budget_class
+        ), patch.object(latex_module, "InlineDviPngRenderer") as mock_dvipng_renderer:
+            mock_dvipng_renderer.return_value.compile_pages.return_value = [b"one", b"two"]
+            started = time.monotonic()
+
+            latex_module.render_many(["x", r"\text{tikz}"])
+            capped_started = time.monotonic()
+            latex_module.render_many(["y", r"\text{tikz}"], deadline=capped_started + 8)
+
+        first_deadline = mock_dvipng_renderer.call_args_list[0].kwargs["deadline"]
+        self.assertGreaterEqual(first_deadline, started + 20)
+        self.assertEqual(mock_dvipng_renderer.call_args_list[1].kwargs["deadline"], capped_started + 8)
+
+    def test_batch_pages_are_cached_apart_from_single_renders(self):
+        with patch.object(
+            latex_module,
+            "_RENDER_CACHE",
+            latex_module.RenderCache(max_entries=8, disk_dir=None),
+        ), patch.object(latex_module, "InlineDviPngRenderer") as mock_dvipng_renderer:
+            mock_dvipng_renderer.return_value.compile_pages.return_value = [b"batch-x", b"batch-y"]
+            mock_dvipng_renderer.return_value.compile.return_value = PNG_SIGNATURE + b"single-x"
+
+            first = latex_module.render_many(["x", "y"])
+            again = latex_module.render_many(["x", "y"])
+            single = latex_module.text_to_png_bytes("x", "single", 300)
+
+        self.assertEqual(first, [b"batch-x", b"batch-y"])
+        self.assertEqual(again, first)
+        mock_dvipng_renderer.return_value.compile_pages.assert_called_once()
+        self.assertEqual(single, PNG_SIGNATURE + b"single-x")
+
+    def test_render_many_retries_dvipng_batch_failure_through_pdflatex(self):
+        # Line 13 is the body of the second page in the generated batch document.
+        failure = Exception(
+            "Compilation failed with error logs:\n"
+            "./main.tex:13: Undefined control sequence.\n"
+            "l.13 $\\displaystyle \\weird\n"
+        )
+
+        with patch.object(latex_module, "InlineDviPngRenderer") as mock_dvipng_renderer, patch.object(
+            latex_module, "Latex2PNG"
+        ) as mock_latex2png:
+            mock_dvipng_renderer.return_value.compile_pages.side_effect = failure
+            mock_latex2png.return_value.compile.return_value = [b"one", b"two", b"three"]
+
+            results = latex_module.render_many(["x", r"\weird", "z"])
+
+        self.assertEqual(results, [b"one", b"two", b"three"])
+        self.assertEqual(mock_latex2png.return_value.compile.call_args.kwargs["last_page"], 3)
+        blamed = latex_module.prepare_render_request(r"\weird", 300)
+        self.assertTrue(
+            latex_module._FAST_PATH_BLOCKLIST.should_skip(
+                latex_module.fast_path_key(blamed.latex_code), set()
+            )
+        )
+
+    def test_render_many_skips_dvipng_when_an_item_is_blocklisted(self):
+        blocked = latex_module.prepare_render_request(r"\weird", 300)
+        latex_module._FAST_PATH_BLOCKLIST.record_failure(latex_module.fast_path_key(blocked.latex_code), [])
+
+        with patch.object(latex_module, "InlineDviPngRenderer") as mock_dvipng_renderer, patch.object(
+            latex_module, "Latex2PNG"
+        ) as mock_latex2png:
+            mock_latex2png.return_value.compile.return_value = [b"one", b"two"]
+
+            results = latex_module.render_many(["x", r"\weird"])
+
+        self.assertEqual(results, [b"one", b"two"])
+        mock_dvipng_renderer.assert_not_called()
+
+    def test_render_many_attributes_compile_error_to_one_item_and_retries_the_rest(self):
+        # Line 13 is the body of the second page in the generated batch document.
+        failure = Exception(
+            "Compilation failed with error logs:\n"
+            "./main.tex:13: Undefined control sequence.\n"
+            "l.13 $\\displaystyle \\nosuchcommand\n"
+        )
+
+        with patch.object(latex_module, "InlineDviPngRenderer") as mock_dvipng_renderer, patch.object(
+            latex_module, "Latex2PNG"
+        ) as mock_latex2png:
+            mock_dvipng_renderer.return_value.compile_pages.side_effect = [failure, [b"one", b"three"]]
+            mock_latex2png.return_value.compile.side_effect = failure
+
+            results = latex_module.render_many(["x", r"\nosuchcommand", "z"])
+
+        self.assertEqual(results[0], b"one")
+        self.assertIsInstance(results[1], str)
+        self.assertIn("line 1", results[1])
+        self.assertEqual(results[2], b"three")
+        mock_latex2png.return_value.compile.assert_called_once()
+        retried_code = mock_dvipng_renderer.return_value.compile_pages.call_args.args[0]
+        self.assertNotIn(r"\nosuchcommand", retried_code)
+
+    def test_render_many_falls_back_to_single_renders_when_failure_is_unattributed(self):
+        with patch.object(latex_module, "InlineDviPngRenderer") as mock_dvipng_renderer, patch.object(
+            latex_module, "Latex2PNG"
+        ) as mock_latex2png:
+            mock_dvipng_renderer.return_value.compile_pages.side_effect = Exception("dvipng crashed")
+            mock_dvipng_renderer.return_value.compile.side_effect = [b"one", b"two"]
+            mock_latex2png.return_value.compile.side_effect = Exception("pdflatex crashed")
+
+            results = latex_module.render_many(["x", "y"])
+
+        self.assertEqual(results, [b"one", b"two"])
+
     def test_text_to_latex_routes_blocked_inline_commands_through_pdf_renderer(self):
         png_payload = PNG_SIGNATURE + b"blocked-inline"
 
@@ -681,6 +1204,187 @@ class LatexModuleTestCase(unittest.TestCase):
         self.assertEqual(compile_kwargs["dpi"], 410)
         self.assertFalse(compile_kwargs["transparent"])
 
+    def test_dvi_safe_document_classifier(self):
+        amsmath_document = (
+            "\\documentclass{article}\n\\usepackage{amsmath,amssymb}\n"
+            "% \\usepackage{graphicx}\n"
+            "\\begin{document}\\begin{align}x&=1\\end{align}\\end{document}"
+        )
+
+        self.assertTrue(latex_module._is_dvi_safe_document(amsmath_document))
+        self.assertTrue(latex_module._is_dvi_safe_document(FULL_DOCUMENT))
+        for expr in (
+            "\\usepackage{graphicx}\n\\begin{document}x\\end{document}",
+            "\\usepackage{hyperref}\n\\begin{document}x\\end{document}",
+            "\\documentclass[tikz]{standalone}\\begin{document}x\\end{document}",
+            "\\begin{tikzpicture}\\draw (0,0) -- (1,1);\\end{tikzpicture}",
+            "\\begin{document}\\pdfliteral{q}\\end{document}",
+        ):
+            with self.subTest(expr=expr):
+                self.assertFalse(latex_module._is_dvi_safe_document(expr))
+
+    def test_dvi_safe_documents_render_through_dvipng_on_white(self):
+        runtime_counters.reset_counters()
+        self.addCleanup(runtime_counters.reset_counters)
+
+        with patch.object(latex_module, "_DVIPNG_DOCUMENTS_ENABLED", True), patch.object(
+            latex_module, "InlineDviPngRenderer"
+        ) as mock_dvipng_renderer, patch.object(latex_module, "Latex2PNG") as mock_latex2png:
+            mock_dvipng_renderer.return_value.compile_pages.return_value = [b"page-1"]
+
+            result = latex_module.text_to_png_pages(FULL_DOCUMENT, "req-dvi-doc", dpi=410)
+
+        self.assertEqual(result, [b"page-1"])
+        mock_latex2png.assert_not_called()
+        self.assertIs(
+            mock_dvipng_renderer.call_args.kwargs["format_cache"],
+            latex_module._DOCUMENT_FORMAT_CACHE,
+        )
+        compile_kwargs = mock_dvipng_renderer.return_value.compile_pages.call_args.kwargs
+        self.assertFalse(compile_kwargs["transparent"])
+        self.assertEqual((compile_kwargs["dpi"], compile_kwargs["first_page"]), (410, 1))
+        counters = runtime_counters.snapshot_counters()
+        self.assertEqual(counters["render.path.dvipng_document.success"], 1)
+        self.assertIn("render.path.dvipng_document.success_ms", counters)
+        self.assertNotIn("render.path.pdflatex.success", counters)
+
+    def test_dvi_safe_document_falls_back_to_pdflatex_and_counts_both_paths(self):
+        runtime_counters.reset_counters()
+        self.addCleanup(runtime_counters.reset_counters)
+
+        with patch.object(latex_module, "_DVIPNG_DOCUMENTS_ENABLED", True), patch.object(
+            latex_module, "InlineDviPngRenderer"
+        ) as mock_dvipng_renderer, patch.object(latex_module, "Latex2PNG") as mock_latex2png:
+            mock_dvipng_renderer.return_value.compile_pages.side_effect = Exception("dvipng failed")
+            mock_latex2png.return_value.compile.return_value = [b"pdf-page"]
+
+            result = latex_module.text_to_png_pages(FULL_DOCUMENT, "req-dvi-fallback")
+
+        self.assertEqual(result, [b"pdf-page"])
+        counters = runtime_counters.snapshot_counters()
+        self.assertEqual(counters["render.path.dvipng_document.failure"], 1)
+        self.assertEqual(counters["render.path.pdflatex.success"], 1)
+
+    def test_pdf_only_documents_skip_dvipng(self):
+        expr = "\\usepackage{graphicx}\n\\begin{document}\\rotatebox{90}{x}\\end{document}"
+
+        with patch.object(latex_module, "_DVIPNG_DOCUMENTS_ENABLED", True), patch.object(
+            latex_module, "InlineDviPngRenderer"
+        ) as mock_dvipng_renderer, patch.object(latex_module, "Latex2PNG") as mock_latex2png:
+            mock_latex2png.return_value.compile.return_value = [b"pdf-page"]
+
+            latex_module.text_to_png_pages(expr, "req-graphicx")
+
+        mock_dvipng_renderer.assert_not_called()
+        mock_latex2png.return_value.compile.assert_called_once()
+
+    def test_text_to_latex_serves_repeated_render_from_cache(self):
+        png_payload = PNG_SIGNATURE + b"cached"
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            cache = latex_module.RenderCache(max_entries=8, disk_dir=None)
+            with patch.object(latex_module, "_RENDER_CACHE", cache), patch.object(
+                latex_module,
+                "InlineDviPngRenderer",
+            ) as mock_dvipng_renderer, patch.object(latex_module, "Latex2PNG"):
+                mock_dvipng_renderer.return_value.compile.return_value = png_payload
+
+                first = latex_module.text_to_latex(r"\frac{1}{2}", str(Path(temp_dir) / "a"))
+                second = latex_module.text_to_latex(r"\frac{1}{2}", str(Path(temp_dir) / "b"))
+
+            self.assertEqual(Path(temp_dir, "b.png").read_bytes(), png_payload)
+
+        self.assertEqual((first, second), (True, True))
+        mock_dvipng_renderer.return_value.compile.assert_called_once()
+
+    def test_text_to_png_bytes_returns_png_without_writing_files(self):
+        png_payload = PNG_SIGNATURE + b"in-memory"
+        cache = latex_module.RenderCache(max_entries=8, disk_dir=None)
+
+        with tempfile.TemporaryDirectory() as temp_dir, patch.object(
+            latex_module,
+            "_RENDER_CACHE",
+            cache,
+        ), patch.object(latex_module, "InlineDviPngRenderer") as mock_dvipng_renderer:
+            mock_dvipng_renderer.return_value.compile.return_value = png_payload
+            previous_cwd = os.getcwd()
+            os.chdir(temp_dir)
+            try:
+                result = latex_module.text_to_png_bytes(r"\frac{1}{2}", "req123")
+                cached = latex_module.text_to_png_bytes(r"\frac{1}{2}", "req456")
+                failure = latex_module.text_to_png_bytes("x" * 3001, "req789")
+            finally:
+                os.chdir(previous_cwd)
+            leftovers = list(Path(temp_dir).iterdir())
+
+        self.assertEqual(result, png_payload)
+        self.assertEqual(cached, png_payload)
+        self.assertIsInstance(failure, str)
+        self.assertEqual(leftovers, [])
+        mock_dvipng_renderer.return_value.compile.assert_called_once()
+
+    def _render_pages_with_policy(self, policy, pages, max_pages=4):
+        cache = latex_module.RenderCache(max_entries=8, disk_dir=None)
+        with patch.object(latex_module, "_RENDER_CACHE", cache), patch.object(
+            latex_module, "_MULTIPAGE_POLICY", policy
+        ), patch.object(latex_module, "_MAX_PAGES", max_pages), patch.object(
+            latex_module, "Latex2PNG"
+        ) as mock_latex2png:
+            mock_latex2png.return_value.compile.return_value = pages
+            result = latex_module.text_to_png_pages(FULL_DOCUMENT, "req-pages")
+        return result, mock_latex2png.return_value.compile.call_args.kwargs
+
+    def test_first_page_policy_rasterizes_only_page_one(self):
+        result, kwargs = self._render_pages_with_policy("first", [b"p1"])
+
+        self.assertEqual(result, [b"p1"])
+        self.assertEqual((kwargs["first_page"], kwargs["last_page"]), (1, 1))
+
+    def test_warm_worker_idle_limit_accepts_fractional_seconds(self):
+        with patch.dict(
+            os.environ,
+            {"LATEX_WARM_WORKERS": "1", "LATEX_WARM_WORKER_MAX_IDLE_SECONDS": "90.5"},
+        ), patch.object(latex_module, "WarmWorkerPool") as mock_pool, patch.object(
+            latex_module.atexit, "register"
+        ):
+            latex_module._build_warm_worker_pool()
+
+        mock_pool.assert_called_once_with(size=1, max_idle_seconds=90.5)
+
+    def test_attachments_policy_caps_pages_at_max_pages(self):
+        result, kwargs = self._render_pages_with_policy(
+            "attachments", [b"p1", b"p2", b"p3"], max_pages=2
+        )
+
+        self.assertEqual((kwargs["first_page"], kwargs["last_page"]), (1, 2))
+        self.assertEqual(result, [b"p1", b"p2"])
+
+    def test_stitch_policy_stacks_pages_into_one_image(self):
+        pages = [_png((255, 0, 0), (30, 10)), _png((0, 0, 255), (20, 15))]
+
+        result, _ = self._render_pages_with_policy("stitch", pages)
+
+        self.assertEqual(len(result), 1)
+        stitched = Image.open(io.BytesIO(result[0]))
+        self.assertEqual(stitched.size, (30, 25))
+        self.assertEqual(stitched.getpixel((0, 0)), (255, 0, 0))
+        self.assertEqual(stitched.getpixel((0, 24)), (0, 0, 255))
+
+    def test_text_to_latex_does_not_cache_compile_failures(self):
+        cache = latex_module.RenderCache(max_entries=8, disk_dir=None)
+
+        with tempfile.TemporaryDirectory() as temp_dir:
+            with patch.object(latex_module, "_RENDER_CACHE", cache), patch.object(
+                latex_module,
+                "Latex2PNG",
+            ) as mock_latex2png:
+                mock_latex2png.return_value.compile.side_effect = Exception("opaque failure")
+
+                latex_module.text_to_latex(FULL_DOCUMENT, str(Path(temp_dir) / "a"))
+                latex_module.text_to_latex(FULL_DOCUMENT, str(Path(temp_dir) / "b"))
+
+        self.assertEqual(mock_latex2png.return_value.compile.call_count, 2)
+
 
 if __name__ == "__main__":
     unittest.main()
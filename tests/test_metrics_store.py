@@ -11,6 +11,7 @@ from unittest.mock import patch
 sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
 
 import metrics_store
+import runtime_counters
 
 
 def _iso_hours_ago(hours_ago: int) -> str:
@@ -21,30 +22,40 @@ def _iso_days_ago(days_ago: int) -> str:
     return (datetime.now(timezone.utc) - timedelta(days=days_ago)).isoformat(timespec="seconds")
 
 
+def _epoch_ms(created_at: str) -> int:
+    return int(datetime.fromisoformat(created_at).timestamp() * 1000)
+
+
 class MetricsStoreTestCase(unittest.TestCase):
     def setUp(self):
         self.temp_dir = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
         self.db_path = str(Path(self.temp_dir.name) / "metrics.db")
-        metrics_store._LAST_MAINTENANCE_RUN_MONOTONIC.clear()
+        runtime_counters.reset_counters()
 
     def tearDown(self):
         try:
             self.temp_dir.cleanup()
         except PermissionError:
             pass
-        metrics_store._LAST_MAINTENANCE_RUN_MONOTONIC.clear()
 
-    def _insert_event_row(self, created_at: str, source: str, status: str) -> None:
+    def _insert_event_row(
+        self,
+        created_at: str,
+        source: str,
+        status: str,
+        error_message: str | None = None,
+    ) -> None:
         with sqlite3.connect(self.db_path) as conn:
-            conn.execute(
-                """
-                INSERT INTO latex_events (created_at, source, status, dpi, user_id, error_message)
-                VALUES (?, ?, ?, ?, ?, ?);
-                """,
-                (created_at, source, status, 275, "42", None),
+            metrics_store._insert_latex_event_rows(
+                conn,
+                [(_epoch_ms(created_at), source, status, 275, 42, error_message, None, 0)],
             )
             conn.commit()
 
+    def _partitions(self) -> list[str]:
+        with sqlite3.connect(self.db_path) as conn:
+            return metrics_store._event_partitions(conn)
+
     def test_retention_prunes_rows_older_than_90_days(self):
         metrics_store.init_metrics_db(self.db_path)
         self._insert_event_row(_iso_days_ago(120), "legacy", "compile_error")
@@ -58,7 +69,7 @@ class MetricsStoreTestCase(unittest.TestCase):
             },
             clear=False,
         ):
-            metrics_store._run_metrics_maintenance(self.db_path)
+            report = metrics_store.run_metrics_maintenance(self.db_path)
 
         with sqlite3.connect(self.db_path) as conn:
             rows = conn.execute("SELECT source, status FROM latex_events ORDER BY id ASC;").fetchall()
@@ -66,36 +77,450 @@ class MetricsStoreTestCase(unittest.TestCase):
         self.assertEqual(len(rows), 1)
         self.assertEqual(rows[0][0], "slash")
         self.assertEqual(rows[0][1], "success")
+        self.assertEqual(report.dropped_partitions, 1)
+        self.assertNotIn(
+            metrics_store._event_partition_name(_epoch_ms(_iso_days_ago(120))),
+            self._partitions(),
+        )
 
-    def test_size_cap_prunes_oldest_rows_first(self):
+    def test_retention_deletes_rows_in_partition_straddling_cutoff(self):
         metrics_store.init_metrics_db(self.db_path)
-        oldest = _iso_hours_ago(10)
-        middle = _iso_hours_ago(5)
-        newest = _iso_hours_ago(1)
-        self._insert_event_row(oldest, "legacy", "timeout")
-        self._insert_event_row(middle, "slash", "compile_error")
-        self._insert_event_row(newest, "slash", "success")
+        cutoff = _iso_days_ago(90)
+        cutoff_partition = metrics_store._event_partition_name(_epoch_ms(cutoff))
+        partition_start = datetime.fromtimestamp(
+            metrics_store._event_partition_start_ms(cutoff_partition) / 1000,
+            tz=timezone.utc,
+        )
+        self._insert_event_row(partition_start.isoformat(), "legacy", "timeout")
+        self._insert_event_row(cutoff, "slash", "success")
+
+        with patch.object(metrics_store, "_utc_cutoff_iso", return_value=cutoff):
+            report = metrics_store.run_metrics_maintenance(self.db_path)
+
+        with sqlite3.connect(self.db_path) as conn:
+            sources = [row[0] for row in conn.execute("SELECT source FROM latex_events;").fetchall()]
+
+        self.assertEqual(sources, ["slash"])
+        self.assertEqual(report.dropped_partitions, 0)
+        self.assertIn(cutoff_partition, self._partitions())
+
+    def _insert_counter_row(self, created_at: str, name: str, value: int) -> None:
+        with sqlite3.connect(self.db_path) as conn:
+            metrics_store._insert_counter_rows(conn, [(created_at, name, value)])
+            conn.commit()
+
+    def test_size_cap_prunes_counters_and_partitions_oldest_first(self):
+        metrics_store.init_metrics_db(self.db_path)
+        self._insert_counter_row(_iso_days_ago(30), "render_cache.hits", 1)
+        self._insert_event_row(_iso_days_ago(20), "legacy", "timeout")
+        self._insert_counter_row(_iso_days_ago(10), "render_cache.hits", 2)
+        self._insert_event_row(_iso_hours_ago(0), "slash", "success")
+        self._insert_counter_row(_iso_hours_ago(0), "render_cache.hits", 3)
 
         with (
-            patch.object(metrics_store, "_get_retention_days", return_value=3650),
             patch.object(metrics_store, "_get_max_size_bytes", return_value=500),
             patch.object(metrics_store, "_PRUNE_BATCH_SIZE", 1),
-            patch.object(
-                metrics_store,
-                "_metrics_storage_size_bytes",
-                side_effect=[1000, 1000, 400],
-            ),
+            patch.object(metrics_store, "_live_size_bytes", side_effect=[1000, 1000, 400, 400]),
         ):
-            metrics_store._run_metrics_maintenance(self.db_path)
+            report = metrics_store.run_metrics_maintenance(self.db_path)
 
         with sqlite3.connect(self.db_path) as conn:
-            rows = conn.execute(
-                "SELECT created_at, source, status FROM latex_events ORDER BY created_at ASC, id ASC;"
+            counter_values = [
+                row[0] for row in conn.execute("SELECT value FROM runtime_counters ORDER BY id;")
+            ]
+        self.assertEqual(counter_values, [2, 3])
+        self.assertEqual((report.dropped_partitions, report.deleted_rows), (1, 1))
+
+    def test_size_cap_keeps_the_current_partition(self):
+        metrics_store.init_metrics_db(self.db_path)
+        self._insert_counter_row(_iso_days_ago(10), "render_cache.hits", 1)
+        self._insert_event_row(_iso_hours_ago(0), "slash", "success")
+        self._insert_counter_row(_iso_hours_ago(0), "render_cache.hits", 2)
+
+        with (
+            patch.object(metrics_store, "_get_max_size_bytes", return_value=500),
+            patch.object(metrics_store, "_live_size_bytes", return_value=1000),
+            self.assertLogs(metrics_store._LOGGER, level="WARNING") as logs,
+        ):
+            report = metrics_store.run_metrics_maintenance(self.db_path)
+
+        with sqlite3.connect(self.db_path) as conn:
+            sources = [row[0] for row in conn.execute("SELECT source FROM latex_events;")]
+            counter_values = [row[0] for row in conn.execute("SELECT value FROM runtime_counters;")]
+        self.assertEqual(sources, ["slash"])
+        self.assertEqual(counter_values, [2])
+        self.assertEqual(report.deleted_rows, 1)
+        self.assertIn("still over the size cap", logs.output[0])
+
+    def test_size_cap_drops_oldest_partition_whole(self):
+        metrics_store.init_metrics_db(self.db_path)
+        self._insert_event_row(_iso_days_ago(20), "legacy", "timeout")
+        self._insert_event_row(_iso_days_ago(19), "legacy", "timeout")
+        self._insert_event_row(_iso_hours_ago(0), "slash", "success")
+
+        with (
+            patch.object(metrics_store, "_get_max_size_bytes", return_value=500),
+            patch.object(metrics_store, "_live_size_bytes", side_effect=[1000, 400, 400]),
+        ):
+            report = metrics_store.run_metrics_maintenance(self.db_path)
+
+        with sqlite3.connect(self.db_path) as conn:
+            sources = [row[0] for row in conn.execute("SELECT source FROM latex_events;").fetchall()]
+
+        self.assertEqual(sources, ["slash"])
+        self.assertEqual(report.dropped_partitions, 1)
+        self.assertEqual(report.deleted_rows, 0)
+
+    def test_existing_table_is_kept_as_legacy_partition_until_drained(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """
+                CREATE TABLE latex_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    dpi INTEGER,
+                    user_id TEXT,
+                    error_message TEXT,
+                    duration_ms INTEGER,
+                    coalesced INTEGER NOT NULL DEFAULT 0
+                );
+                """
+            )
+            conn.executemany(
+                """
+                INSERT INTO latex_events (created_at, source, status, dpi, user_id)
+                VALUES (?, 'legacy', 'success', 275, '42');
+                """,
+                [(_iso_days_ago(120),), (_iso_days_ago(100),)],
+            )
+            conn.commit()
+
+        metrics_store.init_metrics_db(self.db_path)
+        metrics_store.record_latex_event(self.db_path, "slash", "success", 275, 1)
+
+        with sqlite3.connect(self.db_path) as conn:
+            ids = [row[0] for row in conn.execute("SELECT id FROM latex_events ORDER BY id;").fetchall()]
+        self.assertEqual(ids, [1, 2, 3])
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(
+                metrics_store._legacy_event_tables(conn),
+                [metrics_store._LEGACY_EVENT_PARTITION],
+            )
+
+        report = metrics_store.run_metrics_maintenance(self.db_path)
+
+        self.assertEqual(report.deleted_rows, 2)
+        self.assertEqual(report.dropped_partitions, 1)
+        with sqlite3.connect(self.db_path) as conn:
+            self.assertEqual(metrics_store._legacy_event_tables(conn), [])
+        metrics_store.record_latex_event(self.db_path, "slash", "success", 275, 2)
+        with sqlite3.connect(self.db_path) as conn:
+            ids = [row[0] for row in conn.execute("SELECT id FROM latex_events ORDER BY id;").fetchall()]
+        self.assertEqual(ids, [3, 4])
+
+    def test_event_ids_are_read_while_holding_the_write_lock(self):
+        metrics_store.init_metrics_db(self.db_path)
+        self._insert_event_row(_iso_hours_ago(1), "slash", "success")
+        read_next_event_id = metrics_store._next_event_id
+        other_writer_blocked = []
+
+        def next_event_id(conn):
+            event_id = read_next_event_id(conn)
+            other = sqlite3.connect(self.db_path, timeout=0)
+            try:
+                other.execute("BEGIN IMMEDIATE;")
+            except sqlite3.OperationalError:
+                other_writer_blocked.append(True)
+            finally:
+                other.close()
+            return event_id
+
+        with patch.object(metrics_store, "_next_event_id", side_effect=next_event_id):
+            metrics_store.record_latex_event(self.db_path, "slash", "success", 275, 2)
+        metrics_store.record_latex_event(self.db_path, "modal", "success", 275, 3)
+
+        with sqlite3.connect(self.db_path) as conn:
+            ids = [row[0] for row in conn.execute("SELECT id FROM latex_events ORDER BY id;").fetchall()]
+        self.assertEqual(other_writer_blocked, [True])
+        self.assertEqual(ids, [1, 2, 3])
+
+    def test_legacy_rows_migrate_into_compact_partitions_keeping_ids(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """
+                CREATE TABLE latex_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    dpi INTEGER,
+                    user_id TEXT,
+                    error_message TEXT,
+                    duration_ms INTEGER
+                );
+                """
+            )
+            conn.executemany(
+                """
+                INSERT INTO latex_events (created_at, source, status, dpi, user_id, duration_ms)
+                VALUES (?, ?, ?, 275, ?, ?);
+                """,
+                [
+                    (_iso_days_ago(10), "slash", "success", "123456789012345678", 40),
+                    (_iso_hours_ago(2), "modal", "timeout", None, None),
+                    ("not-a-date", "slash", "success", "1", 1),
+                ],
+            )
+            conn.commit()
+
+        metrics_store.init_metrics_db(self.db_path)
+        with sqlite3.connect(self.db_path) as conn:
+            before = conn.execute(
+                "SELECT id, created_at, source, status, user_id FROM latex_events WHERE id < 3 ORDER BY id;"
             ).fetchall()
 
-        self.assertEqual(len(rows), 1)
-        self.assertEqual(rows[0][0], newest)
-        self.assertEqual(rows[0][2], "success")
+        with patch.object(metrics_store, "_LEGACY_MIGRATION_ROWS_PER_RUN", 2):
+            first = metrics_store.run_metrics_maintenance(self.db_path)
+            second = metrics_store.run_metrics_maintenance(self.db_path)
+
+        with sqlite3.connect(self.db_path) as conn:
+            after = conn.execute(
+                "SELECT id, created_at, source, status, user_id FROM latex_events ORDER BY id;"
+            ).fetchall()
+            stored = conn.execute(
+                f"SELECT created_at_ms, user_id FROM {self._partitions()[-1]} WHERE id = 2;"
+            ).fetchone()
+            legacy_tables = metrics_store._legacy_event_tables(conn)
+
+        self.assertEqual((first.migrated_rows, second.migrated_rows), (2, 1))
+        self.assertEqual(second.dropped_partitions, 1)
+        self.assertEqual(legacy_tables, [])
+        self.assertEqual(after, before)
+        self.assertEqual(after[0][4], "123456789012345678")
+        self.assertIsInstance(stored[0], int)
+        self.assertIsNone(stored[1])
+
+    def test_text_weekly_partitions_are_renamed_to_legacy(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """
+                CREATE TABLE latex_events_p20200106 (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    dpi INTEGER,
+                    user_id TEXT,
+                    error_message TEXT,
+                    duration_ms INTEGER,
+                    coalesced INTEGER NOT NULL DEFAULT 0
+                );
+                """
+            )
+            conn.execute("CREATE VIEW latex_events AS SELECT * FROM latex_events_p20200106;")
+            conn.commit()
+
+        metrics_store.init_metrics_db(self.db_path)
+
+        with sqlite3.connect(self.db_path) as conn:
+            legacy_tables = metrics_store._legacy_event_tables(conn)
+        self.assertEqual(legacy_tables, ["latex_events_legacy_p20200106"])
+        self.assertNotIn("latex_events_p20200106", self._partitions())
+
+    def _assert_rollups_match_events(self) -> None:
+        with sqlite3.connect(self.db_path) as conn:
+            events = conn.execute(
+                "SELECT created_at_ms, source, status, duration_ms FROM latex_events;"
+            ).fetchall()
+            for granularity, width_ms in metrics_store._ROLLUP_WIDTHS_MS:
+                expected: dict[tuple, list[int]] = {}
+                for created_at_ms, source, status, duration_ms in events:
+                    totals = expected.setdefault(
+                        (created_at_ms // width_ms * width_ms, source, status), [0, 0, 0]
+                    )
+                    totals[0] += 1
+                    totals[1] += duration_ms or 0
+                    totals[2] = max(totals[2], duration_ms or 0)
+                rows = conn.execute(
+                    f"""
+                    SELECT r.bucket_ms, src.name, st.name, r.events, r.duration_sum, r.duration_max
+                    FROM latex_event_rollups_{granularity} AS r
+                    JOIN latex_event_sources AS src ON src.id = r.source_id
+                    JOIN latex_event_statuses AS st ON st.id = r.status_id;
+                    """
+                ).fetchall()
+                latency_events = conn.execute(
+                    f"SELECT COALESCE(SUM(events), 0) FROM latex_event_latency_{granularity};"
+                ).fetchone()[0]
+                with self.subTest(granularity=granularity):
+                    self.assertEqual({tuple(row[:3]): list(row[3:]) for row in rows}, expected)
+                    self.assertEqual(
+                        latency_events,
+                        sum(1 for *_rest, status, duration in events if status != "queued" and duration is not None),
+                    )
+
+    def test_writes_update_hourly_and_daily_rollups(self):
+        metrics_store.init_metrics_db(self.db_path)
+        writer = metrics_store.MetricsWriter(self.db_path, flush_interval_seconds=0.05)
+        writer.record_latex_event("slash", "success", 275, 1, duration_ms=120)
+        writer.record_latex_event("slash", "success", 275, 2, duration_ms=80, coalesced=True)
+        writer.record_latex_event("modal", "queued", 275, 3, duration_ms=5)
+        writer.start()
+        try:
+            self.assertTrue(writer.flush(timeout=5))
+        finally:
+            writer.close()
+
+        with sqlite3.connect(self.db_path) as conn:
+            success = conn.execute(
+                """
+                SELECT r.events, r.coalesced, r.duration_count, r.duration_sum, r.duration_max
+                FROM latex_event_rollups_daily AS r
+                JOIN latex_event_statuses AS st ON st.id = r.status_id
+                WHERE st.name = 'success';
+                """
+            ).fetchone()
+            histogram = conn.execute(
+                "SELECT lower_ms, upper_ms, events FROM latex_event_latency_hourly ORDER BY lower_ms;"
+            ).fetchall()
+
+        self.assertEqual(success, (2, 1, 2, 200, 120))
+        self.assertEqual(
+            histogram,
+            [(*metrics_store._latency_bucket(80), 1), (*metrics_store._latency_bucket(120), 1)],
+        )
+        self._assert_rollups_match_events()
+
+    def test_rollups_are_backfilled_from_existing_events(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """
+                CREATE TABLE latex_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    dpi INTEGER,
+                    user_id TEXT,
+                    error_message TEXT,
+                    duration_ms INTEGER
+                );
+                """
+            )
+            conn.executemany(
+                """
+                INSERT INTO latex_events (created_at, source, status, dpi, user_id, duration_ms)
+                VALUES (?, ?, ?, 275, '1', ?);
+                """,
+                [
+                    (_iso_days_ago(3), "slash", "success", 40),
+                    (_iso_days_ago(3), "legacy", "timeout", 15000),
+                    (_iso_hours_ago(1), "slash", "queued", None),
+                ],
+            )
+            conn.commit()
+
+        metrics_store.init_metrics_db(self.db_path)
+        self._assert_rollups_match_events()
+
+        metrics_store.run_metrics_maintenance(self.db_path)
+        metrics_store.record_latex_event(self.db_path, "slash", "success", 275, 1, duration_ms=70)
+        self._assert_rollups_match_events()
+
+    def test_rollups_follow_retention_and_size_pruning(self):
+        metrics_store.init_metrics_db(self.db_path)
+        cutoff = _iso_days_ago(90)
+        self._insert_event_row(_iso_days_ago(120), "legacy", "timeout")
+        self._insert_event_row(
+            (datetime.fromisoformat(cutoff) - timedelta(minutes=1)).isoformat(timespec="seconds"),
+            "slash",
+            "timeout",
+        )
+        self._insert_event_row(cutoff, "slash", "success")
+        self._insert_event_row(_iso_days_ago(20), "slash", "compile_error")
+        self._insert_event_row(_iso_hours_ago(0), "slash", "success")
+
+        with patch.object(metrics_store, "_utc_cutoff_iso", return_value=cutoff):
+            metrics_store.run_metrics_maintenance(self.db_path)
+        self._assert_rollups_match_events()
+
+        # Older partitions go whole, one per step; the current one is kept even over the cap.
+        for live_sizes, dropped, deleted in (([1000, 400, 400], 1, 0), ([1000, 1000, 400], 1, 0)):
+            with (
+                patch.object(metrics_store, "_utc_cutoff_iso", return_value=cutoff),
+                patch.object(metrics_store, "_get_max_size_bytes", return_value=500),
+                patch.object(metrics_store, "_PRUNE_BATCH_SIZE", 1),
+                patch.object(metrics_store, "_live_size_bytes", side_effect=live_sizes),
+            ):
+                report = metrics_store.run_metrics_maintenance(self.db_path)
+
+            self.assertEqual((report.dropped_partitions, report.deleted_rows), (dropped, deleted))
+            self._assert_rollups_match_events()
+
+    def test_new_database_uses_incremental_auto_vacuum(self):
+        metrics_store.init_metrics_db(self.db_path)
+
+        with sqlite3.connect(self.db_path) as conn:
+            auto_vacuum = conn.execute("PRAGMA auto_vacuum;").fetchone()[0]
+
+        self.assertEqual(auto_vacuum, metrics_store._SQLITE_AUTO_VACUUM_INCREMENTAL)
+
+    def test_maintenance_converts_old_database_and_reports_run(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute("PRAGMA auto_vacuum=NONE;")
+            conn.execute("CREATE TABLE padding (id INTEGER);")
+            conn.commit()
+        metrics_store.init_metrics_db(self.db_path)
+        for _ in range(200):
+            self._insert_event_row(_iso_days_ago(120), "legacy", "compile_error")
+
+        report = metrics_store.run_metrics_maintenance(self.db_path)
+
+        with sqlite3.connect(self.db_path) as conn:
+            auto_vacuum = conn.execute("PRAGMA auto_vacuum;").fetchone()[0]
+        counters = runtime_counters.snapshot_counters()
+        self.assertEqual(auto_vacuum, metrics_store._SQLITE_AUTO_VACUUM_INCREMENTAL)
+        self.assertEqual(report.dropped_partitions, 1)
+        self.assertGreaterEqual(report.duration_ms, 0)
+        self.assertGreater(report.size_bytes, 0)
+        self.assertEqual(counters["metrics_maintenance.runs"], 1)
+        self.assertEqual(counters["metrics_maintenance.dropped_partitions"], 1)
+
+    def test_incremental_vacuum_respects_page_budget(self):
+        metrics_store.init_metrics_db(self.db_path)
+        with sqlite3.connect(self.db_path) as conn:
+            metrics_store._insert_latex_event_rows(
+                conn,
+                [
+                    (_epoch_ms(_iso_days_ago(120)), "legacy", "compile_error", 275, 42, "x" * 2000, None, 0)
+                    for _ in range(200)
+                ],
+            )
+            conn.commit()
+
+        with patch.dict(os.environ, {"METRICS_VACUUM_PAGES_PER_RUN": "5"}, clear=False):
+            first = metrics_store.run_metrics_maintenance(self.db_path)
+            second = metrics_store.run_metrics_maintenance(self.db_path)
+
+        self.assertEqual(first.vacuumed_pages, 5)
+        self.assertEqual(second.vacuumed_pages, 5)
+        self.assertEqual(second.deleted_rows, 0)
+
+    def test_record_latex_event_does_not_run_maintenance(self):
+        metrics_store.init_metrics_db(self.db_path)
+        with patch.object(metrics_store, "run_metrics_maintenance") as maintenance_mock:
+            metrics_store.record_latex_event(
+                db_path=self.db_path,
+                source="slash",
+                status="success",
+                dpi=275,
+                user_id=1001,
+                error_message=None,
+            )
+
+        maintenance_mock.assert_not_called()
 
     def test_invalid_env_values_fall_back_to_defaults(self):
         with patch.dict(
@@ -104,6 +529,7 @@ class MetricsStoreTestCase(unittest.TestCase):
                 "METRICS_RETENTION_DAYS": "not-a-number",
                 "METRICS_MAX_SIZE_BYTES": "-1",
                 "METRICS_MAINTENANCE_INTERVAL_SECONDS": "0",
+                "METRICS_VACUUM_PAGES_PER_RUN": "0",
             },
             clear=False,
         ):
@@ -113,6 +539,10 @@ class MetricsStoreTestCase(unittest.TestCase):
                 metrics_store._get_maintenance_interval_seconds(),
                 metrics_store._DEFAULT_MAINTENANCE_INTERVAL_SECONDS,
             )
+            self.assertEqual(
+                metrics_store._get_vacuum_pages_per_run(),
+                metrics_store._DEFAULT_VACUUM_PAGES_PER_RUN,
+            )
 
     def test_init_creates_database_and_records_event(self):
         metrics_store.init_metrics_db(self.db_path)
@@ -139,6 +569,106 @@ class MetricsStoreTestCase(unittest.TestCase):
         self.assertEqual(duration, 1234)
         self.assertIn("duration_ms", columns)
 
+    def test_coalesced_flag_is_stored_and_added_to_old_databases(self):
+        with sqlite3.connect(self.db_path) as conn:
+            conn.execute(
+                """
+                CREATE TABLE latex_events (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    created_at TEXT NOT NULL,
+                    source TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    dpi INTEGER,
+                    user_id TEXT,
+                    error_message TEXT,
+                    duration_ms INTEGER
+                );
+                """
+            )
+            conn.commit()
+
+        metrics_store.init_metrics_db(self.db_path)
+        metrics_store.record_latex_event(self.db_path, "slash", "success", 275, 1, duration_ms=5)
+        metrics_store.record_latex_event(
+            self.db_path, "slash", "success", 275, 2, duration_ms=1, coalesced=True
+        )
+
+        with sqlite3.connect(self.db_path) as conn:
+            flags = conn.execute("SELECT coalesced FROM latex_events ORDER BY id;").fetchall()
+
+        self.assertEqual(flags, [(0,), (1,)])
+
+    def test_record_counter_snapshot_stores_one_row_per_counter(self):
+        metrics_store.init_metrics_db(self.db_path)
+
+        metrics_store.record_counter_snapshot(
+            self.db_path,
+            {"render_cache.misses": 3, "render_cache.memory_hits": 7},
+        )
+        metrics_store.record_counter_snapshot(self.db_path, {})
+
+        with sqlite3.connect(self.db_path) as conn:
+            rows = conn.execute(
+                "SELECT name, value FROM runtime_counters ORDER BY name ASC;"
+            ).fetchall()
+
+        self.assertEqual(
+            rows,
+            [("render_cache.memory_hits", 7), ("render_cache.misses", 3)],
+        )
+
+
+    def test_metrics_writer_commits_queued_rows_in_one_batch(self):
+        metrics_store.init_metrics_db(self.db_path)
+        writer = metrics_store.MetricsWriter(self.db_path, flush_interval_seconds=0.05)
+        runtime_counters.reset_counters()
+
+        for user_id in range(5):
+            writer.record_latex_event("slash", "success", 275, user_id, duration_ms=10)
+        writer.record_counter_snapshot({"render_cache.misses": 2})
+        writer.start()
+        try:
+            self.assertTrue(writer.flush(timeout=5))
+        finally:
+            writer.close()
+
+        with sqlite3.connect(self.db_path) as conn:
+            events = conn.execute("SELECT COUNT(*) FROM latex_events;").fetchone()[0]
+            counters = conn.execute("SELECT name, value FROM runtime_counters;").fetchall()
+
+        self.assertEqual(events, 5)
+        self.assertEqual(counters, [("render_cache.misses", 2)])
+        self.assertEqual(runtime_counters.snapshot_counters()["metrics_writer.flushes"], 1)
+
+    def test_metrics_writer_drops_and_counts_events_past_queue_limit(self):
+        metrics_store.init_metrics_db(self.db_path)
+        writer = metrics_store.MetricsWriter(self.db_path, max_queued=2)
+        runtime_counters.reset_counters()
+
+        for user_id in range(4):
+            writer.record_latex_event("slash", "queued", 275, user_id)
+        with self.assertRaises(ValueError):
+            writer.record_latex_event("slash", "not-a-status", 275, 1)
+        writer.start()
+        writer.close()
+
+        with sqlite3.connect(self.db_path) as conn:
+            events = conn.execute("SELECT COUNT(*) FROM latex_events;").fetchone()[0]
+
+        self.assertEqual(events, 2)
+        self.assertEqual(runtime_counters.snapshot_counters()["metrics_writer.dropped"], 2)
+
+    def test_metrics_writer_env_values_fall_back_to_defaults(self):
+        with patch.dict(
+            os.environ,
+            {"METRICS_WRITER_FLUSH_INTERVAL_MS": "250", "METRICS_WRITER_BATCH_SIZE": "0"},
+            clear=False,
+        ):
+            writer = metrics_store.MetricsWriter.from_env(self.db_path)
+
+        self.assertEqual(writer.flush_interval_seconds, 0.25)
+        self.assertEqual(writer.batch_size, metrics_store._DEFAULT_WRITER_BATCH_SIZE)
+
 
 if __name__ == "__main__":
     unittest.main()
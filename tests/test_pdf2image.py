@@ -0,0 +1,210 @@
+import asyncio
+import io
+import os
+import subprocess
+import sys
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+from PIL import Image, PngImagePlugin
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from modified_packages import pdf2image
+from modified_packages.parsers import (
+    parse_buffer_to_pgm,
+    parse_buffer_to_png,
+    parse_buffer_to_ppm,
+    split_png_buffer,
+)
+from modified_packages.exceptions import PDFPopplerTimeoutError, PDFSyntaxError
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+
+
+class FakePopplerProcess:
+    instances = []
+    hang = False
+
+    def __init__(self, args, **kwargs):
+        self.args = list(args)
+        self.kwargs = kwargs
+        self.returncode = None
+        type(self).instances.append(self)
+
+    def _render(self) -> bytes:
+        self.returncode = 0
+        output = self.args[-1]
+        if "-singlefile" in self.args:
+            if self.args[0] == "pdftocairo":
+                assert output == "-"
+            return PNG_SIGNATURE + b"page-1"
+        for page in ("01", "02"):
+            Path(f"{output}-{page}.png").write_bytes(PNG_SIGNATURE + page.encode())
+        return b""
+
+    def communicate(self, input=None, timeout=None):
+        self.stdin_data = input
+        if type(self).hang:
+            if self.returncode is None:
+                raise subprocess.TimeoutExpired(self.args, timeout)
+            return b"", b""
+        return self._render(), b""
+
+    def kill(self):
+        self.returncode = -9
+
+
+class FakeAsyncPopplerProcess(FakePopplerProcess):
+    async def communicate(self, input=None):
+        self.stdin_data = input
+        return self._render(), b""
+
+    async def wait(self):
+        return self.returncode
+
+
+class PngPassthroughTestCase(unittest.TestCase):
+    def setUp(self):
+        FakePopplerProcess.instances = []
+        FakePopplerProcess.hang = False
+
+    def test_single_file_streams_first_page_from_pdftoppm_stdout(self):
+        with patch("modified_packages.pdf2image.Popen", FakePopplerProcess):
+            pages = pdf2image.convert_to_png_bytes(b"%PDF", dpi=450, single_file=True)
+
+        process = FakePopplerProcess.instances[0]
+        args = process.args
+        self.assertEqual(pages, [PNG_SIGNATURE + b"page-1"])
+        self.assertTrue(args[0].startswith("pdftoppm"))
+        # The PDF is piped in rather than written to a temp file.
+        self.assertEqual(args[3], "-")
+        self.assertEqual(process.stdin_data, b"%PDF")
+        self.assertEqual(process.kwargs["stdin"], subprocess.PIPE)
+        self.assertIn("-png", args)
+        self.assertIn("-singlefile", args)
+        self.assertEqual(args[args.index("-f") + 1], "1")
+        self.assertEqual(args[args.index("-l") + 1], "1")
+        self.assertEqual(args[args.index("-r") + 1], "450")
+
+    def test_transparent_output_uses_pdftocairo(self):
+        with patch("modified_packages.pdf2image.Popen", FakePopplerProcess):
+            pages = pdf2image.convert_to_png_bytes(b"%PDF", transparent=True, single_file=True)
+
+        args = FakePopplerProcess.instances[0].args
+        self.assertEqual(pages, [PNG_SIGNATURE + b"page-1"])
+        self.assertTrue(args[0].startswith("pdftocairo"))
+        self.assertIn("-transp", args)
+
+    def test_all_pages_are_read_back_in_order_and_workspace_removed(self):
+        with patch("modified_packages.pdf2image.Popen", FakePopplerProcess):
+            pages = pdf2image.convert_to_png_bytes(b"%PDF")
+
+        output_root = FakePopplerProcess.instances[0].args[-1]
+        self.assertEqual(pages, [PNG_SIGNATURE + b"01", PNG_SIGNATURE + b"02"])
+        self.assertNotIn("-singlefile", FakePopplerProcess.instances[0].args)
+        self.assertFalse(os.path.exists(os.path.dirname(output_root)))
+
+    def test_timeout_kills_poppler(self):
+        FakePopplerProcess.hang = True
+
+        with patch("modified_packages.pdf2image.Popen", FakePopplerProcess):
+            with self.assertRaises(PDFPopplerTimeoutError):
+                pdf2image.convert_to_png_bytes(b"%PDF", single_file=True, timeout=0.1)
+
+        self.assertEqual(FakePopplerProcess.instances[0].returncode, -9)
+
+    def test_missing_output_raises_syntax_error(self):
+        class EmptyProcess(FakePopplerProcess):
+            def communicate(self, input=None, timeout=None):
+                self.returncode = 99
+                return b"", b"Syntax Error: broken xref"
+
+        with patch("modified_packages.pdf2image.Popen", EmptyProcess):
+            with self.assertRaises(PDFSyntaxError) as ctx:
+                pdf2image.convert_to_png_bytes(b"not a pdf", single_file=True)
+
+        self.assertIn("broken xref", str(ctx.exception))
+
+    def test_async_variant_returns_raw_png_bytes(self):
+        async def fake_exec(*args, **kwargs):
+            return FakeAsyncPopplerProcess(args, **kwargs)
+
+        with patch("modified_packages.pdf2image.asyncio.create_subprocess_exec", fake_exec):
+            pages = asyncio.run(pdf2image.aconvert_to_png_bytes(b"%PDF", single_file=True))
+
+        self.assertEqual(pages, [PNG_SIGNATURE + b"page-1"])
+
+
+def _png(color, size=(24, 16)) -> bytes:
+    with io.BytesIO() as buffer:
+        Image.new("RGB", size, color).save(buffer, "PNG")
+        return buffer.getvalue()
+
+
+class BufferParserTestCase(unittest.TestCase):
+    def test_split_png_buffer_returns_views_of_each_file(self):
+        first, second = _png((255, 0, 0)), _png((0, 0, 255))
+        data = first + second
+
+        pages = split_png_buffer(data, validate_crc=True)
+
+        self.assertEqual([bytes(page) for page in pages], [first, second])
+        self.assertTrue(all(isinstance(page, memoryview) for page in pages))
+        self.assertIs(pages[1].obj, data)
+
+    def test_split_png_buffer_ignores_iend_bytes_inside_image_data(self):
+        with io.BytesIO() as buffer:
+            Image.new("RGB", (4, 4)).save(buffer, "PNG", pnginfo=_text_chunk("note", "IENDabcd\x89PNG"))
+            tricky = buffer.getvalue()
+
+        pages = split_png_buffer(tricky + _png((0, 255, 0)))
+
+        self.assertEqual(bytes(pages[0]), tricky)
+        self.assertEqual(len(pages), 2)
+
+    def test_split_png_buffer_rejects_bad_crc_only_when_validating(self):
+        data = bytearray(_png((1, 2, 3)))
+        data[-1] ^= 0xFF  # IEND's CRC
+
+        self.assertEqual(len(split_png_buffer(data)), 1)
+        with self.assertRaises(ValueError):
+            split_png_buffer(data, validate_crc=True)
+
+    def test_split_png_buffer_rejects_truncated_input(self):
+        with self.assertRaises(ValueError):
+            split_png_buffer(_png((1, 2, 3))[:-6])
+
+    def test_parse_buffer_to_png_decodes_every_page(self):
+        images = parse_buffer_to_png(_png((255, 0, 0)) + _png((0, 0, 255), size=(8, 8)))
+
+        self.assertEqual([image.getpixel((0, 0)) for image in images], [(255, 0, 0), (0, 0, 255)])
+        self.assertEqual(images[1].size, (8, 8))
+
+    def test_netpbm_parsers_slice_pages_from_one_buffer(self):
+        ppm_page = b"P6\n3 2\n255\n" + bytes(range(18))
+        pgm_buffer = bytearray(b"P5\n3 2\n255\n" + bytes(range(6)))
+
+        ppm_images = parse_buffer_to_ppm(ppm_page + ppm_page)
+        pgm_images = parse_buffer_to_pgm(pgm_buffer)
+        pgm_buffer[-1] = 200
+
+        self.assertEqual(len(ppm_images), 2)
+        self.assertEqual(ppm_images[1].getpixel((1, 0)), (3, 4, 5))
+        # Grayscale pages are mapped onto the buffer rather than copied.
+        self.assertEqual(pgm_images[0].getpixel((2, 1)), 200)
+
+    def test_netpbm_parser_rejects_truncated_pixels(self):
+        with self.assertRaises(ValueError):
+            parse_buffer_to_ppm(b"P6\n3 2\n255\n" + bytes(10))
+
+
+def _text_chunk(key: str, value: str) -> PngImagePlugin.PngInfo:
+    info = PngImagePlugin.PngInfo()
+    info.add_text(key, value)
+    return info
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,82 @@
+import sys
+import tempfile
+import unittest
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+import runtime_counters
+from render_cache import RenderCache, render_cache_key
+
+
+class RenderCacheTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory(ignore_cleanup_errors=True)
+        self.disk_dir = Path(self.temp_dir.name) / "render-cache"
+        runtime_counters.reset_counters()
+
+    def tearDown(self):
+        self.temp_dir.cleanup()
+        runtime_counters.reset_counters()
+
+    def test_cache_key_depends_on_code_dpi_and_transparency(self):
+        base = render_cache_key(r"\frac{1}{2}", 300, True)
+
+        self.assertEqual(base, render_cache_key(r"\frac{1}{2}", 300, True))
+        self.assertNotEqual(base, render_cache_key(r"\frac{1}{3}", 300, True))
+        self.assertNotEqual(base, render_cache_key(r"\frac{1}{2}", 301, True))
+        self.assertNotEqual(base, render_cache_key(r"\frac{1}{2}", 300, False))
+        self.assertNotEqual(base, render_cache_key(r"\frac{1}{2}", 300, True, variant="stitch:4"))
+
+    def test_memory_tier_evicts_least_recently_used_entry(self):
+        cache = RenderCache(max_entries=2, disk_dir=None)
+        cache.put("a", b"aa")
+        cache.put("b", b"bb")
+        self.assertEqual(cache.get("a"), b"aa")
+
+        cache.put("c", b"cc")
+
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("a"), b"aa")
+        self.assertEqual(cache.get("c"), b"cc")
+        counters = runtime_counters.snapshot_counters()
+        self.assertEqual(counters["render_cache.memory_evictions"], 1)
+        self.assertEqual(counters["render_cache.memory_hits"], 3)
+        self.assertEqual(counters["render_cache.misses"], 1)
+
+    def test_disk_tier_survives_new_cache_instance(self):
+        RenderCache(max_entries=4, disk_dir=self.disk_dir).put("key", b"png-bytes")
+
+        cache = RenderCache(max_entries=4, disk_dir=self.disk_dir)
+
+        self.assertEqual(cache.get("key"), b"png-bytes")
+        self.assertEqual(runtime_counters.snapshot_counters()["render_cache.disk_hits"], 1)
+        self.assertEqual(cache.get("key"), b"png-bytes")
+        self.assertEqual(runtime_counters.snapshot_counters()["render_cache.memory_hits"], 1)
+
+    def test_disk_tier_enforces_size_cap_oldest_first(self):
+        cache = RenderCache(max_entries=0, disk_dir=self.disk_dir, max_disk_bytes=10)
+
+        cache.put("first", b"12345")
+        cache.put("second", b"12345")
+        cache.put("third", b"12345")
+
+        self.assertEqual(
+            sorted(path.stem for path in self.disk_dir.glob("*.png")),
+            ["second", "third"],
+        )
+        self.assertIsNone(cache.get("first"))
+        self.assertEqual(runtime_counters.snapshot_counters()["render_cache.disk_evictions"], 1)
+
+    def test_disabled_cache_never_stores(self):
+        cache = RenderCache(max_entries=0, disk_dir=None)
+
+        cache.put("key", b"png")
+
+        self.assertFalse(cache.enabled)
+        self.assertIsNone(cache.get("key"))
+        self.assertEqual(runtime_counters.snapshot_counters(), {})
+
+
+if __name__ == "__main__":
+    unittest.main()
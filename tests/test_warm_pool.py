@@ -0,0 +1,110 @@
+import sys
+import tempfile
+import time
+import unittest
+from pathlib import Path
+from unittest.mock import patch
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1] / "src"))
+
+from modified_packages.warm_pool import WarmTexWorker, WarmWorkerPool
+
+
+class IdleProcess:
+    def __init__(self):
+        self.pid = 45678
+        self.returncode = None
+        self.stdin = self.stdout = self.stderr = None
+
+    def poll(self):
+        return self.returncode
+
+    def wait(self, timeout=None):
+        return self.returncode
+
+    def kill(self):
+        self.returncode = -9
+
+
+class WarmWorkerPoolTestCase(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.temp_dir.cleanup)
+        self.spawned: list[WarmTexWorker] = []
+        killpg_patcher = patch("modified_packages.warm_pool.os.killpg", self._fake_killpg)
+        killpg_patcher.start()
+        self.addCleanup(killpg_patcher.stop)
+
+    def _fake_killpg(self, pid, _signal):
+        for worker in self.spawned:
+            if worker.process.pid == pid:
+                worker.process.returncode = -9
+
+    def _spawn(self) -> WarmTexWorker:
+        worker_dir = Path(tempfile.mkdtemp(dir=self.temp_dir.name))
+        worker = WarmTexWorker(
+            process=IdleProcess(),
+            working_dir=worker_dir,
+            started_at=time.monotonic(),
+        )
+        self.spawned.append(worker)
+        return worker
+
+    def test_first_acquire_is_cold_and_spawns_replacement(self):
+        pool = WarmWorkerPool(size=2)
+
+        self.assertIsNone(pool.acquire("inline", self._spawn))
+        self.assertEqual(len(self.spawned), 2)
+
+        worker = pool.acquire("inline", self._spawn)
+
+        self.assertIs(worker, self.spawned[0])
+        self.assertEqual(len(self.spawned), 3)
+
+    def test_prime_spawns_without_handing_out_workers(self):
+        pool = WarmWorkerPool(size=1)
+
+        pool.prime("inline", self._spawn)
+        pool.prime("inline", self._spawn)
+
+        self.assertEqual(len(self.spawned), 1)
+        self.assertIs(pool.acquire("inline", self._spawn), self.spawned[0])
+
+    def test_exited_and_expired_workers_are_discarded(self):
+        pool = WarmWorkerPool(size=2, max_idle_seconds=60)
+        pool.prime("inline", self._spawn)
+        exited, expired = self.spawned
+        exited.process.returncode = 1
+        expired.started_at -= 120
+
+        worker = pool.acquire("inline", self._spawn)
+
+        self.assertIsNone(worker)
+        self.assertFalse(exited.working_dir.exists())
+        self.assertFalse(expired.working_dir.exists())
+        self.assertEqual(expired.process.returncode, -9)
+
+    def test_least_recent_key_is_evicted(self):
+        pool = WarmWorkerPool(size=1, max_keys=1)
+        pool.prime("first", self._spawn)
+        first_worker = self.spawned[0]
+
+        pool.prime("second", self._spawn)
+
+        self.assertEqual(first_worker.process.returncode, -9)
+        self.assertIsNone(pool.acquire("first", self._spawn))
+
+    def test_close_kills_idle_workers_and_stops_spawning(self):
+        pool = WarmWorkerPool(size=1)
+        pool.prime("inline", self._spawn)
+
+        pool.close()
+
+        self.assertEqual(self.spawned[0].process.returncode, -9)
+        self.assertFalse(self.spawned[0].working_dir.exists())
+        self.assertIsNone(pool.acquire("inline", self._spawn))
+        self.assertEqual(len(self.spawned), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()